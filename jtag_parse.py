@@ -1,424 +1,63 @@
 #!python
 
+import os
 import sys
-import argparse
-import textwrap
-from vcd_parser import parser
+import time
 from vcd_parser import watcher
 from vcd_parser import tracker
+from jtag_parser import stages
+from jtag_parser import cores
+from jtag_parser import formats
+from jtag_parser import writers
 
-from vcd import VCDWriter
+# the other modules, pyvcd included, are only imported by the modes using them:
+# the startup is most of the run time of a short decode
 
 timescales = [a+' '+b for b in ('s','ms','us','ns','ps','fs') for a in ('100','10','1')]
 tap_states = ['test_logic_reset','run_test_idle', 'select_dr_scan','capture_dr','shift_dr','exit1_dr','pause_dr','exit2_dr','update_dr',
     'select_ir_scan','capture_ir','shift_ir','exit1_ir','pause_ir','exit2_ir','update_ir']
 
-class JTAGCore(object):
-    '''Base class for JTAG core objects'''
+class JTAGOutput(stages.JTAGStage):
+    '''Last stage of the chain, feeds the core and the writer of the watcher'''
     def __init__(self, watcher):
-        assert isinstance(watcher, JTAGWatcher), "watcher parameter is not expected type"
+        stages.JTAGStage.__init__(self)
         self.watcher = watcher
 
-    def instruction(self, simtime, iribits, irobits):
-        '''Called at the update_ir sampling time.
-        iribits contains the string of bits sampled on TDI,
-        the first char contains the oldest sample,
-        the last char contains the latest sample
-        irobits contains the string of bits sampled on TDO'''
-        ir_i = int(iribits, 2)
-        ir_o = int(irobits, 2)
-        s = 'ir_i=' + iribits + '(' + hex(ir_i) + ')' + ' ir_o=' + irobits + '(' + hex(ir_o) + ')'
-        print(str(simtime) + ": instruction " + s)
-
-    def instruction_null(self, simtime):
-        print(str(simtime) + ": instruction NULL")
+    def state(self, simtime, state):
+        self.watcher.writer.change(self.watcher.statevar, simtime, state)
 
-    def data(self, simtime, dribits, drobits):
-        '''Called at the update_dr sampling time.
-        dribits contains the string of bits sampled on TDI,
-        the first char contains the oldest sample,
-        the last char contains the latest sample
-        drobits contains the string of bits sampled on TDO'''
-        print(str(simtime) + ": data " + str(len(dribits))+"bits")
-        dr_i = hex(int(dribits, 2))
-        dr_o = hex(int(drobits, 2))
-        print('   in : ' + dribits + '(' + dr_i + ')')
-        print('   out: ' + drobits + '(' + dr_o + ')')
+    def reset(self, simtime):
+        self.watcher.writer.change(self.watcher.opvar, simtime, 'reset')
 
-    def data_null(self, simtime):
-        print(str(simtime) + ": data NULL")
-
-class silentcore(JTAGCore):
     def instruction(self, simtime, iribits, irobits):
-        pass
+        self.watcher.core.instruction(simtime, iribits, irobits)
+        s = self.watcher.format.instruction(simtime, iribits, irobits)
+        self.watcher.writer.change(self.watcher.opvar, simtime, s)
 
     def instruction_null(self, simtime):
-        pass
+        self.watcher.core.instruction_null(simtime)
+        s = self.watcher.format.instruction_null(simtime)
+        self.watcher.writer.change(self.watcher.opvar, simtime, s)
 
     def data(self, simtime, dribits, drobits):
-        pass
+        self.watcher.core.data(simtime, dribits, drobits)
+        s = self.watcher.format.data(simtime, dribits, drobits)
+        self.watcher.writer.change(self.watcher.opvar, simtime, s)
 
     def data_null(self, simtime):
-        pass
-
-class e200z0(JTAGCore):
-    def __init__(self, watcher):
-        JTAGCore.__init__(self, watcher)
-        assert hasattr(self.watcher, 'writer'), 'Core was created before the writer was added to the watcher'
-
-        # add a variable for this core
-        self.corevar = self.watcher.writer.register_var('e200z0', 'core', 'string', init='unknown')
-        self.opvar = self.watcher.writer.register_var('e200z0', 'operation', 'string', init='unknown')
-        self.statvar = self.watcher.writer.register_var('e200z0', 'status', 'string', init='unknown')
-        self.warnvar = self.watcher.writer.register_var('e200z0', 'warning', 'wire', size=1, init=0)
-
-        self.gobit = False
-        self.exbit = False
-        self.ctl = 0
-        self.ir = 0
-        self.pc = 0
-        self.msr = 0
-
-    def defaultdata(self, simtime, dribits, drobits):
-        self.watcher.writer.change(self.warnvar, simtime, 1)
-        JTAGCore.data(self, simtime, dribits, drobits)
-
-    def defaultdata_null(self, simtime):
-        self.watcher.writer.change(self.warnvar, simtime, 1)
-        JTAGCore.data_null(self, simtime)
-
-    def baddata(self, simtime, dribits, drobits):
-        print ("!!! executing bad len instruction at "+str(simtime))
-        self.watcher.writer.change(self.warnvar, simtime, 1)
-
-    def baddata_null(self, simtime):
-        print ("!!! executing bad len instruction at "+str(simtime))
-        self.watcher.writer.change(self.warnvar, simtime, 1)
-
-    def JTAGIDreaddata(self, simtime, dribits, drobits):
-        l = len(drobits)
-        assert l == 32, "JTAG ID not 32 bits"
-        jtagid = int(drobits[::-1], 2)
-        s = "JTAGIDread:"
-        s += "manuf="+hex((jtagid >> 1) & 0x7FF)
-        s += "-sn="+hex((jtagid >> 12) & 0x3FF)
-        s += "-center="+hex((jtagid >> 22) & 0x3F)
-        s += "-version="+hex((jtagid >> 28) & 0xF)
-        print(s)
-        self.watcher.writer.change(self.opvar, simtime, s)
-
-    def NRSBYPASSdata(self, simtime, dribits, drobits):
-        s = 'NRSBYPASS(' + str(len(dribits)) + ')'
-        self.watcher.writer.change(self.opvar, simtime, s)
-
-    def NRSBYPASSdata_null(self, simtime):
-        s = 'NRSBYPASS(0)'
-        self.watcher.writer.change(self.opvar, simtime, s)
-
-    def DBSRreaddata(self, simtime, dribits, drobits):
-        s = 'R-DBSR(' + str(len(dribits)) + ')'
-        self.watcher.writer.change(self.opvar, simtime, s)
-
-    def DBSRreaddata_null(self, simtime):
-        print ('!!! empty reading of DBSR '+str(simtime))
-        self.watcher.writer.change(self.warnvar, simtime, 1)
-
-    def CPUSCRread(self, simtime, drobits):
-        l = len(drobits)
-        # register chain
-        regs = ['CTL', 'IR', 'PC', 'MSR', 'WBBRhi', 'WBBRlo']
-        # 32 oldest bits = drobits[0:32] -> WBBRlo
-        # 32 next   bits = drobits[32:64] -> WBBRhi etc...
-        a = [drobits[i: i + 32] for i in range(0, l, 32)]
-        # display in the order of the regs, so revert the array
-        for idx, b in enumerate(a[::-1]):
-            negoffset = idx - len(a)
-            print('  - {}(r) = '.format(regs[negoffset]) + b)
-            if negoffset == -1:
-                wbrrlo = int(b[::-1], 2)
-
-        print('Result of last instruction: ' + hex(wbrrlo))
-
-    def CPUSCRreaddata(self, simtime, dribits, drobits):
-        l = len(dribits)
-        assert (l & 0x1F) == 0
-        print ("CPUSCRread len="+str(len(dribits)))
-
-        self.CPUSCRread(simtime, drobits)
-
-        s = 'CPUSCRread(' + str(len(dribits)) + ')'
-        self.watcher.writer.change(self.corevar, simtime, s)
-        self.watcher.writer.change(self.opvar, simtime, s)
-
-    def CPUSCRwritedata(self, simtime, dribits, drobits):
-        l = len(dribits)
-        assert (l & 0x1F) == 0
-        print("CPUSCRwrite len="+str(len(dribits)))
-
-        # decrypt the data read out first
-        self.CPUSCRread(simtime, drobits)
-
-        # register chain
-        regs = ['CTL', 'IR', 'PC', 'MSR', 'WBBRhi', 'WBBRlo']
-        # 32 earliest bits = dribits[l-32:l] -> CTL
-        # 32 previous bits = dribits[l-64:l-32] -> IR etc...
-        a = [dribits[i: i + 32] for i in range(0, l, 32)[::-1]]
-        for idx, b in enumerate(a):
-            print('  - {}(w) = '.format(regs[idx]) + b)
-            if idx == 0:
-                self.ctl = int(b[::-1], 2)
-            elif idx == 1:
-                self.ir = int(b[::-1], 2)
-            elif idx == 2:
-                self.pc = int(b[::-1], 2)
-            elif idx == 3:
-                self.msr = int(b[::-1], 2)
-            elif idx == 4:
-                self.wbbrhi = int(b[::-1], 2)
-            elif idx == 5:
-                self.wbbrlo = int(b[::-1], 2)
-
-        if self.gobit:
-            ffra = (self.ctl >> 10) & 1
-            pcinv = (self.ctl >> 11) & 1
-            pcofst = (self.ctl >> 12) & 0xF
-
-            def twos_comp(val, bits):
-                """compute the 2's complement of int value val"""
-                if (val & (1 << (bits - 1))) != 0: # if sign bit is set e.g., 8bit: 128-255
-                    val = val - (1 << bits)        # compute negative value
-                return val
-
-            def se_lbz():
-                pass
-
-            def sd4_form(ir, func):
-                pass
-
-            def se_bc(bo16, bi16, bd8):
-                return 'se_bc ' + str(bo16) + ',' + str(bi16) + ',' + '+' + str(twos_comp(bd8 << 2, 9))
-
-            def bd8_bo16_form(ir, func):
-                bo16 = (ir >> 26) & 1
-                bi16 = (ir >> 24) & 3
-                bd8  = (ir >> 16) & 0xFF
-                return func(bo16, bi16, bd8)
-
-            def e_ori(rs, ra, rc, sci8):
-                s = 'ori'
-                if rc:
-                    s += '.'
-                s += ' ' + ', '.join((ra, rs, str(sci8)))
-                return s
-
-            def sci8_rc_form(ir, func):
-                rs = (ir >> 21) & 0x1F
-                ra = (ir >> 16) & 0x1F
-                rc  = (ir >> 11) & 1
-                f = (ir >> 10) & 1
-                scl = (ir >> 8) & 3
-                ui8 = (ir >> 0) & 0xFF
-                sci8 = 0
-                if f == 1:
-                    sci8 = 2**64 - 1
-                    sci8 &= ~(0xFF << (scl * 8))
-                sci8 |= ui8 << (scl * 8)
-                ra = 'r' + str(ra)
-                if ffra:
-                    rs = 'wbbrlo({:08x})'.format(self.wbbrlo)
-                else:
-                    rs = 'r' + str(rs)
-                return func(rs, ra, rc, sci8)
-
-            def e_stb(rs, ra, d):
-                return 'e_stb ' + rs + ', ' + str(d) + '(' + ra + ')'
-
-            def e_lwz(rs, ra, d):
-                return 'e_lwz ' + rs + ', ' + str(d) + '(' + ra + ')'
-
-            def d_form(ir, func):
-                rs = (ir >> 21) & 0x1F
-                ra = (ir >> 16) & 0x1F
-                d = (ir >> 0) & 0xFFFF
-                d = twos_comp(d, 16)
-                rs = 'r' + str(rs)
-                if ffra:
-                    ra = 'wbbrlo({:08x})'.format(self.wbbrlo)
-                else:
-                    ra = 'r' + str(ra)
-                return func(rs, ra, d)
-
-            def mtcrf(rs, fxm):
-                assert (fxm & 0x200) == 0, 'The mtcrf 11th bit is not 0 : ' + hex(fxm)
-                fxm = fxm >> 1
-                return 'mtcrf ' + hex(fxm & 0x1FF) + ', ' + rs
-
-            def xfx_form(ir, func):
-                rt = 'r' + str((ir >> 21) & 0x1F)
-                spr = (ir >> 11) & 0x3FF
-                return func(rt, spr)
-
-            xF0000000 = {0x80000000: (sd4_form, se_lbz)}
-            xF8000000 = {0xE0000000: (bd8_bo16_form, se_bc)}
-            xFC000000 = {0x34000000: (d_form, e_stb), 0x50000000: (d_form, e_lwz)}
-            xFC00F000 = {0x1800D000: (sci8_rc_form, e_ori)}
-            xFC0007FE = {0x7C000120: (xfx_form, mtcrf)}
-
-
-            filters = [(0xF0000000, xF0000000),
-                       (0xF8000000, xF8000000),
-                       (0xFC000000, xFC000000),
-                       (0xFC00F000, xFC00F000),
-                       (0xFC0007FE, xFC0007FE),
-                       ]
-
-            s = ''
-            for m, f in filters:
-                try:
-                    (form, func) = f[self.ir & m]
-                    s = form(self.ir, func)
-                    break
-                except KeyError:
-                    pass
-
-            if s != '':
-                print('Executing ' + hex(self.ir) + ' : ' + s)
-            else:
-                print('!!!Unknown instruction: ' + hex(self.ir))
-                self.watcher.writer.change(self.warnvar, simtime, 1)
-
-        s = 'CPUSCRwrite(' + str(len(dribits)) + ')'
-        self.watcher.writer.change(self.corevar, simtime, s)
-        self.watcher.writer.change(self.opvar, simtime, s)
-
-    def instruction(self, simtime, iribits, irobits):
-        self.data = self.defaultdata
-        self.data_null = self.defaultdata_null
-
-        ir_i = int(iribits, 2)
-        ir_o = int(irobits, 2)
-
-        if len(iribits) != 10:
-            s = 'BADLEN-iri=' + iribits + '-iro=' + irobits
-            print(str(simtime) + ': BADLEN instruction ' + str(len(iribits)) + 'bits iri=' + iribits + ' iro=' + irobits)
-            self.watcher.writer.change(self.corevar, simtime, s)
-
-            self.watcher.writer.change(self.warnvar, simtime, 1)
-            return
-
-        self.watcher.writer.change(self.warnvar, simtime, 0)
-
-        # check the format is correct
-        assert irobits[0:2] == '10', 'OnCE status register not compliant: ' + irobits
-
-        rw = iribits[9]
-        go = iribits[8]
-        ex = iribits[7]
-        rs = int(iribits[7::-1], 2)
-
-        s = 'OCMD='
-        # rw is ignored in NRSBYPASS
-        if rs not in (0x11, ):
-            if rw == '1':
-                s += 'R-'
-            else:
-                s += 'W-'
-        if go == '1' and rs in (0x10, 0x11):
-            s += 'GO-'
-            self.gobit = True
-            # EX is executed only if GO is valid
-            if ex == '1':
-                self.exbit = True
-                s += 'EX-'
-            else:
-                self.exbit = False
-        else:
-            self.gobit = False
-            self.exbit = False
-        if rs == 2:
-            s += 'JTAGID'
-            assert rw == '1', "Forbidden write access to JTAG ID register at "+ str(simtime)
-            self.data = self.JTAGIDreaddata
-        elif rs == 0x10:
-            s += 'CPUSCR'
-            if rw == '1':
-                self.data = self.CPUSCRreaddata
-            else:
-                self.data = self.CPUSCRwritedata
-        elif rs == 0x11:
-            s += 'NRSBYPASS'
-            self.data = self.NRSBYPASSdata
-            self.data_null = self.NRSBYPASSdata_null
-        elif rs == 0x12:
-            s += 'OCR'
-        elif rs == 0x20:
-            s += 'IAC1'
-        elif rs == 0x21:
-            s += 'IAC2'
-        elif rs == 0x22:
-            s += 'IAC3'
-        elif rs == 0x23:
-            s += 'IAC4'
-        elif rs == 0x24:
-            s += 'DAC1'
-        elif rs == 0x25:
-            s += 'DAC2'
-        elif rs == 0x2C:
-            s += 'DBCNT'
-        elif rs == 0x30:
-            s += 'DBSR'
-            assert rw == '1', "Forbidden write access to DBSR register at "+ str(simtime)
-            self.data = self.DBSRreaddata
-            self.data_null = self.DBSRreaddata_null
-        elif rs == 0x31:
-            s += 'DBCR0'
-        elif rs == 0x32:
-            s += 'DBCR1'
-        elif rs == 0x33:
-            s += 'DBCR2'
-        elif rs == 0x6F:
-            s += 'NEXUSCR'
-        elif rs in range(0x70, 0x7C):
-            s += 'GPREG{}'.format(rs - 0x70)
-        elif rs == 0x7C:
-            s += 'NEXUSACC'
-        elif rs == 0x7E:
-            s += 'ENABLE_ONCE'
-        elif rs == 0x7F:
-            s += 'BYPASS'
-        else:
-            s += '!!!!{}'.format(rs)
+        self.watcher.core.data_null(simtime)
+        s = self.watcher.format.data_null(simtime)
+        self.watcher.writer.change(self.watcher.opvar, simtime, s)
 
-        if ir_o & (1 << 0):
-            osr = 'MCLKa'
-        else:
-            osr = 'MCLKi'
-        if ir_o & (1 << 1):
-            osr += '-ERR'
-        if ir_o & (1 << 2):
-            osr += '-CHKosrOP'
-        if ir_o & (1 << 3):
-            osr += '-RESET'
-        if ir_o & (1 << 4):
-            osr += '-HALT'
-        if ir_o & (1 << 5):
-            osr += '-STOP'
-        if ir_o & (1 << 6):
-            osr += '-DEBUG'
-        if ir_o & (1 << 7):
-            osr += '-WAIT'
-
-        s += '-OSR=' + osr
-        print(str(simtime) + ": instruction " + s)
-        self.watcher.writer.change(self.corevar, simtime, s)
-
-        # this was just a status read until execution
-        self.watcher.writer.change(self.statvar, simtime, osr)
-
-available_cores = {'simple':JTAGCore, 'silent':silentcore, 'e200z0':e200z0}
+    def repeat(self, run):
+        print(str(run.start) + ": previous transaction repeated " + str(run.count) + " times until " + str(run.end))
+        s = 'x' + str(run.count) + '-until-' + str(run.end)
+        self.watcher.writer.change(self.watcher.repeatvar, run.start, s)
+        self.watcher.writer.change(self.watcher.repeatvar, run.end, 'none')
 
 class JTAGWatcher(watcher.VcdWatcher):
     def __init__(self, hierarchy, tck, tms, tdi, tdo, initstate):
+        watcher.VcdWatcher.__init__(self)
         self.set_hierarchy(hierarchy)
 
         self.signame_tck = tck
@@ -433,20 +72,155 @@ class JTAGWatcher(watcher.VcdWatcher):
         self.add_watching(self.signame_tdo)
 
         # set the default core
-        self.core = JTAGCore(self)
+        self.core = cores.JTAGCore(self)
+
+        # text of the scans in the jtag variable
+        self.format = formats.BitsFormat()
+
+        # the tracker sends the TAP events to the first stage of the chain
+        self.stage = JTAGOutput(self)
+        # receives the counters and warnings reported by the core
+        self.collector = None
+        # receives the measures of the core, and the rising edges of TCK seen
+        self.analytics = None
+        self.cycles = 0
 
     def set_writer(self, writer, timescale, statevar, opvar):
-        assert isinstance(writer, VCDWriter), "The writer parameter is not a VCDWriter element"
+        assert hasattr(writer, 'register_var') and hasattr(writer, 'change'), "The writer parameter is not a VCDWriter element"
 
-        self.writer = writer
+        # the times are converted from the timescale of the input to the one of the writer
+        self.writer = writers.TimescaleWriter(writer, timescale)
         self.statevar = statevar
         self.opvar = opvar
         self.timescale = timescale
 
+    def set_format(self, format):
+        assert isinstance(format, formats.BitsFormat), "The format parameter is not a scan format"
+        self.format = format
+
     def set_core(self, core):
-        assert isinstance(core, JTAGCore), "The core parameter is not a JTAG core element"
+        assert isinstance(core, cores.JTAGCore), "The core parameter is not a JTAG core element"
         self.core = core
 
+    def set_chain(self, devices):
+        # split the scans between daisy-chained devices, decoded by their own cores,
+        # the core of the watcher is then not used
+        from jtag_parser import chain
+        self.stage = chain.JTAGChain(self.stage, self, devices, self.curstate)
+        self.core = cores.silentcore(self)
+
+    def set_parallel(self, jobs):
+        # decode the scans in a pool of processes, the core is then replaced
+        # by the one replaying what the pool decoded
+        from jtag_parser import parallel
+        self.stage = parallel.JTAGParallel(self.stage, self.core, jobs)
+        self.core = self.stage.replay
+
+    def set_pipeline(self):
+        # run the stages set so far (the core and the writer) in a separate thread
+        from jtag_parser import pipeline
+        self.stage = pipeline.JTAGStageThread(self.stage)
+
+    def set_collapse(self, repeatvar):
+        # collapse the repeated transactions, runs are reported in repeatvar
+        from jtag_parser import collapse
+        self.repeatvar = repeatvar
+        self.stage = collapse.JTAGCollapser(self.stage)
+
+    def set_summary(self):
+        # collect statistics on the TAP events and on what the core reports
+        from jtag_parser import summary
+        self.collector = summary.JTAGSummary(self.stage, self.curstate)
+        self.stage = self.collector
+
+    def set_analytics(self):
+        # measure the utilization and the latencies of the link
+        from jtag_parser import analytics
+        self.analytics = analytics.JTAGAnalytics(self.stage, self, self.curstate)
+        self.stage = self.analytics
+
+    def set_lod(self, path, shift):
+        # save a level of detail index of the transactions, the index takes the
+        # place of the collector to see the warnings and passes them on
+        from jtag_parser import lod
+        self.stage = lod.LodRecorder(self.stage, self.core, self, path, shift, self.collector)
+        self.collector = self.stage
+        return self.stage
+
+    def set_query(self, q):
+        # only send to the core the transactions selected by the JTAGQuery
+        self.collector = q
+        self.stage = q
+
+    def set_preview(self, stop, max_transactions, stride, window):
+        # decode only part of the capture, see preview.JTAGPreview
+        from jtag_parser import preview
+        self.stage = preview.JTAGPreview(self.stage, stop, max_transactions, stride, window)
+
+    def set_diff(self, stream):
+        # send the transactions to the diff stream in place of the core and the writer
+        self.stage = stream
+
+    def set_scan_recorder(self, path, key):
+        # save the events of the tracker in a scan cache, see scancache.ScanRecorder
+        from jtag_parser import scancache
+        self.stage = scancache.ScanRecorder(self.stage, path, key, self)
+        return self.stage
+
+    def flush(self):
+        # invoked when the parsing of the file is over
+        self.stage.flush()
+
+    def feed_binary(self, capture):
+        # decode a binary capture or a sample dump from the values sampled at the rising edges of TCK,
+        # without going through the parser time updates
+        capture.define(self.parser)
+        names = [self.default_hierarchy + '.' + s for s in (self.signame_tck, self.signame_tms, self.signame_tdi, self.signame_tdo)]
+        indexes = [capture.signals.index(name) for name in names]
+        ids = [self.get_id(s) for s in (self.signame_tms, self.signame_tdi, self.signame_tdo)]
+        activity = {self.id_tck: '1'}
+        for simtime, values in capture.edges(indexes[0], indexes[1:]):
+            self.parser.now = simtime
+            self.notify(activity, dict(zip(ids, values)))
+            for hook in self.parser.time_hooks:
+                hook(self.parser)
+            if self.parser.stopped:
+                break
+
+    def replay_scans(self, cache):
+        # decode the events saved in a scan cache, without the parser and the tracker
+        self.parser.timescale = cache.timescale
+        self.parser.time_unit = cache.time_unit
+        self.writer.set_input(cache.time_unit)
+        cache.replay(self)
+
+    def stages(self):
+        stage = self.stage
+        while stage is not None:
+            yield stage
+            stage = stage.nextstage
+
+    def checkpoint(self):
+        # state of the TAP, including the bits shifted so far, of the stages and of the core
+        state = dict((a, getattr(self, a)) for a in ('curstate', 'cycles', 'ir_i', 'ir_o', 'dr_i', 'dr_o') if hasattr(self, a))
+        # the bits are shifted in lists
+        for a in ('ir_i', 'ir_o', 'dr_i', 'dr_o'):
+            if a in state:
+                state[a] = ''.join(state[a])
+        state['stages'] = [stage.checkpoint() for stage in self.stages()]
+        state['core'] = self.core.checkpoint()
+        return state
+
+    def restore(self, state):
+        state = dict(state)
+        for stage, s in zip(self.stages(), state.pop('stages')):
+            stage.restore(s)
+        self.core.restore(state.pop('core'))
+        for a, v in state.items():
+            if a in ('ir_i', 'ir_o', 'dr_i', 'dr_o'):
+                v = list(v)
+            setattr(self, a, v)
+
     def update_ids(self):
         # invoked when the parsing of the definitions is over
 
@@ -456,8 +230,8 @@ class JTAGWatcher(watcher.VcdWatcher):
         # retrieve the id of the TCK signal to speed up
         self.id_tck = self.get_id(self.signame_tck)
 
-        # check that the timescale is identical
-        assert(self.parser.timescale == self.timescale)
+        # the timescale of the input is known
+        self.writer.set_input(self.parser.time_unit)
 
 
     def update(self):
@@ -468,6 +242,7 @@ class JTAGWatcher(watcher.VcdWatcher):
         if self.id_tck in self.activity:
             tck = self.activity[self.id_tck]
             if tck == '1':
+                self.cycles += 1
                 self.manage_trackers()
 
     def start_tracker(self):
@@ -480,6 +255,8 @@ class JTAGWatcher(watcher.VcdWatcher):
             return True
 
 class JTAGTracker(tracker.VcdTracker):
+    # the state is kept by the watcher
+    __slots__ = ()
 
     def start(self):
         # called at the creation of the tracker
@@ -490,7 +267,7 @@ class JTAGTracker(tracker.VcdTracker):
         # retrieve the current state in the watcher and execute state action
         getattr(self, self.watcher.curstate)()
         if prevstate != self.watcher.curstate:
-            self.watcher.writer.change(self.watcher.statevar, self.parser.now, self.watcher.curstate)
+            self.watcher.stage.state(self.parser.now, self.watcher.curstate)
 
     def test_logic_reset(self):
         tms = int(self.values[self.watcher.id_tms])
@@ -511,8 +288,9 @@ class JTAGTracker(tracker.VcdTracker):
 
     def capture_dr(self):
         tms = int(self.values[self.watcher.id_tms])
-        self.watcher.dr_i = ''
-        self.watcher.dr_o = ''
+        # the bits are appended to lists, joined once at the update
+        self.watcher.dr_i = []
+        self.watcher.dr_o = []
         if tms == 1:
             self.watcher.curstate = 'exit1_dr'
         else:
@@ -520,8 +298,8 @@ class JTAGTracker(tracker.VcdTracker):
 
     def shift_dr(self):
         tms = int(self.values[self.watcher.id_tms])
-        self.watcher.dr_i += self.values[self.watcher.id_tdi]
-        self.watcher.dr_o += self.values[self.watcher.id_tdo]
+        self.watcher.dr_i.append(self.values[self.watcher.id_tdi])
+        self.watcher.dr_o.append(self.values[self.watcher.id_tdo])
         if tms == 1:
             self.watcher.curstate = 'exit1_dr'
 
@@ -545,14 +323,11 @@ class JTAGTracker(tracker.VcdTracker):
             self.watcher.curstate = 'shift_dr'
 
     def update_dr(self):
-        if self.watcher.dr_i != '':
-            self.watcher.core.data(self.parser.now, self.watcher.dr_i, self.watcher.dr_o)
-            s = 'in=' + self.watcher.dr_i + '-out=' + self.watcher.dr_o
+        if self.watcher.dr_i:
+            self.watcher.stage.data(self.parser.now, ''.join(self.watcher.dr_i), ''.join(self.watcher.dr_o))
         else:
             # this can happen in the path: dr-scan -> capture-dr -> exit1-dr -> update-dr
-            self.watcher.core.data_null(self.parser.now)
-            s = 'in=NULL-out=NULL'
-        self.watcher.writer.change(self.watcher.opvar, self.parser.now, s)
+            self.watcher.stage.data_null(self.parser.now)
 
         tms = int(self.values[self.watcher.id_tms])
         if tms == 1:
@@ -563,15 +338,16 @@ class JTAGTracker(tracker.VcdTracker):
     def select_ir_scan(self):
         tms = int(self.values[self.watcher.id_tms])
         if tms == 1:
-            self.watcher.writer.change(self.watcher.opvar, self.parser.now, 'reset')
+            self.watcher.stage.reset(self.parser.now)
             self.watcher.curstate = 'test_logic_reset'
         else:
             self.watcher.curstate = 'capture_ir'
 
     def capture_ir(self):
         tms = int(self.values[self.watcher.id_tms])
-        self.watcher.ir_i = ''
-        self.watcher.ir_o = ''
+        # the bits are appended to lists, joined once at the update
+        self.watcher.ir_i = []
+        self.watcher.ir_o = []
         if tms == 1:
             self.watcher.curstate = 'exit1_ir'
         else:
@@ -579,8 +355,8 @@ class JTAGTracker(tracker.VcdTracker):
 
     def shift_ir(self):
         tms = int(self.values[self.watcher.id_tms])
-        self.watcher.ir_i += self.values[self.watcher.id_tdi]
-        self.watcher.ir_o += self.values[self.watcher.id_tdo]
+        self.watcher.ir_i.append(self.values[self.watcher.id_tdi])
+        self.watcher.ir_o.append(self.values[self.watcher.id_tdo])
         if tms == 1:
             self.watcher.curstate = 'exit1_ir'
 
@@ -604,14 +380,11 @@ class JTAGTracker(tracker.VcdTracker):
             self.watcher.curstate = 'shift_ir'
 
     def update_ir(self):
-        if self.watcher.ir_i != '':
-            self.watcher.core.instruction(self.parser.now, self.watcher.ir_i, self.watcher.ir_o)
-            s = 'ir_i=' + self.watcher.ir_i + '-ir_o=' + self.watcher.ir_o
+        if self.watcher.ir_i:
+            self.watcher.stage.instruction(self.parser.now, ''.join(self.watcher.ir_i), ''.join(self.watcher.ir_o))
         else:
             # this can happen in the path: ir-scan -> capture-ir -> exit1-ir -> update-ir
-            self.watcher.core.instruction_null(self.parser.now)
-            s = 'ir=NULL'
-        self.watcher.writer.change(self.watcher.opvar, self.parser.now, s)
+            self.watcher.stage.instruction_null(self.parser.now)
 
         tms = int(self.values[self.watcher.id_tms])
         if tms == 1:
@@ -620,51 +393,506 @@ class JTAGTracker(tracker.VcdTracker):
             self.watcher.curstate = 'run_test_idle'
 
 
-# use a customer formatter to do raw text and add default values
-class CustomerFormatter(argparse.ArgumentDefaultsHelpFormatter, argparse.RawTextHelpFormatter):
-    pass
-
-argparser = argparse.ArgumentParser(formatter_class=CustomerFormatter,
-                                 description=textwrap.dedent('''
-    Parse a JTAG capture file in VCD format
-    '''))
-
-argparser.add_argument('infile', action='store', type=argparse.FileType('r'),
-    help='path to the VCD file to read from')
-argparser.add_argument('outfile', action='store', type=argparse.FileType('w'),
-    help='path to the VCD file to write to')
-for s in ('tck','tms','tdi','tdo'):
-    argparser.add_argument('--'+s, default=s,
-        help='name of the '+s.upper()+' signal')
-argparser.add_argument('-s', '--initstate', choices=tap_states, default=tap_states[0],
-    help='initial tap controller state')
-argparser.add_argument('-t', '--timescale', choices=timescales, default='1 ns',
-    help='timescale to match input file')
-argparser.add_argument('--inscope', default='capture',
-    help='scope of the jtag signals in the input file')
-argparser.add_argument('--outscope', default='parsed',
-    help='scope of the parsed information in the output file')
-argparser.add_argument('--core', choices=available_cores.keys(), default='simple',
-    help='scope of the parsed information in the output file')
-
-my_args = argparser.parse_args()
-
-vcd = parser.VcdParser()
-
-with VCDWriter(my_args.outfile, timescale=my_args.timescale, date='today') as writer:
-    tapstate_v = writer.register_var(my_args.outscope, 'tap_state', 'string', init=my_args.initstate)
-    jtag_v = writer.register_var(my_args.outscope, 'jtag', 'string', init=my_args.initstate)
-
-    w = JTAGWatcher(my_args.inscope, my_args.tck, my_args.tms, my_args.tdi, my_args.tdo, my_args.initstate)
-    w.set_writer(writer, my_args.timescale, tapstate_v, jtag_v)
-    w.set_core(available_cores[my_args.core](w))
-    w.set_tracker(JTAGTracker)
-    vcd.register_watcher(w)
-
-    vcd.parse(my_args.infile)
-
-my_args.outfile.close()
-my_args.infile.close()
-
+def make_argparser():
+    import argparse
+    import textwrap
 
+    # use a customer formatter to do raw text and add default values
+    class CustomerFormatter(argparse.ArgumentDefaultsHelpFormatter, argparse.RawTextHelpFormatter):
+        pass
 
+    argparser = argparse.ArgumentParser(formatter_class=CustomerFormatter,
+                                         description=textwrap.dedent('''
+        Parse a JTAG capture file in VCD format
+        '''),
+                                         epilog=textwrap.dedent('''
+        jtag_parse.py --daemon [--workers N] starts a daemon running the decodes of
+        the next jtag_parse.py command lines, without their startup cost
+        '''))
+
+    argparser.add_argument('infile', action='store', type=argparse.FileType('r'),
+        help='path to the VCD file to read from, can be compressed with gzip (.gz) or bzip2 (.bz2),\nor a binary capture written by --convert, or a sample dump with --sample-rate')
+    argparser.add_argument('outfile', action='store', nargs='?',
+        help='path to the VCD file to write to, not used with --summary and --query')
+    for s in ('tck','tms','tdi','tdo'):
+        argparser.add_argument('--'+s, default=s,
+            help='name of the '+s.upper()+' signal')
+    argparser.add_argument('--drop-redundant', action='store_true',
+        help='drop the changes of the JTAG signals to the value they already have (VCD input only)')
+    argparser.add_argument('--min-pulse', type=int, default=0, metavar='WIDTH',
+        help='ignore the TCK pulses shorter than WIDTH time units, as glitches (VCD input only)')
+    argparser.add_argument('-s', '--initstate', choices=tap_states, default=tap_states[0],
+        help='initial tap controller state')
+    argparser.add_argument('-t', '--timescale', choices=timescales,
+        help='timescale of the output file, the times of the input are converted to it\n'
+             '(default: the timescale of the input)')
+    argparser.add_argument('--inscope', default='capture',
+        help='scope of the jtag signals in the input file')
+    argparser.add_argument('--outscope', default='parsed',
+        help='scope of the parsed information in the output file')
+    argparser.add_argument('--core', default='simple',
+        help='core decoding the scans: ' + ', '.join(sorted(cores.builtin)) + '\nor one registered in the ' + cores.entry_point_group + ' entry point group')
+    argparser.add_argument('--chain', metavar='NAME:IRLEN[:CORE],...',
+        help='daisy-chained devices, from the one driving TDO to the one receiving TDI: the scans are split\n'
+             'between them, each device is decoded by its own core (--core by default) in the NAME scopes')
+    argparser.add_argument('--format', choices=('bits', 'hex', 'truncated', 'vector'), default='bits',
+        help='format of the scanned bits in the jtag variable:\n'
+             'bits: every bit shifted in and out, the first one first\n'
+             'hex: in hexadecimal, the first bit shifted being the least significant, and the length\n'
+             'truncated: the first --width bits only, and the length of the longer scans\n'
+             'vector: in the tdi and tdo vector variables of --width bits and the length variable')
+    argparser.add_argument('--width', type=int, default=64,
+        help='number of bits kept by the truncated and vector formats')
+    mode = argparser.add_mutually_exclusive_group()
+    mode.add_argument('--collapse', action='store_true',
+        help='report runs of identical transactions once with their repeat count')
+    mode.add_argument('--summary', action='store_true',
+        help='do not write any VCD, only print statistics on the capture')
+    mode.add_argument('--merge', action='store_true',
+        help='write in outfile a copy of the input with the decoded variables added, instead of the decoded variables only')
+    mode.add_argument('--convert', action='store_true',
+        help='do not decode, write in outfile a binary capture of the JTAG signals, faster to decode again')
+    mode.add_argument('--query', action='store_true',
+        help='do not write any VCD, only print the transactions matching the query options')
+    mode.add_argument('--diff', metavar='OTHER', type=argparse.FileType('r'),
+        help='do not write any VCD, compare the transactions of infile and of the capture OTHER,\n'
+             'times ignored, the exit status is 1 when they differ')
+
+    argparser.add_argument('--pipeline', action='store_true',
+        help='read the file, decode the TAP and annotate/write the transactions in separate threads')
+
+    argparser.add_argument('--jobs', type=int, default=1,
+        help='decode the scans in this number of processes, for the cores supporting it')
+
+    samplegroup = argparser.add_argument_group('sample dump input', 'decode the samples of a logic analyzer, in CSV (.csv)\n'
+        'with the channel names on the first line, or packed with one bit per channel')
+    samplegroup.add_argument('--sample-rate', type=float, metavar='HZ',
+        help='the input is a sample dump taken at HZ samples per second')
+    samplegroup.add_argument('--channels', type=lambda s: s.split(','), metavar='NAME,...',
+        help='names of the channels of a packed dump, the first one in bit 0 (default: the tck, tms, tdi and tdo names)')
+    argparser.add_argument('--json', action='store_true',
+        help='print the --summary statistics and the --analytics measures as JSON, in one document\n'
+             'when both are asked for')
+    argparser.add_argument('--analytics', action='store_true',
+        help='print at the end the utilization of the link (payload against TCK cycles, cycles and time\n'
+             'per TAP state) and the latencies measured by the core')
+    argparser.add_argument('--timing', action='store_true',
+        help='report on stderr the time spent parsing the header of the input and its value changes')
+    argparser.add_argument('--scan-cache', metavar='PATH',
+        help='replay the TAP events saved in the scan cache PATH if it is for the same capture and signals,\n'
+             'otherwise save them there, so that decoding again with another core skips the parsing')
+    argparser.add_argument('--lod', metavar='PATH',
+        help='save a level of detail index of the transactions in this file, for viewers and time range\n'
+             'queries, see python -m jtag_parser.lod')
+    argparser.add_argument('--lod-bucket', type=int, default=10, metavar='N',
+        help='the finest buckets of the level of detail index are 2**N times of the input wide (default 10)')
+    argparser.add_argument('--memory', metavar='PATH',
+        help='save the memory accesses decoded by the core in this file, for the cores supporting it (e200z0),\n'
+             'see python -m jtag_parser.memory')
+
+    argparser.add_argument('--checkpoint', metavar='PATH',
+        help='save the state of the decode in this file at regular intervals')
+    argparser.add_argument('--checkpoint-interval', type=float, default=60,
+        help='seconds between two checkpoints')
+    argparser.add_argument('--resume', action='store_true',
+        help='continue the decode from the last checkpoint, the log printed on stdout restarts from it')
+
+    previewgroup = argparser.add_argument_group('preview options')
+    previewgroup.add_argument('--max-transactions', type=int, metavar='N',
+        help='stop after decoding N transactions (DR scans)')
+    previewgroup.add_argument('--max-time', type=int, metavar='T',
+        help='stop after the time T')
+    previewgroup.add_argument('--sample', type=int, default=1, metavar='N',
+        help='only decode one window of transactions out of N, the TAP is followed in the others')
+    previewgroup.add_argument('--sample-window', type=int, default=1000, metavar='W',
+        help='transactions in a sampling window, a window starts at an IR scan')
+
+    diffgroup = argparser.add_argument_group('diff options')
+    diffgroup.add_argument('--window', type=int, default=4096,
+        help='transactions read ahead on both sides to find where they match again after a difference')
+    diffgroup.add_argument('--resync', type=int, default=8,
+        help='consecutive identical transactions for the captures to match again')
+
+    querygroup = argparser.add_argument_group('query options')
+    querygroup.add_argument('--start', type=int,
+        help='ignore the transactions before this time')
+    querygroup.add_argument('--end', type=int,
+        help='ignore the transactions after this time')
+    querygroup.add_argument('--ir',
+        help='IR bits as shifted on TDI')
+    querygroup.add_argument('--register',
+        help='register selected by the IR, as named by the core')
+    querygroup.add_argument('--min-length', type=int,
+        help='minimum DR length')
+    querygroup.add_argument('--max-length', type=int,
+        help='maximum DR length')
+    querygroup.add_argument('--dr-in',
+        help='regular expression to search in the DR bits shifted on TDI')
+    querygroup.add_argument('--dr-out',
+        help='regular expression to search in the DR bits shifted on TDO')
+    querygroup.add_argument('--match', action='append', default=[], metavar='COUNTER=KEY',
+        help='counter reported by the core while decoding, e.g. instruction=e_stb or operation=CPUSCRwrite')
+    querygroup.add_argument('--index',
+        help='time index of the capture, built if it does not exist, used to seek to --start otherwise')
+    return argparser
+
+
+def main(argv=None, progress=None):
+    '''Decode the capture as told by the command line argv (sys.argv by default),
+    progress is an optional time hook of the parser'''
+    import json
+    from vcd_parser import parser
+    from vcd_parser import reader
+    from vcd_parser import binary
+    from vcd_parser import samples
+
+    argparser = make_argparser()
+    my_args = argparser.parse_args(argv)
+    try:
+        core = cores.load(my_args.core)
+    except KeyError:
+        argparser.error('unknown core: ' + my_args.core)
+    if not my_args.summary and not my_args.query and not my_args.diff and my_args.outfile is None:
+        argparser.error('outfile is required unless --summary, --query or --diff is used')
+    if my_args.sample_rate is not None and my_args.sample_rate <= 0:
+        argparser.error('--sample-rate must be positive')
+    if my_args.channels is None:
+        my_args.channels = [my_args.tck, my_args.tms, my_args.tdi, my_args.tdo]
+
+    def open_input(infile):
+        '''Reader of a binary capture or a sample dump, None for a VCD'''
+        if my_args.sample_rate:
+            return samples.open_samples(infile, my_args.sample_rate, my_args.inscope, my_args.channels)
+        if binary.BinaryCapture.is_binary(infile):
+            return binary.BinaryCapture(infile)
+        return None
+
+    capture = open_input(my_args.infile)
+    if capture is not None:
+        if my_args.checkpoint or my_args.index or my_args.merge or my_args.convert:
+            argparser.error('--checkpoint, --index, --merge and --convert need a VCD input')
+        if my_args.drop_redundant or my_args.min_pulse:
+            argparser.error('--drop-redundant and --min-pulse need a VCD input')
+    if my_args.pipeline and my_args.query:
+        argparser.error('--pipeline cannot be used with --query')
+    if my_args.checkpoint and (my_args.pipeline or my_args.query or my_args.merge):
+        argparser.error('--checkpoint cannot be used with --pipeline, --query or --merge')
+    if my_args.merge and (my_args.pipeline or my_args.jobs > 1):
+        argparser.error('--merge cannot be used with --pipeline or --jobs')
+    if my_args.jobs > 1 and not core.parallel:
+        argparser.error('the ' + my_args.core + ' core does not support --jobs')
+    if my_args.jobs > 1 and (my_args.query or my_args.checkpoint):
+        argparser.error('--jobs cannot be used with --query or --checkpoint')
+    if my_args.memory and not hasattr(core, 'memory'):
+        argparser.error('the ' + my_args.core + ' core does not support --memory')
+    if my_args.memory and my_args.checkpoint:
+        argparser.error('--memory cannot be used with --checkpoint')
+    if my_args.scan_cache and (my_args.merge or my_args.convert or my_args.checkpoint or my_args.index):
+        argparser.error('--scan-cache cannot be used with --merge, --convert, --checkpoint or --index')
+    if my_args.scan_cache and not os.path.isfile(my_args.infile.name):
+        # the cache is identified by the file it was made from
+        argparser.error('--scan-cache needs an input file, not a stream')
+    if my_args.lod and (my_args.query or my_args.checkpoint or my_args.diff or my_args.convert):
+        argparser.error('--lod cannot be used with --query, --checkpoint, --diff or --convert')
+    if not 0 <= my_args.lod_bucket < 64:
+        argparser.error('--lod-bucket must be from 0 to 63')
+    if my_args.diff and (my_args.pipeline or my_args.jobs > 1 or my_args.checkpoint or my_args.memory):
+        argparser.error('--diff cannot be used with --pipeline, --jobs, --checkpoint or --memory')
+    if my_args.window < my_args.resync or my_args.resync < 1:
+        argparser.error('--resync must be at least 1 and at most --window')
+    if my_args.min_pulse and (my_args.checkpoint or my_args.index or my_args.merge):
+        # the merge copies the input changes as they are parsed, a TCK pulse is
+        # only decoded once it lasted WIDTH, after the changes that followed it
+        argparser.error('--min-pulse cannot be used with --checkpoint, --index or --merge')
+    if my_args.min_pulse < 0:
+        argparser.error('--min-pulse must not be negative')
+    if my_args.max_transactions is not None and my_args.max_transactions < 1:
+        argparser.error('--max-transactions must be at least 1')
+    if my_args.sample < 1 or my_args.sample_window < 1:
+        argparser.error('--sample and --sample-window must be at least 1')
+    if my_args.width < 1:
+        argparser.error('--width must be at least 1')
+    if my_args.resume and not my_args.checkpoint:
+        argparser.error('--resume requires --checkpoint')
+    if my_args.chain:
+        from jtag_parser import chain
+        try:
+            devices = [(name, irlength, cores.load(corename or my_args.core))
+                       for (name, irlength, corename) in chain.parse_chain(my_args.chain)]
+        except ValueError as e:
+            argparser.error('--chain: ' + str(e))
+        except KeyError as e:
+            argparser.error('unknown core: ' + e.args[0])
+        if my_args.jobs > 1 or my_args.query or my_args.memory or my_args.diff:
+            argparser.error('--chain cannot be used with --jobs, --query, --memory or --diff')
+    for m in my_args.match:
+        if '=' not in m:
+            argparser.error('--match expects COUNTER=KEY: ' + m)
+    if my_args.query or my_args.checkpoint or my_args.scan_cache:
+        from jtag_parser import query
+    if my_args.checkpoint:
+        from jtag_parser import checkpoint
+    if my_args.memory:
+        from jtag_parser import memory
+
+    def reduce_events(vcd):
+        # a merged output keeps all the signals of the input, the other modes only need the JTAG ones
+        if not my_args.merge:
+            vcd.set_inscope(my_args.inscope)
+        vcd.drop_redundant = my_args.drop_redundant
+        if my_args.min_pulse:
+            vcd.min_pulse[my_args.inscope + '.' + my_args.tck] = my_args.min_pulse
+
+    vcd = parser.VcdParser()
+    reduce_events(vcd)
+
+    if my_args.convert:
+        with open(my_args.outfile, 'wb') as outfile:
+            converter = binary.BinaryConverter(outfile,
+                [my_args.inscope + '.' + s for s in (my_args.tck, my_args.tms, my_args.tdi, my_args.tdo)])
+            vcd.register_watcher(converter)
+            vcd.parse(reader.open_capture(my_args.infile))
+            converter.close()
+        return 0
+
+    if my_args.diff:
+        from jtag_parser import diff
+
+        def decode(path, stream):
+            # run in the process decoding the capture at path
+            vcd = parser.VcdParser()
+            reduce_events(vcd)
+            w = JTAGWatcher(my_args.inscope, my_args.tck, my_args.tms, my_args.tdi, my_args.tdo, my_args.initstate)
+            w.set_writer(writers.NullWriter(), my_args.timescale, None, None)
+            w.set_diff(stream)
+            w.set_tracker(JTAGTracker)
+            vcd.register_watcher(w)
+            with open(path) as infile:
+                capture = open_input(infile)
+                if capture is not None:
+                    w.feed_binary(capture)
+                else:
+                    vcd.parse(reader.open_capture(infile))
+            w.flush()
+
+        my_args.infile.close()
+        my_args.diff.close()
+        differences = diff.diff(diff.stream(decode, my_args.infile.name), diff.stream(decode, my_args.diff.name),
+                                my_args.window, my_args.resync)
+        return 1 if differences else 0
+
+    outfile = None
+    if my_args.summary or my_args.query:
+        outwriter = writers.NullWriter()
+    else:
+        # when resuming, the output written before the checkpoint is kept
+        outfile = open(my_args.outfile, 'r+' if my_args.resume else 'w')
+        if my_args.merge:
+            outwriter = writers.MergeWriter(outfile, vcd)
+        else:
+            from vcd import VCDWriter
+            # without -t, the timescale is set to the one of the input once known
+            outwriter = VCDWriter(outfile, timescale=my_args.timescale or writers.DEFAULT_TIMESCALE, date='today')
+
+    with outwriter as writer:
+        tapstate_v = writer.register_var(my_args.outscope, 'tap_state', 'string', init=my_args.initstate)
+        jtag_v = writer.register_var(my_args.outscope, 'jtag', 'string', init=my_args.initstate)
+
+        w = JTAGWatcher(my_args.inscope, my_args.tck, my_args.tms, my_args.tdi, my_args.tdo, my_args.initstate)
+        # a merged output keeps the times of the input
+        w.set_writer(writer, None if my_args.merge else my_args.timescale, tapstate_v, jtag_v)
+        def make_format(scope):
+            if my_args.format == 'hex':
+                return formats.HexFormat()
+            elif my_args.format == 'truncated':
+                return formats.TruncatedFormat(my_args.width)
+            elif my_args.format == 'vector':
+                return formats.VectorFormat(w.writer, scope, my_args.width)
+            return formats.BitsFormat()
+
+        w.set_format(make_format(my_args.outscope))
+        if not my_args.chain:
+            w.set_core(core(w))
+        else:
+            w.set_chain([chain.JTAGDevice(w, name, irlength, core_class, my_args.outscope,
+                                          make_format(my_args.outscope + '.' + name))
+                         for (name, irlength, core_class) in devices])
+        if my_args.memory:
+            memorylog = w.core.memory = memory.MemoryLog()
+        w.set_tracker(JTAGTracker)
+        if my_args.jobs > 1:
+            w.set_parallel(my_args.jobs)
+        if my_args.pipeline:
+            w.set_pipeline()
+        if my_args.collapse:
+            w.set_collapse(writer.register_var(my_args.outscope, 'repeat', 'string', init='none'))
+        if my_args.summary:
+            w.set_summary()
+        if my_args.analytics:
+            w.set_analytics()
+        if my_args.summary:
+            summarizer = w.collector
+        lodrecorder = None
+        if my_args.lod:
+            lodrecorder = w.set_lod(my_args.lod, my_args.lod_bucket)
+        if my_args.query:
+            q = query.JTAGQuery(w.stage, w.core, start=my_args.start, end=my_args.end,
+                                ir=my_args.ir, register=my_args.register,
+                                min_length=my_args.min_length, max_length=my_args.max_length,
+                                dr_in=my_args.dr_in, dr_out=my_args.dr_out,
+                                match=[tuple(m.split('=', 1)) for m in my_args.match])
+            w.set_query(q)
+        if my_args.max_transactions is not None or my_args.sample > 1:
+            w.set_preview(vcd.stop, my_args.max_transactions, my_args.sample, my_args.sample_window)
+        vcd.register_watcher(w)
+        if progress is not None:
+            vcd.register_time_hook(progress)
+        # nothing after --end can match a query
+        end = my_args.max_time
+        if my_args.query and my_args.end is not None and (end is None or my_args.end < end):
+            end = my_args.end
+        if end is not None:
+            from jtag_parser import preview
+            vcd.register_time_hook(preview.TimeLimit(end))
+
+        cache = recorder = None
+        if my_args.scan_cache:
+            from jtag_parser import scancache
+            key = query.TimeIndex.make_key(my_args.infile.name,
+                [getattr(my_args, a) for a in ('inscope', 'tck', 'tms', 'tdi', 'tdo', 'initstate', 'drop_redundant',
+                                               'min_pulse', 'sample_rate', 'channels')])
+            cache = scancache.ScanCache.load(my_args.scan_cache, key)
+            if cache is None:
+                recorder = w.set_scan_recorder(my_args.scan_cache, key)
+
+        newindex = None
+        if my_args.query and my_args.index:
+            key = query.TimeIndex.make_key(my_args.infile.name,
+                (my_args.inscope, my_args.tck, my_args.tms, my_args.tdi, my_args.tdo, my_args.initstate))
+            index = query.TimeIndex.load(my_args.index, key)
+            if index is None:
+                # build the index while running the query
+                newindex = query.TimeIndex(key)
+                vcd.track_offset = True
+                vcd.register_time_hook(lambda p: newindex.record(p, w, q))
+            elif my_args.start is not None:
+                entry = index.lookup(my_args.start)
+                if entry is not None:
+                    (t, offset, watched, state, lastir) = entry
+                    vcd.set_resume_point(offset, t, watched)
+                    w.curstate = state
+                    if lastir is not None:
+                        q.set_ir(lastir)
+
+        if my_args.checkpoint:
+            options = [getattr(my_args, a) for a in ('inscope', 'tck', 'tms', 'tdi', 'tdo', 'initstate',
+                       'timescale', 'outscope', 'core', 'chain', 'collapse', 'summary', 'format', 'width')]
+            if my_args.outfile:
+                options.append(os.path.abspath(my_args.outfile))
+            key = query.TimeIndex.make_key(my_args.infile.name, options)
+            checkpointer = checkpoint.Checkpointer(my_args.checkpoint, key, w, writer,
+                                                   my_args.checkpoint_interval)
+            vcd.track_offset = True
+            vcd.register_time_hook(checkpointer.hook)
+            if my_args.resume:
+                checkpointer.resume(vcd)
+
+        infile = reader.open_capture(my_args.infile)
+        if capture is not None or cache is not None:
+            lines = None
+        elif my_args.pipeline:
+            lines = reader.ThreadedReader(infile)
+        else:
+            lines = infile
+
+        if my_args.summary:
+            # the transaction log of the core is not wanted, only the summary
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, 'w')
+        started = time.time()
+        complete = False
+        try:
+            if cache is not None:
+                w.replay_scans(cache)
+            elif capture is not None:
+                w.feed_binary(capture)
+            else:
+                vcd.parse(lines)
+            w.flush()
+            complete = not vcd.stopped
+        finally:
+            if my_args.pipeline and lines is not None:
+                lines.close()
+            if cache is not None:
+                cache.close()
+            if recorder is not None:
+                recorder.finish(complete)
+            if lodrecorder is not None:
+                lodrecorder.finish(complete)
+            if my_args.summary:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+    if my_args.timing:
+        elapsed = time.time() - started
+        if vcd.header_time is not None:
+            sys.stderr.write('header parsed in {:.3f}s, {} variables out of {} skipped\n'.format(
+                vcd.header_time, vcd.skipped_vars, my_args.inscope))
+            elapsed -= vcd.header_time
+        sys.stderr.write('value changes parsed in {:.3f}s\n'.format(elapsed))
+    if vcd.stopped and (my_args.max_transactions is not None or my_args.max_time is not None):
+        sys.stderr.write('preview stopped at time ' + str(vcd.now) + '\n')
+    if (my_args.drop_redundant or my_args.min_pulse) and cache is None:
+        # a replay does not parse the capture
+        sys.stderr.write('suppressed {redundant} redundant changes and {glitch} changes of glitches\n'.format(**vcd.suppressed))
+    if newindex is not None:
+        newindex.save(my_args.index)
+    if my_args.memory:
+        memorylog.save(my_args.memory)
+
+    if my_args.summary and my_args.analytics and my_args.json:
+        # a single json document
+        report = summarizer.report()
+        report['analytics'] = w.analytics.report()
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        if my_args.summary and my_args.json:
+            print(json.dumps(summarizer.report(), indent=2, sort_keys=True))
+        elif my_args.summary:
+            summarizer.display()
+        if my_args.analytics and my_args.json:
+            print(json.dumps(w.analytics.report(), indent=2, sort_keys=True))
+        elif my_args.analytics:
+            w.analytics.display()
+
+    if outfile is not None:
+        outfile.close()
+    my_args.infile.close()
+    return 0
+
+
+def preload():
+    '''Import everything main may need, for the daemon to fork its jobs with it'''
+    import json
+    from vcd_parser import parser, reader, binary, samples
+    from jtag_parser import collapse, summary, query, pipeline, checkpoint, memory, diff, preview, scancache, chain, analytics, lod
+    from vcd import VCDWriter
+    for name in cores.builtin:
+        cores.load(name)
+    make_argparser()
+
+
+if __name__ == '__main__':
+    from jtag_parser import daemon
+    if sys.argv[1:2] == ['--daemon']:
+        preload()
+        daemon.main(sys.argv[2:], main)
+        sys.exit(0)
+    status = None
+    path = daemon.socket_path()
+    # the daemon cannot read our standard input
+    if path is not None and '-' not in sys.argv[1:]:
+        status = daemon.submit(path, sys.argv[1:])
+    if status is None:
+        status = main()
+    sys.exit(status)
@@ -0,0 +1,9 @@
+'''
+   JTAG level building blocks used by jtag_parse.py
+
+   Everything here works on the TAP events (state changes, IR and DR scans)
+   produced by the JTAGTracker, independently of the VCD input and output.
+
+'''
+
+__all__ = ['stages', 'collapse', 'summary', 'query', 'pipeline', 'checkpoint', 'writers', 'daemon', 'cores', 'e200z0', 'formats', 'parallel', 'memory', 'diff', 'preview', 'scancache', 'chain', 'analytics', 'lod']
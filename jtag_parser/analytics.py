@@ -0,0 +1,194 @@
+'''
+   Utilization and latency of the JTAG link
+
+   The JTAGAnalytics stage measures where the time of the link goes, while
+   the events go through it:
+
+   - the payload (bits of the IR and DR scans) against the TCK cycles, the
+     watcher counting the rising edges of TCK
+   - the TCK cycles and the time spent in every TAP state, grouped in idle
+     (test_logic_reset, run_test_idle), shift, pause and the overhead of the
+     other states, with histograms of the cycles of every visit to the idle
+     and pause states and of the time between two DR scans
+   - the metrics the cores report with JTAGCore.measure, such as the latency
+     of a command, each in a histogram
+   - the bytes the cores report to be transferred to or from the target with
+     JTAGCore.transfer, giving the effective bytes per second
+
+   Everything is computed on the fly in Histograms of power of two buckets,
+   the memory used does not depend on the length of the capture.
+
+'''
+
+from collections import defaultdict
+
+from stages import JTAGStage
+
+# groups of the TAP states
+categories = {'test_logic_reset': 'idle', 'run_test_idle': 'idle',
+              'shift_dr': 'shift', 'shift_ir': 'shift',
+              'pause_dr': 'pause', 'pause_ir': 'pause'}
+
+
+class Histogram(object):
+    '''Count, total, minimum, maximum and power of two buckets of positive samples,
+    bucket k holding the samples from 2**(k-1) to 2**k - 1 (0 in bucket 0)'''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.buckets = defaultdict(int)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.buckets[int(value).bit_length()] += 1
+
+    def report(self):
+        return {'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+                'mean': float(self.total) / self.count if self.count else None,
+                'buckets': dict(('<' + str(1 << k), n) for k, n in self.buckets.items())}
+
+    def restore(self, report):
+        self.count = report['count']
+        self.total = report['total']
+        self.min = report['min']
+        self.max = report['max']
+        self.buckets.update((int(k[1:]).bit_length() - 1, n) for k, n in report['buckets'].items())
+
+
+class JTAGAnalytics(JTAGStage):
+    '''Stage measuring the link before forwarding the events, the TCK cycles
+    are read in the cycles attribute of the watcher'''
+
+    def __init__(self, nextstage, watcher, initstate):
+        JTAGStage.__init__(self, nextstage)
+        self.watcher = watcher
+        self.ir_bits = 0
+        self.dr_bits = 0
+        self.state_cycles = defaultdict(int)
+        self.state_time = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+        # bytes transferred, time of the first and last transfer
+        self.transferred = 0
+        self.first_transfer = None
+        self.last_transfer = None
+
+        self.curstate = initstate
+        self.statetime = 0
+        self.statecycles = watcher.cycles
+        self.lastdata = None
+
+    def measure(self, metric, value):
+        '''Add a sample to the histogram of metric'''
+        self.histograms[metric].add(value)
+
+    def transfer(self, simtime, size):
+        '''Count size bytes transferred to or from the target memory'''
+        self.transferred += size
+        if self.first_transfer is None:
+            self.first_transfer = simtime
+        self.last_transfer = simtime
+
+    def state(self, simtime, state):
+        cycles = self.watcher.cycles - self.statecycles
+        self.state_cycles[self.curstate] += cycles
+        self.state_time[self.curstate] += simtime - self.statetime
+        category = categories.get(self.curstate)
+        if category in ('idle', 'pause'):
+            self.histograms[category + '_cycles'].add(cycles)
+        self.curstate = state
+        self.statetime = simtime
+        self.statecycles = self.watcher.cycles
+        self.nextstage.state(simtime, state)
+
+    def instruction(self, simtime, iribits, irobits):
+        self.ir_bits += len(iribits)
+        self.nextstage.instruction(simtime, iribits, irobits)
+
+    def data(self, simtime, dribits, drobits):
+        self.dr_bits += len(dribits)
+        self.scanned(simtime)
+        self.nextstage.data(simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        self.scanned(simtime)
+        self.nextstage.data_null(simtime)
+
+    def scanned(self, simtime):
+        if self.lastdata is not None:
+            self.histograms['dr_interval'].add(simtime - self.lastdata)
+        self.lastdata = simtime
+
+    def checkpoint(self):
+        return (self.report(), self.curstate, self.statetime, self.statecycles, self.lastdata)
+
+    def restore(self, state):
+        (report, self.curstate, self.statetime, self.statecycles, self.lastdata) = state
+        self.ir_bits = report['ir_bits']
+        self.dr_bits = report['dr_bits']
+        self.state_cycles.update(report['state_cycles'])
+        self.state_time.update(report['state_time'])
+        for metric, h in report['histograms'].items():
+            self.histograms[metric].restore(h)
+        (self.transferred, self.first_transfer, self.last_transfer) = [
+            report['transfers'][a] for a in ('bytes', 'first', 'last')]
+
+    def report(self):
+        '''Return the measures as a dictionary of plain types, the cycles and time
+        of the current state are not counted until it is left'''
+        cycles = self.watcher.cycles
+        groups = defaultdict(lambda: {'cycles': 0, 'time': 0})
+        for state, n in self.state_cycles.items():
+            groups[categories.get(state, 'overhead')]['cycles'] += n
+        for state, t in self.state_time.items():
+            groups[categories.get(state, 'overhead')]['time'] += t
+        unit = self.watcher.parser.time_unit if self.watcher.parser is not None else None
+        rate = None
+        if unit and self.last_transfer is not None and self.last_transfer > self.first_transfer:
+            rate = self.transferred * 1e15 / ((self.last_transfer - self.first_transfer) * unit)
+        return {
+            'tck_cycles': cycles,
+            'ir_bits': self.ir_bits,
+            'dr_bits': self.dr_bits,
+            'payload': float(self.ir_bits + self.dr_bits) / cycles if cycles else None,
+            'dr_payload': float(self.dr_bits) / cycles if cycles else None,
+            'state_cycles': dict(self.state_cycles),
+            'state_time': dict(self.state_time),
+            'groups': dict(groups),
+            'histograms': dict((metric, h.report()) for metric, h in self.histograms.items()),
+            'transfers': {'bytes': self.transferred, 'first': self.first_transfer,
+                          'last': self.last_transfer, 'bytes_per_second': rate},
+        }
+
+    def display(self):
+        '''Print the measures in a human readable form'''
+        report = self.report()
+        print('Link utilization')
+        print('  TCK cycles: ' + str(report['tck_cycles']))
+        print('  IR bits: ' + str(report['ir_bits']) + ', DR bits: ' + str(report['dr_bits']))
+        if report['payload'] is not None:
+            print('  payload: {:.1%} of the cycles, DR payload: {:.1%}'.format(report['payload'], report['dr_payload']))
+        print('Cycles and time per group of TAP states')
+        for group in sorted(report['groups']):
+            g = report['groups'][group]
+            print('  {}: {} cycles, time {}'.format(group, g['cycles'], g['time']))
+        print('Cycles and time per TAP state')
+        for state in sorted(report['state_cycles']):
+            print('  {}: {} cycles, time {}'.format(state, report['state_cycles'][state], report['state_time'][state]))
+        print('Histograms')
+        for metric in sorted(report['histograms']):
+            h = report['histograms'][metric]
+            print('  {}: {} samples, min {}, mean {:.1f}, max {}'.format(metric, h['count'], h['min'], h['mean'], h['max']))
+            for bucket in sorted(h['buckets'], key=lambda b: int(b[1:])):
+                print('    {}: {}'.format(bucket, h['buckets'][bucket]))
+        t = report['transfers']
+        print('Memory transfers')
+        print('  {} bytes'.format(t['bytes']) +
+              ('' if t['bytes_per_second'] is None else ', {:.0f} bytes/s'.format(t['bytes_per_second'])))
@@ -0,0 +1,212 @@
+'''
+   Daisy-chained devices sharing the TAP signals
+
+   Several devices can be chained behind one TCK/TMS/TDI/TDO, the TDO of a
+   device driving the TDI of the next one.  Every IR scan then goes through
+   the instruction registers of all of them, and every DR scan through the
+   selected data register of each.  The devices are described from the one
+   driving TDO to the one receiving TDI, as a list of name:irlength[:core]:
+   the first bits shifted in, and the first bits shifted out, are the ones
+   of the first device.
+
+   The JTAGChain stage, placed in front of the stage calling the core of the
+   watcher, splits the scans into the segments of the devices and sends each
+   segment to the device's core, which writes its variables in the scope of
+   the device.  A device whose IR was loaded with ones is in BYPASS: its DR
+   is one bit, and its core is not sent the DR scans.  After a reset the
+   devices select their 32 bits IDCODE register.  An IR scan whose length is
+   not the one of the chain, or a null one, leaves the instructions of the
+   devices unknown: their cores get a null instruction, and the DR scans are
+   not sent to them until the next IR scan of the right length.  The length of a DR scan
+   of a device in any other state is not known, so the segments of a DR
+   scan can only be found when at most one device is in such a state: it
+   gets what the others leave.  The scans that cannot be split are reported
+   as warnings.
+
+'''
+
+from vcd_parser.watcher import VcdWatcher
+from stages import JTAGStage
+
+
+def parse_chain(text):
+    '''List of (name, irlength, core name or None) of a chain description'''
+    devices = []
+    for item in text.split(','):
+        fields = item.split(':')
+        if len(fields) not in (2, 3) or not fields[0] or not fields[1].isdigit() or int(fields[1]) < 1:
+            raise ValueError('expected name:irlength[:core] for a device: ' + item)
+        devices.append((fields[0], int(fields[1]), fields[2] if len(fields) == 3 else None))
+    if len(set(name for (name, irlength, core) in devices)) != len(devices):
+        raise ValueError('the names of the devices must be different')
+    return devices
+
+
+class ScopedWriter(object):
+    '''Writer registering the variables in a scope prefixed by the name of a device'''
+
+    def __init__(self, writer, prefix):
+        self.writer = writer
+        self.prefix = prefix
+
+    def register_var(self, scope, name, var_type, size=None, init=None, ident=None):
+        return self.writer.register_var(self.prefix + '.' + scope, name, var_type, size, init)
+
+    def change(self, var, timestamp, value):
+        # not bound once, the writer of the watcher changes its change method
+        # when the timescale of the input is known
+        self.writer.change(var, timestamp, value)
+
+
+class DeviceWatcher(VcdWatcher):
+    '''Watcher of the core of a device, the variables of the core go in the
+    scope of the device, the rest is the one of the JTAGWatcher'''
+
+    def __init__(self, watcher, name):
+        VcdWatcher.__init__(self)
+        self.chainwatcher = watcher
+        self.writer = ScopedWriter(watcher.writer, name)
+
+    @property
+    def parser(self):
+        return self.chainwatcher.parser
+
+    @property
+    def collector(self):
+        return self.chainwatcher.collector
+
+    @property
+    def analytics(self):
+        return self.chainwatcher.analytics
+
+
+class JTAGDevice(object):
+    '''A device of the chain, with its own core and jtag variable in outscope.name'''
+
+    def __init__(self, watcher, name, irlength, core_class, outscope, format):
+        self.name = name
+        self.irlength = irlength
+        self.bypass_ir = '1' * irlength
+        self.core = core_class(DeviceWatcher(watcher, name))
+        self.format = format
+        self.writer = watcher.writer
+        self.opvar = watcher.writer.register_var(outscope + '.' + name, 'jtag', 'string', init='none')
+        self.bypass = False
+        # length of the selected data register, None when not known
+        self.drlength = None
+        # whether the instruction of the device is known
+        self.selected = False
+
+    def instruction(self, simtime, iribits, irobits):
+        self.bypass = iribits == self.bypass_ir
+        self.drlength = 1 if self.bypass else None
+        self.selected = True
+        self.core.instruction(simtime, iribits, irobits)
+        self.writer.change(self.opvar, simtime, self.format.instruction(simtime, iribits, irobits))
+
+    def instruction_null(self, simtime):
+        self.bypass = False
+        self.drlength = None
+        self.selected = False
+        self.core.instruction_null(simtime)
+        self.writer.change(self.opvar, simtime, self.format.instruction_null(simtime))
+
+    def data(self, simtime, dribits, drobits):
+        self.core.data(simtime, dribits, drobits)
+        self.writer.change(self.opvar, simtime, self.format.data(simtime, dribits, drobits))
+
+    def data_null(self, simtime):
+        self.core.data_null(simtime)
+        self.writer.change(self.opvar, simtime, self.format.data_null(simtime))
+
+    def reset(self):
+        # the IDCODE register is selected
+        self.bypass = False
+        self.drlength = 32
+        self.selected = True
+
+
+class JTAGChain(JTAGStage):
+    '''Stage sending the segments of the scans to the JTAGDevice of the chain,
+    listed from TDO to TDI, before forwarding the whole scans'''
+
+    def __init__(self, nextstage, watcher, devices, initstate):
+        JTAGStage.__init__(self, nextstage)
+        self.watcher = watcher
+        self.devices = devices
+        self.irlength = sum(device.irlength for device in devices)
+        if initstate == 'test_logic_reset':
+            for device in devices:
+                device.reset()
+
+    def warning(self, simtime, text):
+        print(str(simtime) + ': CHAIN ' + text)
+        if self.watcher.collector is not None:
+            self.watcher.collector.warning(simtime, text)
+
+    def checkpoint(self):
+        return [(device.bypass, device.drlength, device.selected, device.core.checkpoint())
+                for device in self.devices]
+
+    def restore(self, state):
+        for device, (bypass, drlength, selected, corestate) in zip(self.devices, state):
+            device.bypass = bypass
+            device.drlength = drlength
+            device.selected = selected
+            device.core.restore(corestate)
+
+    def reset(self, simtime):
+        for device in self.devices:
+            device.reset()
+        self.nextstage.reset(simtime)
+
+    def instruction(self, simtime, iribits, irobits):
+        if len(iribits) != self.irlength:
+            self.warning(simtime, 'IR scan of {} bits for a chain of {} bits'.format(len(iribits), self.irlength))
+            for device in self.devices:
+                device.instruction_null(simtime)
+        else:
+            offset = 0
+            for device in self.devices:
+                end = offset + device.irlength
+                device.instruction(simtime, iribits[offset:end], irobits[offset:end])
+                offset = end
+        self.nextstage.instruction(simtime, iribits, irobits)
+
+    def instruction_null(self, simtime):
+        for device in self.devices:
+            device.instruction_null(simtime)
+        self.nextstage.instruction_null(simtime)
+
+    def data(self, simtime, dribits, drobits):
+        if not all(device.selected for device in self.devices):
+            self.warning(simtime, 'DR scan of {} bits with the instructions of the devices unknown'.format(len(dribits)))
+            self.nextstage.data(simtime, dribits, drobits)
+            return
+        lengths = [device.drlength for device in self.devices]
+        unknown = [k for k, length in enumerate(lengths) if length is None]
+        known = sum(length for length in lengths if length is not None)
+        if len(unknown) == 1 and known <= len(dribits):
+            lengths[unknown[0]] = len(dribits) - known
+        elif unknown or known != len(dribits):
+            self.warning(simtime, 'DR scan of {} bits not split between the devices'.format(len(dribits)))
+            self.nextstage.data(simtime, dribits, drobits)
+            return
+        offset = 0
+        for device, length in zip(self.devices, lengths):
+            end = offset + length
+            # the devices in BYPASS are not sent their bit, the others only
+            # get a copy of their segment
+            if not device.bypass:
+                if length:
+                    device.data(simtime, dribits[offset:end], drobits[offset:end])
+                else:
+                    device.data_null(simtime)
+            offset = end
+        self.nextstage.data(simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        for device in self.devices:
+            if device.selected and not device.bypass:
+                device.data_null(simtime)
+        self.nextstage.data_null(simtime)
@@ -0,0 +1,80 @@
+'''
+   Checkpoints of a decode in progress
+
+   The Checkpointer is called by the parser after every time update.  About
+   every interval seconds, it saves in a file everything needed to continue
+   the decode from the current #time line: the offset of the line, the time
+   and the watched values of the parser, the state of the watcher (TAP state,
+   bits shifted so far, stages and core) and the position of the output.
+
+   A decode started again from the last checkpoint produces the same output
+   file as an uninterrupted one: the output is truncated to the position it
+   had at the checkpoint, and the writer continues from there.  Only a
+   decode whose stages are all checkpointable can be checkpointed.
+
+'''
+
+import os
+import time
+import pickle
+
+import writers
+
+
+class Checkpointer(object):
+    '''Save the state of a decode in progress at regular intervals'''
+
+    # bytes of input between two checks of the clock
+    step = 1 << 20
+
+    def __init__(self, path, key, watcher, writer, interval=60):
+        for stage in watcher.stages():
+            if not stage.checkpointable:
+                raise ValueError('a decode through a ' + type(stage).__name__ + ' cannot be checkpointed')
+        internals = writers.PyvcdInternals.of(writer)
+        if internals is not None and internals.unsupported is not None:
+            raise ValueError('the output cannot be checkpointed: ' + internals.unsupported)
+        self.path = path
+        self.key = key
+        self.watcher = watcher
+        self.writer = writer
+        self.interval = interval
+        self.lastoffset = 0
+        self.lasttime = time.time()
+
+    def hook(self, parser):
+        '''Time hook of the parser, the offset tracking must be enabled'''
+        if parser.offset - self.lastoffset < self.step:
+            return
+        self.lastoffset = parser.offset
+        if time.time() - self.lasttime < self.interval:
+            return
+        self.save(parser)
+        self.lasttime = time.time()
+
+    def save(self, parser):
+        '''Write the checkpoint, the previous one is replaced atomically'''
+        state = {
+            'key': self.key,
+            'parser': (parser.offset, parser.now, dict(parser.watched_changes)),
+            'watcher': self.watcher.checkpoint(),
+            'writer': writers.checkpoint(self.writer),
+        }
+        # the output is on disk before the checkpoint refers to it
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, 2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self.path)
+
+    def resume(self, parser):
+        '''Load the checkpoint and set the parser, watcher and writer to continue from it'''
+        with open(self.path, 'rb') as f:
+            state = pickle.load(f)
+        if state['key'] != self.key:
+            raise ValueError('The checkpoint ' + self.path + ' is for another capture or other options')
+        parser.set_resume_point(*state['parser'])
+        self.lastoffset = state['parser'][0]
+        self.watcher.restore(state['watcher'])
+        writers.restore(self.writer, state['writer'])
@@ -0,0 +1,147 @@
+'''
+   Run-length compression of repetitive JTAG transactions
+
+   Debuggers spend most of their time polling: the same IR is loaded and the
+   same DR is scanned over and over.  The JTAGCollapser stage splits the TAP
+   events into transactions, each one starting at an IR update and holding
+   the DR scans and state changes that follow it.  When a transaction is
+   identical to the previous one (same IR and DR bits in and out, same TAP
+   state walk) it is not forwarded; consecutive identical transactions are
+   gathered in a JTAGRun that is sent once with its repeat count and its
+   time span.
+
+   The collapse is lossless: the JTAGRun keeps the time of every event, and
+   a JTAGExpander stage placed after the collapser replays the runs so that
+   the stages after it see exactly the original event stream.
+
+   Replaying an identical transaction into a core is expected to leave its
+   state unchanged, which is why the suppressed transactions are not sent to
+   the core at all.
+
+'''
+
+from stages import JTAGStage
+
+
+class JTAGRun(object):
+    '''Consecutive repetitions of a transaction.
+    The events are stored once without their time, and the times of the
+    events of every repetition are stored separately'''
+
+    def __init__(self, events):
+        self.template = [(name, args) for (name, simtime, args) in events]
+        self.times = []
+        self.append(events)
+
+    def append(self, events):
+        '''Add a repetition, events must match the template'''
+        self.times.append(tuple(simtime for (name, simtime, args) in events))
+
+    @property
+    def count(self):
+        '''Number of repetitions held by the run'''
+        return len(self.times)
+
+    @property
+    def start(self):
+        '''Time of the first event of the first repetition'''
+        return self.times[0][0]
+
+    @property
+    def end(self):
+        '''Time of the last event of the last repetition'''
+        return self.times[-1][-1]
+
+    def expand(self):
+        '''Generate the original (name, simtime, args) events of the run'''
+        for times in self.times:
+            for (name, args), simtime in zip(self.template, times):
+                yield name, simtime, args
+
+
+class JTAGCollapser(JTAGStage):
+    '''Stage collapsing the runs of identical transactions'''
+
+    def __init__(self, nextstage):
+        JTAGStage.__init__(self, nextstage)
+        # events of the transaction being recorded
+        self.events = []
+        # events without time of the last complete transaction
+        self.lastkey = None
+        # pending run of repetitions of the last transaction
+        self.run = None
+
+    def record(self, name, simtime, *args):
+        self.events.append((name, simtime, args))
+
+    def state(self, simtime, state):
+        self.record('state', simtime, state)
+
+    def reset(self, simtime):
+        self.record('reset', simtime)
+
+    def instruction(self, simtime, iribits, irobits):
+        self.close()
+        self.record('instruction', simtime, iribits, irobits)
+
+    def instruction_null(self, simtime):
+        self.close()
+        self.record('instruction_null', simtime)
+
+    def data(self, simtime, dribits, drobits):
+        self.record('data', simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        self.record('data_null', simtime)
+
+    def repeat(self, run):
+        # a collapser after another one: the runs are already collapsed
+        self.close()
+        self.endrun()
+        self.nextstage.repeat(run)
+
+    def close(self):
+        '''End the current transaction, either add it to the pending run or
+        send it to the next stage'''
+        events = self.events
+        if not events:
+            return
+        self.events = []
+
+        key = [(name, args) for (name, simtime, args) in events]
+        if key == self.lastkey:
+            if self.run is None:
+                self.run = JTAGRun(events)
+            else:
+                self.run.append(events)
+            return
+
+        self.endrun()
+        self.lastkey = key
+        for name, simtime, args in events:
+            getattr(self.nextstage, name)(simtime, *args)
+
+    def endrun(self):
+        '''Send the pending run if any'''
+        if self.run is not None:
+            self.nextstage.repeat(self.run)
+            self.run = None
+
+    def flush(self):
+        self.close()
+        self.endrun()
+        JTAGStage.flush(self)
+
+    def checkpoint(self):
+        return (self.events, self.lastkey, self.run)
+
+    def restore(self, state):
+        (self.events, self.lastkey, self.run) = state
+
+
+class JTAGExpander(JTAGStage):
+    '''Stage replaying the collapsed runs event by event'''
+
+    def repeat(self, run):
+        for name, simtime, args in run.expand():
+            getattr(self.nextstage, name)(simtime, *args)
@@ -0,0 +1,140 @@
+'''
+   JTAG cores and their registry
+
+   A core turns the IR and DR scans into what they mean for a given device.
+   The base JTAGCore prints the raw scans, the silentcore ignores them.
+
+   The cores are found by name without being imported: the ones shipped
+   here are listed in builtin with the module defining them, other packages
+   can add theirs with an entry point of the 'jtag_parse.cores' group, for
+   instance in their setup.py:
+
+       entry_points={'jtag_parse.cores': ['mycore = mypackage.mymodule:MyCore']}
+
+   load imports the module of the requested core only.
+
+'''
+
+from importlib import import_module
+
+from vcd_parser.watcher import VcdWatcher
+
+# name of the core -> (module, class)
+builtin = {'simple': ('jtag_parser.cores', 'JTAGCore'),
+           'silent': ('jtag_parser.cores', 'silentcore'),
+           'e200z0': ('jtag_parser.e200z0', 'e200z0')}
+
+entry_point_group = 'jtag_parse.cores'
+
+
+def load(name):
+    '''Class of the core registered as name, KeyError if there is none'''
+    if name in builtin:
+        (module, cls) = builtin[name]
+        return getattr(import_module(module), cls)
+    try:
+        import pkg_resources
+    except ImportError:
+        raise KeyError(name)
+    for entry_point in pkg_resources.iter_entry_points(entry_point_group, name):
+        return entry_point.load()
+    raise KeyError(name)
+
+
+class JTAGCore(object):
+    '''Base class for JTAG core objects'''
+
+    # the decode of a scan only depends on its bits and on the state kept up
+    # to date by advance, see jtag_parser.parallel
+    parallel = False
+
+    def __init__(self, watcher):
+        assert isinstance(watcher, VcdWatcher), "watcher parameter is not expected type"
+        self.watcher = watcher
+
+    def instruction(self, simtime, iribits, irobits):
+        '''Called at the update_ir sampling time.
+        iribits contains the string of bits sampled on TDI,
+        the first char contains the oldest sample,
+        the last char contains the latest sample
+        irobits contains the string of bits sampled on TDO'''
+        ir_i = int(iribits, 2)
+        ir_o = int(irobits, 2)
+        s = 'ir_i=' + iribits + '(' + hex(ir_i) + ')' + ' ir_o=' + irobits + '(' + hex(ir_o) + ')'
+        print(str(simtime) + ": instruction " + s)
+
+    def instruction_null(self, simtime):
+        print(str(simtime) + ": instruction NULL")
+
+    def data(self, simtime, dribits, drobits):
+        '''Called at the update_dr sampling time.
+        dribits contains the string of bits sampled on TDI,
+        the first char contains the oldest sample,
+        the last char contains the latest sample
+        drobits contains the string of bits sampled on TDO'''
+        print(str(simtime) + ": data " + str(len(dribits))+"bits")
+        dr_i = hex(int(dribits, 2))
+        dr_o = hex(int(drobits, 2))
+        print('   in : ' + dribits + '(' + dr_i + ')')
+        print('   out: ' + drobits + '(' + dr_o + ')')
+
+    def data_null(self, simtime):
+        print(str(simtime) + ": data NULL")
+
+    def register_name(self, iribits):
+        '''Name of the register selected by an instruction, None if the core
+        does not know it. This must not depend on the state of the core'''
+        return None
+
+    def advance(self, name, simtime, args):
+        '''Stateful part of the event name (instruction, data...): update the
+        state the decode of the next events depends on, without decoding.
+        Only used for the parallel cores'''
+        pass
+
+    def checkpoint(self):
+        '''Return the state of the core as picklable data, stateless by default'''
+        return None
+
+    def restore(self, state):
+        '''Set the state of the core from what checkpoint returned'''
+        pass
+
+    def count(self, counter, key):
+        '''Report an occurrence of key to the collector of the watcher, if any'''
+        if self.watcher.collector is not None:
+            self.watcher.collector.count(counter, key)
+
+    def warning(self, simtime, text):
+        '''Report a warning to the collector of the watcher, if any'''
+        if self.watcher.collector is not None:
+            self.watcher.collector.warning(simtime, text)
+
+    def measure(self, metric, value):
+        '''Report a sample of metric, a latency for instance, to the analytics of the watcher, if any'''
+        if self.watcher.analytics is not None:
+            self.watcher.analytics.measure(metric, value)
+
+    def transfer(self, simtime, size):
+        '''Report size bytes transferred to or from the target memory to the analytics of the watcher, if any'''
+        if self.watcher.analytics is not None:
+            self.watcher.analytics.transfer(simtime, size)
+
+    def stop(self):
+        '''Stop the decode, the parser stops at its next time update'''
+        self.watcher.parser.stop()
+
+class silentcore(JTAGCore):
+    parallel = True
+
+    def instruction(self, simtime, iribits, irobits):
+        pass
+
+    def instruction_null(self, simtime):
+        pass
+
+    def data(self, simtime, dribits, drobits):
+        pass
+
+    def data_null(self, simtime):
+        pass
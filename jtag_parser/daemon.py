@@ -0,0 +1,229 @@
+'''
+   Decode daemon
+
+   For a short capture, starting the interpreter, importing the modules and
+   building the argument parser take longer than the decode itself.  A
+   daemon started with `jtag_parse.py --daemon` pays for them once: it
+   listens on a Unix domain socket and runs every job in a process forked
+   from its own, where everything is already imported and built.  At most
+   `workers` jobs run at the same time, the next ones wait in the listen
+   queue.  Forking a fresh process per job also means that nothing a job
+   changes can leak into the next one.
+
+   A job is a jtag_parse.py command line together with the directory its
+   paths are relative to.  The messages are JSON lines:
+
+   - from the client: {"argv": [...], "cwd": "..."}
+   - from the daemon: {"stdout": text}, {"stderr": text}, {"progress": time}
+     as the job goes, and last {"exit": status}
+
+   jtag_parse.py sends its command line to the daemon when one listens on
+   the socket, and decodes by itself otherwise.  The socket path is taken
+   from the JTAG_PARSE_SOCKET environment variable, an empty value disables
+   the daemon.
+
+'''
+
+import os
+import sys
+import json
+import time
+import signal
+import traceback
+
+
+def socket_path():
+    '''Path of the socket of the daemon, None when the daemon is disabled'''
+    path = os.environ.get('JTAG_PARSE_SOCKET')
+    if path is None:
+        path = os.path.join(os.environ.get('TMPDIR', '/tmp'), 'jtag_parse-{}.sock'.format(os.getuid()))
+    return path or None
+
+
+def send(ofile, message):
+    ofile.write((json.dumps(message) + '\n').encode('utf-8'))
+    ofile.flush()
+
+
+class FrameWriter(object):
+    '''File object sending what is written as messages of one kind'''
+
+    def __init__(self, ofile, kind, size=1 << 16):
+        self.ofile = ofile
+        self.kind = kind
+        self.size = size
+        self.buffer = []
+        self.length = 0
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.length += len(text)
+        if self.length >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            send(self.ofile, {self.kind: ''.join(self.buffer)})
+            self.buffer = []
+            self.length = 0
+
+    def isatty(self):
+        return False
+
+
+class Progress(object):
+    '''Time hook of the parser sending its time every interval seconds'''
+
+    def __init__(self, ofile, interval=1.0):
+        self.ofile = ofile
+        self.interval = interval
+        self.calls = 0
+        self.last = time.time()
+
+    def __call__(self, parser):
+        # only look at the clock every 4096 time updates
+        self.calls += 1
+        if self.calls & 0xFFF:
+            return
+        now = time.time()
+        if now - self.last >= self.interval:
+            self.last = now
+            send(self.ofile, {'progress': parser.now})
+
+
+def run_job(conn, run):
+    '''Read a job from the connection and run it, its output being sent back.
+    run is called with the command line and a Progress time hook, and returns
+    the exit status'''
+    rfile = conn.makefile('rb')
+    wfile = conn.makefile('wb')
+    stdout = FrameWriter(wfile, 'stdout')
+    stderr = FrameWriter(wfile, 'stderr')
+    status = 1
+    try:
+        job = json.loads(rfile.readline().decode('utf-8'))
+        os.chdir(job['cwd'])
+        sys.stdout = stdout
+        sys.stderr = stderr
+        try:
+            status = run([str(a) for a in job['argv']], Progress(wfile))
+        except SystemExit as e:
+            # argparse errors and sys.exit calls
+            status = e.code
+            if status is None:
+                status = 0
+            elif not isinstance(status, int):
+                stderr.write(str(status) + '\n')
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+    finally:
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+        stdout.flush()
+        stderr.flush()
+        send(wfile, {'exit': status})
+        conn.close()
+
+
+def serve(path, run, workers):
+    '''Run the daemon until it is terminated'''
+    import socket
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            # left over by a daemon that did not exit cleanly
+            os.unlink(path)
+        else:
+            raise RuntimeError('a daemon is already listening on ' + path)
+        finally:
+            probe.close()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(64)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    children = set()
+    try:
+        while True:
+            # collect the finished jobs, wait for one when all the workers are busy
+            while children:
+                (pid, status) = os.waitpid(-1, 0 if len(children) >= workers else os.WNOHANG)
+                if pid == 0:
+                    break
+                children.discard(pid)
+            (conn, address) = server.accept()
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    server.close()
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    run_job(conn, run)
+                finally:
+                    os._exit(0)
+            conn.close()
+            children.add(pid)
+    finally:
+        server.close()
+        os.unlink(path)
+
+
+def submit(path, argv):
+    '''Run a command line in the daemon, with its output written here.
+    Return its exit status, None when no daemon listens on path'''
+    if not os.path.exists(path):
+        return None
+    # only imported when a daemon may be running
+    import socket
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error:
+        client.close()
+        return None
+
+    rfile = client.makefile('rb')
+    wfile = client.makefile('wb')
+    send(wfile, {'argv': argv, 'cwd': os.getcwd()})
+    show = sys.stderr.isatty()
+    shown = False
+    status = None
+    for line in rfile:
+        message = json.loads(line.decode('utf-8'))
+        if 'stdout' in message:
+            sys.stdout.write(message['stdout'])
+        elif 'stderr' in message:
+            sys.stderr.write(message['stderr'])
+        elif 'progress' in message:
+            if show:
+                sys.stderr.write('\rdecoded until ' + str(message['progress']))
+                shown = True
+        elif 'exit' in message:
+            status = message['exit']
+    client.close()
+    if shown:
+        sys.stderr.write('\n')
+    if status is None:
+        sys.stderr.write('the daemon closed the connection before the end of the job\n')
+        status = 1
+    return status
+
+
+def main(argv, run):
+    '''Command line of the daemon'''
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='jtag_parse.py --daemon',
+        description='Run the jtag_parse.py command lines sent to the socket')
+    argparser.add_argument('--socket', default=socket_path(),
+        help='path of the Unix domain socket')
+    argparser.add_argument('--workers', type=int, default=4,
+        help='maximum number of jobs running at the same time')
+    my_args = argparser.parse_args(argv)
+    if my_args.socket is None:
+        argparser.error('the daemon is disabled by an empty JTAG_PARSE_SOCKET')
+    serve(my_args.socket, run, my_args.workers)
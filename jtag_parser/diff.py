@@ -0,0 +1,240 @@
+'''
+   Transaction level diff of two captures
+
+   Comparing the decoded logs of a good and a bad run is slow and drowned in
+   time differences.  Here both captures are decoded at the same time, each
+   in its own process, into streams of transactions: a DR scan with the IR
+   scan in effect, as for the queries.  A transaction is compared through its
+   key (IR bits, DR length, CRC of the bits shifted in and out), its time is
+   only reported.
+
+   The Differ walks both streams in step while their keys are equal.  At a
+   divergence it reads up to window transactions ahead on both sides and
+   looks for the nearest point where match consecutive transactions are
+   equal again, comparing rolling hashes of the keys, then reports what was
+   skipped on both sides as a differing region.  When no such point is found
+   in the window, the whole window is reported as differing.  The memory used
+   depends on the window, not on the length of the captures.
+
+'''
+
+import zlib
+import traceback
+from collections import deque, namedtuple
+
+from stages import JTAGStage
+
+
+DiffTransaction = namedtuple('DiffTransaction', 'index time ir length key')
+
+DiffRegion = namedtuple('DiffRegion', 'a b')
+
+
+def crc(bits):
+    return zlib.crc32(bits.encode('ascii')) & 0xFFFFFFFF
+
+
+class TransactionStream(JTAGStage):
+    '''Last stage of the chain, passing the transactions in batches to put'''
+
+    def __init__(self, put, batch_size=1024):
+        JTAGStage.__init__(self)
+        self.put = put
+        self.batch_size = batch_size
+        self.batch = []
+        self.index = 0
+        self.iribits = None
+
+    def state(self, simtime, state):
+        pass
+
+    def reset(self, simtime):
+        pass
+
+    def instruction(self, simtime, iribits, irobits):
+        self.iribits = iribits
+
+    def instruction_null(self, simtime):
+        self.iribits = None
+
+    def data(self, simtime, dribits, drobits):
+        key = (self.iribits, len(dribits), crc(dribits), crc(drobits))
+        self.batch.append(DiffTransaction(self.index, simtime, self.iribits, len(dribits), key))
+        self.index += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def data_null(self, simtime):
+        self.data(simtime, '', '')
+
+    def repeat(self, run):
+        pass
+
+    def flush(self):
+        if self.batch:
+            self.put(self.batch)
+            self.batch = []
+
+
+def produce(decode, path, output, batch_size):
+    '''Target of the decoding process: decode(path, stage) decodes the capture
+    with stage as the last stage, None marks the end and a text an error'''
+    try:
+        stage = TransactionStream(output.put, batch_size)
+        decode(path, stage)
+        stage.flush()
+        output.put(None)
+    except BaseException:
+        output.put(traceback.format_exc())
+
+
+def stream(decode, path, batch_size=1024, depth=16):
+    '''Generate the transactions of the capture at path, decoded in a separate
+    process by decode, see produce'''
+    import multiprocessing
+    output = multiprocessing.Queue(depth)
+    process = multiprocessing.Process(target=produce, args=(decode, path, output, batch_size))
+    process.daemon = True
+    process.start()
+    try:
+        while True:
+            batch = output.get()
+            if batch is None:
+                break
+            if not isinstance(batch, list):
+                raise RuntimeError('the decode of ' + path + ' failed:\n' + batch)
+            for transaction in batch:
+                yield transaction
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+
+class Side(object):
+    '''Transactions of a stream read ahead and not compared yet'''
+
+    def __init__(self, transactions):
+        self.transactions = iter(transactions)
+        self.buffer = deque()
+        self.done = False
+
+    def fill(self, n):
+        while len(self.buffer) < n and not self.done:
+            try:
+                self.buffer.append(next(self.transactions))
+            except StopIteration:
+                self.done = True
+        return len(self.buffer)
+
+    def pop(self, n):
+        return [self.buffer.popleft() for k in range(n)]
+
+
+class Differ(object):
+    '''Alignment of two transaction streams'''
+
+    # rolling hash modulo a Mersenne prime
+    base = 1000003
+    modulo = (1 << 61) - 1
+
+    def __init__(self, window=4096, match=8):
+        assert window >= match >= 1
+        self.window = window
+        self.match = match
+        self.matched = 0
+
+    def rolling(self, keys, k):
+        '''Hashes of the k consecutive keys starting at every position'''
+        hashes = []
+        high = pow(self.base, k - 1, self.modulo)
+        h = 0
+        for n, key in enumerate(keys):
+            if n >= k:
+                h = (h - (hash(keys[n - k]) & self.modulo) * high) % self.modulo
+            h = (h * self.base + (hash(key) & self.modulo)) % self.modulo
+            if n >= k - 1:
+                hashes.append(h)
+        return hashes
+
+    def align(self, a, b, k):
+        '''Smallest i + j such that a[i:i + k] and b[j:j + k] have the same keys, None if none'''
+        akeys = [t.key for t in a]
+        bkeys = [t.key for t in b]
+        positions = {}
+        for j, h in enumerate(self.rolling(bkeys, k)):
+            positions.setdefault(h, []).append(j)
+        best = None
+        for i, h in enumerate(self.rolling(akeys, k)):
+            if best is not None and i >= best[0] + best[1]:
+                break
+            for j in positions.get(h, ()):
+                if best is not None and i + j >= best[0] + best[1]:
+                    break
+                if akeys[i:i + k] == bkeys[j:j + k]:
+                    best = (i, j)
+                    break
+        return best
+
+    def regions(self, a, b):
+        '''Generate the DiffRegion of the streams a and b, the transactions
+        skipped on each side'''
+        a = self.a = Side(a)
+        b = self.b = Side(b)
+        while True:
+            na = a.fill(1)
+            nb = b.fill(1)
+            if not na and not nb:
+                return
+            if na and nb and a.buffer[0].key == b.buffer[0].key:
+                a.buffer.popleft()
+                b.buffer.popleft()
+                self.matched += 1
+                continue
+            na = a.fill(self.window)
+            nb = b.fill(self.window)
+            k = min(self.match, na, nb)
+            found = self.align(list(a.buffer), list(b.buffer), k) if k else None
+            if found is None:
+                found = (na, nb)
+            yield DiffRegion(a.pop(found[0]), b.pop(found[1]))
+
+
+def describe(transactions):
+    if not transactions:
+        return 'nothing'
+    first = transactions[0]
+    last = transactions[-1]
+    return '#{}-#{} ({} transactions, time {}-{})'.format(first.index, last.index, len(transactions),
+                                                          first.time, last.time)
+
+
+def show(transaction):
+    if transaction is None:
+        return 'end of capture'
+    return '#{} at {}: ir={} dr({})'.format(transaction.index, transaction.time,
+                                             transaction.ir or 'NULL', transaction.length)
+
+
+def diff(a, b, window=4096, match=8):
+    '''Print the differences of the transaction streams a and b, return the
+    number of differing regions'''
+    differ = Differ(window, match)
+    count = 0
+    skipped = [0, 0]
+    for region in differ.regions(a, b):
+        if count == 0:
+            print('first divergence:')
+            for name, transactions, side in (('a', region.a, differ.a), ('b', region.b, differ.b)):
+                if transactions:
+                    print('  ' + name + ' ' + show(transactions[0]))
+                else:
+                    # nothing skipped on this side, the other has more transactions
+                    print('  ' + name + ' ' + show(side.buffer[0] if side.buffer else None) + ' (matches after the region)')
+        count += 1
+        skipped[0] += len(region.a)
+        skipped[1] += len(region.b)
+        print('region {}: a {}, b {}'.format(count, describe(region.a), describe(region.b)))
+    print('{} matching transactions, {} differing regions, {} transactions of a and {} of b in them'.format(
+        differ.matched, count, skipped[0], skipped[1]))
+    return count
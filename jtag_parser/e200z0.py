@@ -0,0 +1,509 @@
+'''
+   Core decoding the OnCE commands of the e200z0 (MPC5xxx) debug interface
+
+'''
+
+from cores import JTAGCore
+
+
+class e200z0(JTAGCore):
+    # OnCE registers selected by the RS field of the OnCE command
+    registers = {0x02: 'JTAGID', 0x10: 'CPUSCR', 0x11: 'NRSBYPASS', 0x12: 'OCR',
+                 0x20: 'IAC1', 0x21: 'IAC2', 0x22: 'IAC3', 0x23: 'IAC4', 0x24: 'DAC1', 0x25: 'DAC2',
+                 0x2C: 'DBCNT', 0x30: 'DBSR', 0x31: 'DBCR0', 0x32: 'DBCR1', 0x33: 'DBCR2',
+                 0x6F: 'NEXUSCR', 0x7C: 'NEXUSACC', 0x7E: 'ENABLE_ONCE', 0x7F: 'BYPASS'}
+    registers.update((rs, 'GPREG{}'.format(rs - 0x70)) for rs in range(0x70, 0x7C))
+
+    # the data scans only depend on the last instruction, see select
+    parallel = True
+
+    # MemoryLog the memory accesses are recorded in, see track_memory
+    memory = None
+
+    # D form loads and stores: primary opcode -> (kind, size)
+    memory_instructions = {0x30000000: ('R', 1), 0x34000000: ('W', 1),
+                           0x58000000: ('R', 2), 0x5C000000: ('W', 2),
+                           0x50000000: ('R', 4), 0x54000000: ('W', 4)}
+
+    def __init__(self, watcher):
+        JTAGCore.__init__(self, watcher)
+        assert hasattr(self.watcher, 'writer'), 'Core was created before the writer was added to the watcher'
+
+        # add a variable for this core
+        self.corevar = self.watcher.writer.register_var('e200z0', 'core', 'string', init='unknown')
+        self.opvar = self.watcher.writer.register_var('e200z0', 'operation', 'string', init='unknown')
+        self.statvar = self.watcher.writer.register_var('e200z0', 'status', 'string', init='unknown')
+        self.warnvar = self.watcher.writer.register_var('e200z0', 'warning', 'wire', size=1, init=0)
+
+        self.gobit = False
+        self.exbit = False
+        self.ctl = 0
+        self.ir = 0
+        self.pc = 0
+        self.msr = 0
+        # values of the GPRs known from the instructions executed
+        self.gpr = {}
+        # (log position, rD, size) of a load waiting for its result
+        self.pendingload = None
+        # (register, time) of the last OnCE command, time of the last GO command
+        # not followed by the CPU being ready yet and DBSR reads since, see track_link
+        self.lastcommand = None
+        self.gotime = None
+        self.polls = 0
+
+    def defaultdata(self, simtime, dribits, drobits):
+        self.warning(simtime, 'data scan of an undecoded register')
+        self.watcher.writer.change(self.warnvar, simtime, 1)
+        JTAGCore.data(self, simtime, dribits, drobits)
+
+    def defaultdata_null(self, simtime):
+        self.warning(simtime, 'null data scan of an undecoded register')
+        self.watcher.writer.change(self.warnvar, simtime, 1)
+        JTAGCore.data_null(self, simtime)
+
+    def baddata(self, simtime, dribits, drobits):
+        print ("!!! executing bad len instruction at "+str(simtime))
+        self.warning(simtime, 'bad len instruction')
+        self.watcher.writer.change(self.warnvar, simtime, 1)
+
+    def baddata_null(self, simtime):
+        print ("!!! executing bad len instruction at "+str(simtime))
+        self.warning(simtime, 'bad len instruction')
+        self.watcher.writer.change(self.warnvar, simtime, 1)
+
+    def JTAGIDreaddata(self, simtime, dribits, drobits):
+        l = len(drobits)
+        assert l == 32, "JTAG ID not 32 bits"
+        jtagid = int(drobits[::-1], 2)
+        s = "JTAGIDread:"
+        s += "manuf="+hex((jtagid >> 1) & 0x7FF)
+        s += "-sn="+hex((jtagid >> 12) & 0x3FF)
+        s += "-center="+hex((jtagid >> 22) & 0x3F)
+        s += "-version="+hex((jtagid >> 28) & 0xF)
+        print(s)
+        self.count('operation', 'JTAGIDread')
+        self.watcher.writer.change(self.opvar, simtime, s)
+
+    def NRSBYPASSdata(self, simtime, dribits, drobits):
+        s = 'NRSBYPASS(' + str(len(dribits)) + ')'
+        self.count('operation', 'NRSBYPASS')
+        self.watcher.writer.change(self.opvar, simtime, s)
+
+    def NRSBYPASSdata_null(self, simtime):
+        s = 'NRSBYPASS(0)'
+        self.count('operation', 'NRSBYPASS')
+        self.watcher.writer.change(self.opvar, simtime, s)
+
+    def DBSRreaddata(self, simtime, dribits, drobits):
+        s = 'R-DBSR(' + str(len(dribits)) + ')'
+        self.count('operation', 'R-DBSR')
+        self.watcher.writer.change(self.opvar, simtime, s)
+
+    def DBSRreaddata_null(self, simtime):
+        print ('!!! empty reading of DBSR '+str(simtime))
+        self.warning(simtime, 'empty reading of DBSR')
+        self.watcher.writer.change(self.warnvar, simtime, 1)
+
+    def CPUSCRread(self, simtime, drobits):
+        l = len(drobits)
+        # register chain
+        regs = ['CTL', 'IR', 'PC', 'MSR', 'WBBRhi', 'WBBRlo']
+        # 32 oldest bits = drobits[0:32] -> WBBRlo
+        # 32 next   bits = drobits[32:64] -> WBBRhi etc...
+        a = [drobits[i: i + 32] for i in range(0, l, 32)]
+        # display in the order of the regs, so revert the array
+        for idx, b in enumerate(a[::-1]):
+            negoffset = idx - len(a)
+            print('  - {}(r) = '.format(regs[negoffset]) + b)
+            if negoffset == -1:
+                wbrrlo = int(b[::-1], 2)
+
+        print('Result of last instruction: ' + hex(wbrrlo))
+
+    def CPUSCRreaddata(self, simtime, dribits, drobits):
+        l = len(dribits)
+        assert (l & 0x1F) == 0
+        print ("CPUSCRread len="+str(len(dribits)))
+        self.track_memory(simtime, dribits, drobits, False)
+
+        self.CPUSCRread(simtime, drobits)
+
+        s = 'CPUSCRread(' + str(len(dribits)) + ')'
+        self.count('operation', 'CPUSCRread')
+        self.watcher.writer.change(self.corevar, simtime, s)
+        self.watcher.writer.change(self.opvar, simtime, s)
+
+    def CPUSCRwritedata(self, simtime, dribits, drobits):
+        l = len(dribits)
+        assert (l & 0x1F) == 0
+        print("CPUSCRwrite len="+str(len(dribits)))
+        self.track_memory(simtime, dribits, drobits, True)
+
+        # decrypt the data read out first
+        self.CPUSCRread(simtime, drobits)
+
+        # register chain
+        regs = ['CTL', 'IR', 'PC', 'MSR', 'WBBRhi', 'WBBRlo']
+        # 32 earliest bits = dribits[l-32:l] -> CTL
+        # 32 previous bits = dribits[l-64:l-32] -> IR etc...
+        a = [dribits[i: i + 32] for i in range(0, l, 32)[::-1]]
+        for idx, b in enumerate(a):
+            print('  - {}(w) = '.format(regs[idx]) + b)
+            if idx == 0:
+                self.ctl = int(b[::-1], 2)
+            elif idx == 1:
+                self.ir = int(b[::-1], 2)
+            elif idx == 2:
+                self.pc = int(b[::-1], 2)
+            elif idx == 3:
+                self.msr = int(b[::-1], 2)
+            elif idx == 4:
+                self.wbbrhi = int(b[::-1], 2)
+            elif idx == 5:
+                self.wbbrlo = int(b[::-1], 2)
+
+        if self.gobit:
+            ffra = (self.ctl >> 10) & 1
+            pcinv = (self.ctl >> 11) & 1
+            pcofst = (self.ctl >> 12) & 0xF
+
+            def twos_comp(val, bits):
+                """compute the 2's complement of int value val"""
+                if (val & (1 << (bits - 1))) != 0: # if sign bit is set e.g., 8bit: 128-255
+                    val = val - (1 << bits)        # compute negative value
+                return val
+
+            def se_lbz():
+                pass
+
+            def sd4_form(ir, func):
+                pass
+
+            def se_bc(bo16, bi16, bd8):
+                return 'se_bc ' + str(bo16) + ',' + str(bi16) + ',' + '+' + str(twos_comp(bd8 << 2, 9))
+
+            def bd8_bo16_form(ir, func):
+                bo16 = (ir >> 26) & 1
+                bi16 = (ir >> 24) & 3
+                bd8  = (ir >> 16) & 0xFF
+                return func(bo16, bi16, bd8)
+
+            def e_ori(rs, ra, rc, sci8):
+                s = 'ori'
+                if rc:
+                    s += '.'
+                s += ' ' + ', '.join((ra, rs, str(sci8)))
+                return s
+
+            def sci8_rc_form(ir, func):
+                rs = (ir >> 21) & 0x1F
+                ra = (ir >> 16) & 0x1F
+                rc  = (ir >> 11) & 1
+                f = (ir >> 10) & 1
+                scl = (ir >> 8) & 3
+                ui8 = (ir >> 0) & 0xFF
+                sci8 = 0
+                if f == 1:
+                    sci8 = 2**64 - 1
+                    sci8 &= ~(0xFF << (scl * 8))
+                sci8 |= ui8 << (scl * 8)
+                ra = 'r' + str(ra)
+                if ffra:
+                    rs = 'wbbrlo({:08x})'.format(self.wbbrlo)
+                else:
+                    rs = 'r' + str(rs)
+                return func(rs, ra, rc, sci8)
+
+            def e_stb(rs, ra, d):
+                return 'e_stb ' + rs + ', ' + str(d) + '(' + ra + ')'
+
+            def e_lwz(rs, ra, d):
+                return 'e_lwz ' + rs + ', ' + str(d) + '(' + ra + ')'
+
+            def d_form(ir, func):
+                rs = (ir >> 21) & 0x1F
+                ra = (ir >> 16) & 0x1F
+                d = (ir >> 0) & 0xFFFF
+                d = twos_comp(d, 16)
+                rs = 'r' + str(rs)
+                if ffra:
+                    ra = 'wbbrlo({:08x})'.format(self.wbbrlo)
+                else:
+                    ra = 'r' + str(ra)
+                return func(rs, ra, d)
+
+            def mtcrf(rs, fxm):
+                assert (fxm & 0x200) == 0, 'The mtcrf 11th bit is not 0 : ' + hex(fxm)
+                fxm = fxm >> 1
+                return 'mtcrf ' + hex(fxm & 0x1FF) + ', ' + rs
+
+            def xfx_form(ir, func):
+                rt = 'r' + str((ir >> 21) & 0x1F)
+                spr = (ir >> 11) & 0x3FF
+                return func(rt, spr)
+
+            xF0000000 = {0x80000000: (sd4_form, se_lbz)}
+            xF8000000 = {0xE0000000: (bd8_bo16_form, se_bc)}
+            xFC000000 = {0x34000000: (d_form, e_stb), 0x50000000: (d_form, e_lwz)}
+            xFC00F000 = {0x1800D000: (sci8_rc_form, e_ori)}
+            xFC0007FE = {0x7C000120: (xfx_form, mtcrf)}
+
+
+            filters = [(0xF0000000, xF0000000),
+                       (0xF8000000, xF8000000),
+                       (0xFC000000, xFC000000),
+                       (0xFC00F000, xFC00F000),
+                       (0xFC0007FE, xFC0007FE),
+                       ]
+
+            s = ''
+            for m, f in filters:
+                try:
+                    (form, func) = f[self.ir & m]
+                    s = form(self.ir, func)
+                    break
+                except KeyError:
+                    pass
+
+            if s != '':
+                print('Executing ' + hex(self.ir) + ' : ' + s)
+                self.count('instruction', s.split()[0])
+            else:
+                print('!!!Unknown instruction: ' + hex(self.ir))
+                self.warning(simtime, 'unknown instruction ' + hex(self.ir))
+                self.watcher.writer.change(self.warnvar, simtime, 1)
+
+        if self.gobit and l == 192:
+            # a load or a store executed moves data to or from the memory
+            access = self.memory_instructions.get(int(dribits[128:160][::-1], 2) & 0xFC000000)
+            if access is not None:
+                self.transfer(simtime, access[1])
+
+        s = 'CPUSCRwrite(' + str(len(dribits)) + ')'
+        self.count('operation', 'CPUSCRwrite')
+        self.watcher.writer.change(self.corevar, simtime, s)
+        self.watcher.writer.change(self.opvar, simtime, s)
+
+    def track_memory(self, simtime, dribits, drobits, write):
+        '''Stateful part of the CPUSCR scans: follow the GPRs set by the
+        instructions executed and record their memory accesses in memory'''
+        if self.memory is None:
+            return
+        if self.pendingload is not None and len(drobits) >= 32:
+            # the result of the last instruction is read out in WBBRlo
+            (position, rd, size) = self.pendingload
+            value = int(drobits[0:32][::-1], 2) & ((1 << (8 * size)) - 1)
+            self.memory.complete(position, value)
+            self.gpr[rd] = value
+            self.pendingload = None
+        if not write or not self.gobit or len(dribits) != 192:
+            return
+
+        (wbbrlo, wbbrhi, msr, pc, ir, ctl) = [int(dribits[i: i + 32][::-1], 2) for i in range(0, 192, 32)]
+        ffra = (ctl >> 10) & 1
+        rs = (ir >> 21) & 0x1F
+        ra = (ir >> 16) & 0x1F
+        access = self.memory_instructions.get(ir & 0xFC000000)
+        if (ir & 0xFC00F000) == 0x1800D000:
+            # e_ori rA, rS, SCI8: WBBRlo is fed forward as rS
+            source = wbbrlo if ffra else self.gpr.get(rs)
+            scl = (ir >> 8) & 3
+            sci8 = (ir & 0xFF) << (scl * 8)
+            if (ir >> 10) & 1:
+                sci8 |= 0xFFFFFFFF & ~(0xFF << (scl * 8))
+            if source is None:
+                self.gpr.pop(ra, None)
+            else:
+                self.gpr[ra] = (source | sci8) & 0xFFFFFFFF
+        elif access is not None:
+            # D(rA): WBBRlo is fed forward as rA, rA = 0 is the value 0
+            (kind, size) = access
+            if ffra:
+                base = wbbrlo
+            elif ra == 0:
+                base = 0
+            else:
+                base = self.gpr.get(ra)
+            if base is None:
+                self.warning(simtime, 'memory access at an unknown address')
+                if kind == 'R':
+                    self.gpr.pop(rs, None)
+                return
+            d = ir & 0xFFFF
+            if d & 0x8000:
+                d -= 0x10000
+            address = (base + d) & 0xFFFFFFFF
+            if kind == 'W':
+                value = self.gpr.get(rs)
+                if value is not None:
+                    value &= (1 << (8 * size)) - 1
+                self.memory.add(simtime, kind, address, size, value)
+            else:
+                self.pendingload = (self.memory.add(simtime, kind, address, size), rs, size)
+        elif (ir & 0xF8000000) != 0xE0000000 and (ir & 0xFC0007FE) != 0x7C000120:
+            # neither se_bc nor mtcrf, the GPRs it changes are unknown
+            self.gpr = {}
+
+    def track_link(self, simtime, iribits, irobits, report):
+        '''Stateful part of the OnCE commands for the analytics: the time from a
+        command to the next one, and from a GO command to the CPU being ready
+        again, with the DBSR reads polling it, are measured if report is set.
+        The CPU is ready when the OSR shows the debug mode, or when the next
+        command is not a DBSR read'''
+        name = self.register_name(iribits)
+        if self.lastcommand is not None and report:
+            self.measure('once ' + self.lastcommand[0], simtime - self.lastcommand[1])
+        self.lastcommand = (name, simtime)
+        if self.gotime is not None:
+            if name == 'DBSR':
+                self.polls += 1
+            if name != 'DBSR' or int(irobits, 2) & (1 << 6):
+                if report:
+                    self.measure('go latency', simtime - self.gotime)
+                    self.measure('dbsr polls', self.polls)
+                self.gotime = None
+        if self.gobit:
+            self.gotime = simtime
+            self.polls = 0
+
+    # attributes making the state of the core
+    state_attributes = ('gobit', 'exbit', 'ctl', 'ir', 'pc', 'msr', 'wbbrhi', 'wbbrlo', 'gpr', 'pendingload',
+                        'lastcommand', 'gotime', 'polls')
+
+    def checkpoint(self):
+        state = dict((a, getattr(self, a)) for a in self.state_attributes if hasattr(self, a))
+        # changed in place afterwards
+        state['gpr'] = dict(self.gpr)
+        # the data handlers are selected by the last instruction
+        for a in ('data', 'data_null'):
+            if a in self.__dict__:
+                state[a] = getattr(self, a).__name__
+        return state
+
+    def restore(self, state):
+        for a, v in state.items():
+            if a in ('data', 'data_null'):
+                v = getattr(self, v)
+            setattr(self, a, v)
+
+    def register_name(self, iribits):
+        if len(iribits) != 10:
+            return None
+        rs = int(iribits[7::-1], 2)
+        return self.registers.get(rs, '!!!!{}'.format(rs))
+
+    def select(self, simtime, iribits):
+        '''Stateful part of instruction: select the data handlers and the GO
+        and EX bits the next data scans are decoded with'''
+        self.data = self.defaultdata
+        self.data_null = self.defaultdata_null
+        if len(iribits) != 10:
+            return
+
+        rw = iribits[9]
+        go = iribits[8]
+        ex = iribits[7]
+        rs = int(iribits[7::-1], 2)
+
+        if go == '1' and rs in (0x10, 0x11):
+            self.gobit = True
+            # EX is executed only if GO is valid
+            self.exbit = ex == '1'
+        else:
+            self.gobit = False
+            self.exbit = False
+        if rs == 2:
+            assert rw == '1', "Forbidden write access to JTAG ID register at "+ str(simtime)
+            self.data = self.JTAGIDreaddata
+        elif rs == 0x10:
+            if rw == '1':
+                self.data = self.CPUSCRreaddata
+            else:
+                self.data = self.CPUSCRwritedata
+        elif rs == 0x11:
+            self.data = self.NRSBYPASSdata
+            self.data_null = self.NRSBYPASSdata_null
+        elif rs == 0x30:
+            assert rw == '1', "Forbidden write access to DBSR register at "+ str(simtime)
+            self.data = self.DBSRreaddata
+            self.data_null = self.DBSRreaddata_null
+
+    def advance(self, name, simtime, args):
+        # only the instructions change what the next scans are decoded with
+        if name == 'instruction':
+            self.select(simtime, args[0])
+            if len(args[0]) == 10:
+                self.track_link(simtime, args[0], args[1], False)
+        elif name == 'data' and self.memory is not None:
+            # the memory log is only kept by this core, not by the pool ones
+            if self.data == self.CPUSCRwritedata:
+                self.track_memory(simtime, args[0], args[1], True)
+            elif self.data == self.CPUSCRreaddata:
+                self.track_memory(simtime, args[0], args[1], False)
+
+    def instruction(self, simtime, iribits, irobits):
+        ir_i = int(iribits, 2)
+        ir_o = int(irobits, 2)
+
+        if len(iribits) != 10:
+            self.select(simtime, iribits)
+            s = 'BADLEN-iri=' + iribits + '-iro=' + irobits
+            print(str(simtime) + ': BADLEN instruction ' + str(len(iribits)) + 'bits iri=' + iribits + ' iro=' + irobits)
+            self.watcher.writer.change(self.corevar, simtime, s)
+
+            self.warning(simtime, 'BADLEN instruction of ' + str(len(iribits)) + ' bits')
+            self.watcher.writer.change(self.warnvar, simtime, 1)
+            return
+
+        self.watcher.writer.change(self.warnvar, simtime, 0)
+
+        # check the format is correct
+        assert irobits[0:2] == '10', 'OnCE status register not compliant: ' + irobits
+
+        self.select(simtime, iribits)
+        self.track_link(simtime, iribits, irobits, True)
+
+        rw = iribits[9]
+        rs = int(iribits[7::-1], 2)
+
+        s = 'OCMD='
+        # rw is ignored in NRSBYPASS
+        if rs not in (0x11, ):
+            if rw == '1':
+                s += 'R-'
+            else:
+                s += 'W-'
+        if self.gobit:
+            s += 'GO-'
+        if self.exbit:
+            s += 'EX-'
+        name = self.register_name(iribits)
+        s += name
+
+        if ir_o & (1 << 0):
+            osr = 'MCLKa'
+        else:
+            osr = 'MCLKi'
+        if ir_o & (1 << 1):
+            osr += '-ERR'
+        if ir_o & (1 << 2):
+            osr += '-CHKosrOP'
+        if ir_o & (1 << 3):
+            osr += '-RESET'
+        if ir_o & (1 << 4):
+            osr += '-HALT'
+        if ir_o & (1 << 5):
+            osr += '-STOP'
+        if ir_o & (1 << 6):
+            osr += '-DEBUG'
+        if ir_o & (1 << 7):
+            osr += '-WAIT'
+
+        self.count('register', name)
+        self.count('osr', osr)
+        s += '-OSR=' + osr
+        print(str(simtime) + ": instruction " + s)
+        self.watcher.writer.change(self.corevar, simtime, s)
+
+        # this was just a status read until execution
+        self.watcher.writer.change(self.statvar, simtime, osr)
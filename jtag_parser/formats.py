@@ -0,0 +1,113 @@
+'''
+   Formats of the scanned bits in the output VCD
+
+   The jtag variable of the output holds a text for every IR and DR scan.
+   Spelling out every bit shifted in and out, as the bits format does, makes
+   a 10000 bits boundary scan a 20000 characters value; the other formats
+   keep the output and the viewers fast on long scans:
+
+   - hex: the bits in hexadecimal, followed by the length of the scan
+   - truncated: the first bits only, followed by the length when it is over
+   - vector: the bits in vector variables tdi and tdo, with the length of the
+     scan in the length variable, the jtag variable only tells the kind and
+     the length of the scan
+
+   In the hex and vector formats the first bit shifted is the least
+   significant one, as in the register it is shifted into.  An x or z bit
+   makes its hex digit an x, and is an x or z of the vectors.
+
+'''
+
+
+class BitsFormat(object):
+    '''Every bit, the first one shifted first, as sampled on TDI and TDO'''
+
+    def encode(self, bits):
+        return bits
+
+    def length(self, bits):
+        return ''
+
+    def instruction(self, simtime, iribits, irobits):
+        return 'ir_i=' + self.encode(iribits) + '-ir_o=' + self.encode(irobits) + self.length(iribits)
+
+    def instruction_null(self, simtime):
+        return 'ir=NULL'
+
+    def data(self, simtime, dribits, drobits):
+        return 'in=' + self.encode(dribits) + '-out=' + self.encode(drobits) + self.length(dribits)
+
+    def data_null(self, simtime):
+        return 'in=NULL-out=NULL'
+
+
+class HexFormat(BitsFormat):
+    '''The bits in hexadecimal, the first one shifted being the least significant'''
+
+    def encode(self, bits):
+        if bits.strip('01'):
+            # x or z bits, the digits are made 4 bits at a time
+            bits = bits + '0' * (-len(bits) % 4)
+            return '0x' + ''.join('{:x}'.format(int(d, 2)) if not d.strip('01') else 'x'
+                                  for d in (bits[k:k + 4][::-1] for k in range(len(bits) - 4, -4, -4)))
+        return '0x{:0{}x}'.format(int(bits[::-1], 2), (len(bits) + 3) // 4)
+
+    def length(self, bits):
+        return '-len=' + str(len(bits))
+
+
+class TruncatedFormat(BitsFormat):
+    '''The first width bits only'''
+
+    def __init__(self, width):
+        self.width = width
+
+    def encode(self, bits):
+        if len(bits) <= self.width:
+            return bits
+        return bits[:self.width] + '..'
+
+    def length(self, bits):
+        if len(bits) <= self.width:
+            return ''
+        return '-len=' + str(len(bits))
+
+
+class VectorFormat(BitsFormat):
+    '''The bits in the tdi and tdo vector variables of width bits, the first one
+    shifted being bit 0, the length of the scan in the length variable'''
+
+    def __init__(self, writer, scope, width):
+        self.writer = writer
+        self.width = width
+        self.mask = (1 << width) - 1
+        self.tdivar = writer.register_var(scope, 'tdi', 'reg', size=width)
+        self.tdovar = writer.register_var(scope, 'tdo', 'reg', size=width)
+        self.lengthvar = writer.register_var(scope, 'length', 'integer', size=32, init=0)
+
+    def vector(self, bits):
+        if bits.strip('01'):
+            # x or z bits, the writer takes them in a string of the first width bits, bit 0 last
+            return bits[:self.width][::-1]
+        return int(bits[::-1], 2) & self.mask
+
+    def vectors(self, simtime, ibits, obits):
+        self.writer.change(self.tdivar, simtime, self.vector(ibits))
+        self.writer.change(self.tdovar, simtime, self.vector(obits))
+        self.writer.change(self.lengthvar, simtime, len(ibits))
+
+    def instruction(self, simtime, iribits, irobits):
+        self.vectors(simtime, iribits, irobits)
+        return 'ir(' + str(len(iribits)) + ')'
+
+    def instruction_null(self, simtime):
+        self.writer.change(self.lengthvar, simtime, 0)
+        return 'ir=NULL'
+
+    def data(self, simtime, dribits, drobits):
+        self.vectors(simtime, dribits, drobits)
+        return 'dr(' + str(len(dribits)) + ')'
+
+    def data_null(self, simtime):
+        self.writer.change(self.lengthvar, simtime, 0)
+        return 'in=NULL-out=NULL'
@@ -0,0 +1,512 @@
+'''
+   Level of detail index of the transactions of a capture
+
+   The decoded VCD of a long capture holds millions of changes of the jtag
+   and tap_state strings: a viewer zoomed out on it crawls, and finding the
+   transactions of a time range means scanning it again.  The LodRecorder
+   stage saves, while the capture is decoded, an index answering both in
+   logarithmic time.  A transaction is a DR scan with the IR scan in effect,
+   as for the queries.
+
+   The time axis is cut in buckets of a power of two width, the finest ones
+   at level 0, each level merging the buckets of the one below by pairs,
+   until a single bucket covers the whole capture.  A bucket holds the
+   number of transactions in it, the dominant command (the register named
+   by the core for the IR in effect, the IR bits when it names none) and
+   the number of warnings the cores reported in it.  Only the buckets with
+   transactions or warnings are saved, so that the index does not depend on
+   the idle time of the capture.
+
+   The transactions are saved in time order as fixed size records pointing
+   to their bits, with the number of the first transaction of every level 0
+   bucket as the time to transaction offset table.  The records and the
+   closed level 0 buckets are streamed to disk while the capture is decoded,
+   the levels above are merged from them at the end: the memory does not
+   depend on the length of the capture.
+
+     magic       'JTAGLOD1'
+     bits        the IR in, IR out, DR in and DR out bits of the transactions,
+                 packed big endian in whole bytes, the x and z bits as 0;
+                 followed by the same four fields with the x and z bits as 1
+                 when the transaction has any
+     records     u64 time, u64 offset of the bits, u32 DR length, u16 IR
+                 length, u16 command, u8 flags (1: warning, 2: no IR scan,
+                 4: x or z bits)
+     levels      u64 bucket number, u32 transactions, u32 warnings,
+                 u16 dominant command (0xFFFF: no transaction)
+     offsets     u64 bucket number, u64 first transaction
+     header      JSON: timescale and time unit of the input, log2 of the width
+                 of the level 0 buckets, commands, position and length of
+                 every table
+     trailer     u32 length of the header
+
+   The times are the ones of the input.  The file is read with LodIndex.load,
+   python -m jtag_parser.lod FILE queries it.
+
+'''
+
+import os
+import json
+import mmap
+import shutil
+import struct
+import marshal
+import binascii
+import tempfile
+from collections import deque, namedtuple
+
+from stages import JTAGStage
+
+MAGIC = b'JTAGLOD1'
+transaction_record = struct.Struct('<QQIHHB')
+bucket_record = struct.Struct('<QIIH')
+offset_record = struct.Struct('<QQ')
+trailer = struct.Struct('<I')
+
+NO_COMMAND = 0xFFFF
+WARNING = 1
+NO_IR = 2
+UNKNOWN = 4
+
+LodBucket = namedtuple('LodBucket', 'start end transactions warnings command')
+
+LodTransaction = namedtuple('LodTransaction', 'time iribits irobits command dribits drobits warning')
+
+
+def pack_bits(bits):
+    if not bits:
+        return b''
+    if bits.strip('01'):
+        bits = ''.join(b if b in '01' else '0' for b in bits)
+    return binascii.unhexlify('{:0{}x}'.format(int(bits, 2), (len(bits) + 7) // 8 * 2))
+
+
+def unknown_bits(bits):
+    '''bits with the x and z bits as 1, the others as 0'''
+    return ''.join('0' if b in '01' else '1' for b in bits)
+
+
+def unpack_bits(data, length):
+    if not length:
+        return ''
+    return bin(int(binascii.hexlify(data), 16))[2:].zfill(length)[-length:]
+
+
+def marshalled(ifile):
+    '''Generate the objects marshalled in ifile, from its start'''
+    ifile.seek(0)
+    while True:
+        try:
+            yield marshal.load(ifile)
+        except EOFError:
+            return
+
+
+def merged(level):
+    '''Generate the buckets of the level above the sorted (number, transactions,
+    warnings, {command: transactions}) of level'''
+    parent = None
+    for (number, n, w, commands) in level:
+        if parent is not None and parent[0] == number >> 1:
+            parent[1] += n
+            parent[2] += w
+            for command, count in commands.items():
+                parent[3][command] = parent[3].get(command, 0) + count
+        else:
+            if parent is not None:
+                yield tuple(parent)
+            parent = [number >> 1, n, w, dict(commands)]
+    if parent is not None:
+        yield tuple(parent)
+
+
+def dominant(commands):
+    '''Command with the most transactions, the first one on a tie'''
+    if not commands:
+        return NO_COMMAND
+    return min(commands, key=lambda command: (-commands[command], command))
+
+
+class LodRecorder(JTAGStage):
+    '''Stage recording the transactions in a level of detail index at path,
+    written in path.tmp until finish renames it, the transaction records in
+    path.records.tmp until then.  The level 0 buckets are 2**shift times of
+    the input wide, only the one of the last transaction is kept in memory.
+    It takes the place of the collector of the watcher to see the warnings,
+    and passes everything to collector.
+
+    The warnings may come from another thread, after later transactions, when
+    the cores are decoded by a pipeline or parallel stage: they are queued and
+    applied by the next transaction or by finish, in the thread of the decode.
+    They come in time order'''
+
+    # the index being written is not part of the state
+    checkpointable = False
+
+    def __init__(self, nextstage, core, watcher, path, shift=10, collector=None):
+        JTAGStage.__init__(self, nextstage)
+        self.core = core
+        self.watcher = watcher
+        self.path = path
+        self.shift = shift
+        self.collector = collector
+        self.ofile = open(path + '.tmp', 'wb')
+        self.ofile.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.records = open(path + '.records.tmp', 'w+b')
+        self.transactions = 0
+        self.commands = []
+        self.command_numbers = {}
+        # bucket of the last transaction: [number, first transaction, transactions, {command: transactions}]
+        self.bucket = None
+        # the closed ones, marshalled as tuples
+        self.buckets = tempfile.TemporaryFile()
+        # times of the warnings not applied yet
+        self.pending = deque()
+        # bucket of the last warning: [number, warnings], the closed ones marshalled as tuples
+        self.warned = None
+        self.warnings = tempfile.TemporaryFile()
+        # IR scan in effect: (iribits, irobits, command), iribits is None for a null scan
+        self.lastir = None
+
+    def count(self, counter, key):
+        if self.collector is not None:
+            self.collector.count(counter, key)
+
+    def warning(self, simtime, text):
+        self.pending.append(simtime)
+        if self.collector is not None:
+            self.collector.warning(simtime, text)
+
+    def apply_warnings(self):
+        while self.pending:
+            simtime = self.pending.popleft()
+            self.flag(simtime)
+            number = simtime >> self.shift
+            if self.warned is not None and self.warned[0] == number:
+                self.warned[1] += 1
+            else:
+                if self.warned is not None:
+                    marshal.dump(tuple(self.warned), self.warnings)
+                self.warned = [number, 1]
+
+    def flag(self, simtime):
+        '''Set the warning flag of the last transaction at simtime, if any.  The
+        warnings of the parallel cores come after later transactions, the
+        records being in time order it is found by bisection in the file'''
+        self.records.flush()
+        low, high = 0, self.transactions
+        while low < high:
+            middle = (low + high) // 2
+            self.records.seek(middle * transaction_record.size)
+            if struct.unpack('<Q', self.records.read(8))[0] <= simtime:
+                low = middle + 1
+            else:
+                high = middle
+        if low:
+            position = (low - 1) * transaction_record.size
+            self.records.seek(position)
+            record = list(transaction_record.unpack(self.records.read(transaction_record.size)))
+            if record[0] == simtime:
+                record[5] |= WARNING
+                self.records.seek(position)
+                self.records.write(transaction_record.pack(*record))
+        self.records.seek(0, os.SEEK_END)
+
+    def command(self, name):
+        number = self.command_numbers.get(name)
+        if number is None:
+            number = self.command_numbers[name] = len(self.commands)
+            self.commands.append(name)
+        return number
+
+    def instruction(self, simtime, iribits, irobits):
+        name = self.core.register_name(iribits)
+        self.lastir = (iribits, irobits, self.command(name or 'IR ' + iribits))
+        self.nextstage.instruction(simtime, iribits, irobits)
+
+    def instruction_null(self, simtime):
+        self.lastir = (None, None, self.command('IR NULL'))
+        self.nextstage.instruction_null(simtime)
+
+    def data(self, simtime, dribits, drobits):
+        self.record(simtime, dribits, drobits)
+        self.nextstage.data(simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        self.record(simtime, '', '')
+        self.nextstage.data_null(simtime)
+
+    def record(self, simtime, dribits, drobits):
+        self.apply_warnings()
+        if self.lastir is None:
+            (iribits, irobits, command) = (None, None, self.command('no IR'))
+        else:
+            (iribits, irobits, command) = self.lastir
+        fields = (iribits or '', irobits or '', dribits, drobits)
+        flags = NO_IR if iribits is None else 0
+        bits = b''.join(pack_bits(b) for b in fields)
+        if any(b.strip('01') for b in fields):
+            flags |= UNKNOWN
+            bits += b''.join(pack_bits(unknown_bits(b)) for b in fields)
+        self.ofile.write(bits)
+        self.records.write(transaction_record.pack(simtime, self.offset, len(dribits), len(iribits or ''),
+                                                   command, flags))
+        self.offset += len(bits)
+        number = simtime >> self.shift
+        if self.bucket is None or self.bucket[0] != number:
+            self.close_bucket()
+            self.bucket = [number, self.transactions, 0, {}]
+        self.bucket[2] += 1
+        self.bucket[3][command] = self.bucket[3].get(command, 0) + 1
+        self.transactions += 1
+
+    def close_bucket(self):
+        if self.bucket is not None:
+            marshal.dump(tuple(self.bucket), self.buckets)
+            self.bucket = None
+
+    def level0(self):
+        '''Generate the level 0 buckets with transactions or warnings, as
+        (number, first transaction, transactions, warnings, {command:
+        transactions}), from the closed buckets and warnings'''
+        warnings = marshalled(self.warnings)
+        warned = next(warnings, None)
+        for (number, first, n, commands) in marshalled(self.buckets):
+            while warned is not None and warned[0] < number:
+                yield (warned[0], None, 0, warned[1], {})
+                warned = next(warnings, None)
+            w = 0
+            if warned is not None and warned[0] == number:
+                w = warned[1]
+                warned = next(warnings, None)
+            yield (number, first, n, w, commands)
+        while warned is not None:
+            yield (warned[0], None, 0, warned[1], {})
+            warned = next(warnings, None)
+
+    def finish(self, complete):
+        '''Save the index if the capture was decoded until its end, drop it otherwise'''
+        self.apply_warnings()
+        self.close_bucket()
+        if self.warned is not None:
+            marshal.dump(tuple(self.warned), self.warnings)
+            self.warned = None
+        self.records.close()
+        self.ofile.close()
+        if not complete:
+            self.buckets.close()
+            self.warnings.close()
+            os.remove(self.path + '.records.tmp')
+            os.remove(self.path + '.tmp')
+            return
+        self.ofile = open(self.path + '.tmp', 'ab')
+        header = {'timescale': getattr(self.watcher.parser, 'timescale', None),
+                  'time_unit': self.watcher.parser.time_unit,
+                  'shift': self.shift, 'commands': self.commands, 'levels': [],
+                  'transactions': [self.offset, self.transactions]}
+        with open(self.path + '.records.tmp', 'rb') as records:
+            shutil.copyfileobj(records, self.ofile)
+        os.remove(self.path + '.records.tmp')
+        self.offset += self.transactions * transaction_record.size
+
+        # the offsets are written with level 0, copied after the levels
+        offsets = tempfile.TemporaryFile()
+
+        def level0():
+            for (number, first, n, w, commands) in self.level0():
+                if first is not None:
+                    offsets.write(offset_record.pack(number, first))
+                yield (number, n, w, commands)
+
+        # each level is saved in the index and marshalled in below to be merged into the next one
+        level = level0()
+        below = None
+        while True:
+            above = tempfile.TemporaryFile()
+            count = number = 0
+            for bucket in level:
+                (number, n, w, commands) = bucket
+                self.ofile.write(bucket_record.pack(number, n, w, dominant(commands)))
+                marshal.dump(bucket, above)
+                count += 1
+            header['levels'].append([self.offset, count])
+            self.offset += count * bucket_record.size
+            if below is not None:
+                below.close()
+            below = above
+            if count <= 1 and number == 0:
+                break
+            level = merged(marshalled(below))
+        below.close()
+        self.buckets.close()
+        self.warnings.close()
+        header['offsets'] = [self.offset, offsets.tell() // offset_record.size]
+        offsets.seek(0)
+        shutil.copyfileobj(offsets, self.ofile)
+        offsets.close()
+        self.offset += header['offsets'][1] * offset_record.size
+        header = json.dumps(header).encode('ascii')
+        self.ofile.write(header + trailer.pack(len(header)))
+        self.ofile.close()
+        os.rename(self.path + '.tmp', self.path)
+
+
+class LodIndex(object):
+    '''Reader of a level of detail index, the tables are searched where they
+    are in the memory-mapped file'''
+
+    def __init__(self, data):
+        self.data = data
+        (length,) = trailer.unpack_from(data, len(data) - trailer.size)
+        header = json.loads(data[len(data) - trailer.size - length:len(data) - trailer.size].decode('ascii'))
+        self.timescale = header['timescale'] and str(header['timescale'])
+        self.time_unit = header['time_unit']
+        self.shift = header['shift']
+        self.commands = [str(c) for c in header['commands']]
+        self.levels = header['levels']
+        self.transactions = header['transactions']
+        self.offsets = header['offsets']
+        # time of the last transaction
+        self.last = self.transaction(self.transactions[1] - 1).time if self.transactions[1] else 0
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as ifile:
+            data = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(MAGIC)] != MAGIC:
+            data.close()
+            raise ValueError('Not a level of detail index: ' + path)
+        return cls(data)
+
+    def close(self):
+        self.data.close()
+
+    def search(self, table, record, value, low=0, high=None):
+        '''First record of table from low to high (excluded) whose first field is
+        not below value, by bisection'''
+        (position, count) = table
+        if high is None:
+            high = count
+        while low < high:
+            middle = (low + high) // 2
+            if record.unpack_from(self.data, position + middle * record.size)[0] < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def level_for(self, start, end, width):
+        '''Lowest level with at most width buckets from start to end'''
+        for level in range(len(self.levels)):
+            if ((end >> (self.shift + level)) - (start >> (self.shift + level))) < width:
+                return level
+        return len(self.levels) - 1
+
+    def view(self, start, end, width=1000, level=None):
+        '''LodBucket of the level giving at most width buckets from start to
+        end (included), the lowest one by default.  The buckets without
+        transactions or warnings are not returned'''
+        if level is None:
+            level = self.level_for(start, end, width)
+        shift = self.shift + level
+        table = self.levels[level]
+        buckets = []
+        for k in range(self.search(table, bucket_record, start >> shift), table[1]):
+            (number, n, w, command) = bucket_record.unpack_from(self.data, table[0] + k * bucket_record.size)
+            if number > end >> shift:
+                break
+            buckets.append(LodBucket(number << shift, ((number + 1) << shift) - 1, n, w,
+                                     None if command == NO_COMMAND else self.commands[command]))
+        return buckets
+
+    def transaction(self, k):
+        (position, count) = self.transactions
+        (time, offset, drlength, irlength, command, flags) = transaction_record.unpack_from(
+            self.data, position + k * transaction_record.size)
+        bits = []
+        for length in (irlength, irlength, drlength, drlength):
+            size = (length + 7) // 8
+            bits.append(unpack_bits(self.data[offset:offset + size], length))
+            offset += size
+        if flags & UNKNOWN:
+            for k, length in enumerate((irlength, irlength, drlength, drlength)):
+                size = (length + 7) // 8
+                unknown = unpack_bits(self.data[offset:offset + size], length)
+                bits[k] = ''.join('x' if u == '1' else b for b, u in zip(bits[k], unknown))
+                offset += size
+        if flags & NO_IR:
+            bits[0] = bits[1] = None
+        return LodTransaction(time, bits[0], bits[1], self.commands[command], bits[2], bits[3],
+                              bool(flags & WARNING))
+
+    def between(self, start, end):
+        '''Generate the LodTransaction from start to end (included), the offset
+        table giving the first one of the bucket of start'''
+        (position, count) = self.transactions
+        b = self.search(self.offsets, offset_record, start >> self.shift)
+        if b == self.offsets[1]:
+            return
+        first = offset_record.unpack_from(self.data, self.offsets[0] + b * offset_record.size)[1]
+        last = count
+        if b + 1 < self.offsets[1]:
+            last = offset_record.unpack_from(self.data, self.offsets[0] + (b + 1) * offset_record.size)[1]
+        # skip the transactions of the bucket before start
+        first = self.search(self.transactions, transaction_record, start, first, last)
+        for k in range(first, count):
+            transaction = self.transaction(k)
+            if transaction.time > end:
+                return
+            yield transaction
+
+
+def show_bits(bits):
+    return hex(int(bits, 2)) if not bits.strip('01') else bits
+
+
+def show(transaction):
+    t = transaction
+    ir = 'ir=NULL' if t.iribits is None else 'ir_i=' + t.iribits + '-ir_o=' + t.irobits
+    if t.dribits == '':
+        dr = 'data NULL'
+    else:
+        dr = 'data ' + str(len(t.dribits)) + 'bits in=' + show_bits(t.dribits) + ' out=' + show_bits(t.drobits)
+    return str(t.time) + ': ' + ir + '(' + t.command + ') ' + dr + (' WARNING' if t.warning else '')
+
+
+def main(argv=None):
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python -m jtag_parser.lod',
+        description='Query a level of detail index saved by jtag_parse.py --lod')
+    argparser.add_argument('indexfile', help='the level of detail index')
+    argparser.add_argument('--start', type=int, default=0, help='from this time of the input')
+    argparser.add_argument('--end', type=int, help='until this time of the input (default: the last transaction)')
+    argparser.add_argument('--width', type=int, default=100,
+        help='at most this number of buckets in the view (default 100)')
+    argparser.add_argument('--level', type=int, help='view of this level instead of the one given by --width')
+    argparser.add_argument('--transactions', action='store_true',
+        help='list the transactions instead of the buckets')
+    my_args = argparser.parse_args(argv)
+
+    index = LodIndex.load(my_args.indexfile)
+    if my_args.end is None:
+        my_args.end = index.last
+    try:
+        if my_args.level is not None and not 0 <= my_args.level < len(index.levels):
+            argparser.error('--level must be from 0 to ' + str(len(index.levels) - 1))
+        if my_args.transactions:
+            for transaction in index.between(my_args.start, my_args.end):
+                print(show(transaction))
+        else:
+            for b in index.view(my_args.start, my_args.end, my_args.width, my_args.level):
+                print('{}-{}: {} transactions, {} warnings, {}'.format(b.start, b.end, b.transactions,
+                                                                     b.warnings, b.command or '-'))
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
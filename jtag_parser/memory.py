@@ -0,0 +1,177 @@
+'''
+   Target memory reconstructed from the debug traffic
+
+   A debugger reads and writes the memory of the target by making the core
+   execute load and store instructions.  A core decoding them records the
+   accesses in a MemoryLog, in time order: (time, kind, address, size,
+   value), kind being 'R' or 'W' and value None when the data is not known.
+
+   Every byte address touched is indexed with the times and positions of
+   the reads and of the writes covering it, so that the last write to an
+   address before a time is a bisection, and the accesses to a range of
+   addresses a bisection in the sorted byte addresses.  The image holds the
+   last known value of every byte, the target being big endian.
+
+   The log is saved in a compact binary file, read back with MemoryLog.load
+   for the analysis, without decoding the capture again:
+
+     magic       'JTAGMEM1'
+     records     u64 time, kind, u8 size, u8 value known, u32 address, u32 value
+
+   python -m jtag_parser.memory FILE lists the accesses saved in FILE.
+
+'''
+
+import struct
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+MAGIC = b'JTAGMEM1'
+record = struct.Struct('<QcBBII')
+
+Access = namedtuple('Access', 'time kind address size value')
+
+
+class MemoryLog(object):
+    '''Memory accesses indexed by byte address, and the memory image they give'''
+
+    def __init__(self):
+        self.log = []
+        # byte address -> ([times], [positions in log]) of the reads, the writes
+        self.reads = {}
+        self.writes = {}
+        # byte address -> last known value
+        self.image = {}
+        # sorted byte addresses, rebuilt when a query finds it stale
+        self.addresses = []
+        self.sorted = True
+
+    def __len__(self):
+        return len(self.log)
+
+    def add(self, time, kind, address, size, value=None):
+        '''Record an access, return its position in the log'''
+        position = len(self.log)
+        self.log.append(Access(time, kind, address, size, value))
+        index = self.writes if kind == 'W' else self.reads
+        for a in range(address, address + size):
+            entry = index.get(a)
+            if entry is None:
+                if a not in self.reads and a not in self.writes:
+                    self.sorted = False
+                entry = index[a] = ([], [])
+            entry[0].append(time)
+            entry[1].append(position)
+        if value is not None:
+            self.update(address, size, value)
+        return position
+
+    def complete(self, position, value):
+        '''Set the value of an access once known, as the result of a load'''
+        access = self.log[position]
+        self.log[position] = access._replace(value=value)
+        self.update(access.address, access.size, value)
+
+    def update(self, address, size, value):
+        for k in range(size):
+            self.image[address + k] = (value >> (8 * (size - 1 - k))) & 0xFF
+
+    def last_write(self, address, before=None):
+        '''Last write to the byte at address before the time before (included),
+        None if there is none'''
+        entry = self.writes.get(address)
+        if entry is None:
+            return None
+        (times, positions) = entry
+        k = len(times) if before is None else bisect_right(times, before)
+        if k == 0:
+            return None
+        return self.log[positions[k - 1]]
+
+    def accesses(self, low, high, start=None, end=None):
+        '''Accesses touching the bytes from low to high (excluded), made from
+        start to end (included), in time order'''
+        if not self.sorted:
+            self.addresses = sorted(set(self.reads) | set(self.writes))
+            self.sorted = True
+        found = set()
+        for a in self.addresses[bisect_left(self.addresses, low):bisect_left(self.addresses, high)]:
+            for index in (self.reads, self.writes):
+                entry = index.get(a)
+                if entry is None:
+                    continue
+                (times, positions) = entry
+                first = 0 if start is None else bisect_left(times, start)
+                last = len(times) if end is None else bisect_right(times, end)
+                found.update(positions[first:last])
+        return [self.log[p] for p in sorted(found)]
+
+    def ranges(self):
+        '''Contiguous runs of known bytes of the image, as (address, bytearray)'''
+        runs = []
+        for a in sorted(self.image):
+            if runs and runs[-1][0] + len(runs[-1][1]) == a:
+                runs[-1][1].append(self.image[a])
+            else:
+                runs.append((a, bytearray([self.image[a]])))
+        return runs
+
+    def save(self, path):
+        with open(path, 'wb') as ofile:
+            ofile.write(MAGIC)
+            for (time, kind, address, size, value) in self.log:
+                ofile.write(record.pack(time, kind.encode('ascii'), size, value is not None,
+                                        address, value or 0))
+
+    @classmethod
+    def load(cls, path):
+        memory = cls()
+        with open(path, 'rb') as ifile:
+            data = ifile.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a memory log: ' + path)
+        for offset in range(len(MAGIC), len(data) - record.size + 1, record.size):
+            (time, kind, size, known, address, value) = record.unpack_from(data, offset)
+            memory.add(time, kind.decode('ascii'), address, size, value if known else None)
+        return memory
+
+
+def show(access):
+    value = '?' if access.value is None else '{:0{}x}'.format(access.value, 2 * access.size)
+    return '{} {} {:08x}/{} {}'.format(access.time, access.kind, access.address, access.size, value)
+
+
+def main(argv=None):
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python -m jtag_parser.memory',
+        description='Query a memory log saved by jtag_parse.py --memory')
+    argparser.add_argument('logfile', help='the memory log')
+    argparser.add_argument('--range', nargs=2, metavar=('LOW', 'HIGH'), type=lambda s: int(s, 0),
+        help='only the accesses to the addresses from LOW to HIGH (excluded)')
+    argparser.add_argument('--start', type=int, help='only the accesses from this time')
+    argparser.add_argument('--end', type=int, help='only the accesses until this time')
+    argparser.add_argument('--last-write', type=lambda s: int(s, 0), metavar='ADDRESS',
+        help='the last write to the byte at ADDRESS, until --end')
+    argparser.add_argument('--image', action='store_true',
+        help='dump the known bytes of the memory image')
+    my_args = argparser.parse_args(argv)
+
+    memory = MemoryLog.load(my_args.logfile)
+    if my_args.last_write is not None:
+        access = memory.last_write(my_args.last_write, my_args.end)
+        print('none' if access is None else show(access))
+    elif my_args.image:
+        for (address, data) in memory.ranges():
+            for k in range(0, len(data), 16):
+                print('{:08x}: '.format(address + k) + ' '.join('{:02x}'.format(b) for b in data[k:k + 16]))
+    else:
+        (low, high) = my_args.range or (0, 1 << 32)
+        for access in memory.accesses(low, high, my_args.start, my_args.end):
+            print(show(access))
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
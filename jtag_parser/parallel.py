@@ -0,0 +1,220 @@
+'''
+   Decoding the scans in a pool of processes
+
+   Decoding what a scan means (splitting registers, disassembling, decoding
+   status bits) often costs more than following the TAP.  For a core whose
+   parallel attribute is set, the decode of a scan only depends on its bits
+   and on a small state, kept up to date by the advance method of the core
+   without decoding anything.
+
+   The JTAGParallel stage, placed in front of the stage calling the core,
+   records the events in batches.  Each batch is sent to a process pool with
+   the state of the core at its start (core.checkpoint), where a fresh core
+   restored from that state decodes it.  The core is given a recording
+   watcher: its prints, variable changes, counts, warnings, measures and stop
+   requests are returned event by event.  The batches are collected in the
+   order they were sent, and their events forwarded to the next stage with a
+   ReplayCore in place of the core, which plays back what was recorded for
+   each event.  The output is thus the one of the sequential decode.
+
+   The variables of the core must be attributes of the core, they are
+   matched by attribute name between the pool and the real core.
+
+'''
+
+import sys
+from importlib import import_module
+from collections import deque
+
+from vcd_parser.watcher import VcdWatcher
+from stages import JTAGStage
+from cores import JTAGCore
+
+
+class RecordedVar(object):
+    '''Variable registered with a Recorder'''
+
+
+class Recorder(object):
+    '''Writer, collector, parser and stdout of a core decoding in a pool process,
+    recording everything in effects'''
+
+    def __init__(self):
+        self.effects = []
+        self.attributes = {}
+
+    def register_var(self, scope, name, var_type, size=None, init=None, ident=None):
+        return RecordedVar()
+
+    def change(self, var, timestamp, value):
+        self.effects.append(('change', self.attributes[var], timestamp, value))
+
+    def count(self, counter, key):
+        self.effects.append(('count', counter, key))
+
+    def warning(self, simtime, text):
+        self.effects.append(('warning', simtime, text))
+
+    def write(self, text):
+        self.effects.append(('write', text))
+
+    def stop(self):
+        self.effects.append(('stop',))
+
+    def measure(self, metric, value):
+        self.effects.append(('measure', metric, value))
+
+    def transfer(self, simtime, size):
+        self.effects.append(('transfer', simtime, size))
+
+    def flush(self):
+        pass
+
+
+class RecordingWatcher(VcdWatcher):
+    def __init__(self, recorder):
+        VcdWatcher.__init__(self)
+        self.writer = recorder
+        self.collector = recorder
+        self.analytics = recorder
+        self.parser = recorder
+
+
+def decode(core_class, state, events):
+    '''Decode a batch of events in a pool process, return the list of the
+    effects of every event. The events not for the core are None'''
+    (module, name) = core_class
+    recorder = Recorder()
+    core = getattr(import_module(module), name)(RecordingWatcher(recorder))
+    recorder.attributes = dict((v, k) for k, v in vars(core).items() if isinstance(v, RecordedVar))
+    core.restore(state)
+    results = []
+    stdout = sys.stdout
+    sys.stdout = recorder
+    try:
+        for event in events:
+            recorder.effects = []
+            if event is not None:
+                (name, simtime, args) = event
+                getattr(core, name)(simtime, *args)
+            results.append(recorder.effects)
+    finally:
+        sys.stdout = stdout
+    return results
+
+
+class ReplayCore(JTAGCore):
+    '''Core playing back the effects recorded for the event being forwarded'''
+
+    def __init__(self, core):
+        JTAGCore.__init__(self, core.watcher)
+        self.core = core
+        self.effects = ()
+
+    def replay(self, *args):
+        for effect in self.effects:
+            kind = effect[0]
+            if kind == 'write':
+                sys.stdout.write(effect[1])
+            elif kind == 'change':
+                self.watcher.writer.change(getattr(self.core, effect[1]), effect[2], effect[3])
+            elif kind == 'count':
+                self.core.count(effect[1], effect[2])
+            elif kind == 'warning':
+                self.core.warning(effect[1], effect[2])
+            elif kind == 'stop':
+                self.core.stop()
+            elif kind == 'measure':
+                self.core.measure(effect[1], effect[2])
+            elif kind == 'transfer':
+                self.core.transfer(effect[1], effect[2])
+
+    instruction = instruction_null = data = data_null = replay
+
+    def register_name(self, iribits):
+        return self.core.register_name(iribits)
+
+
+class JTAGParallel(JTAGStage):
+    '''Stage decoding the scans with core in a pool of jobs processes.
+    The watcher must use the replay core of the stage in place of core'''
+
+    core_events = ('instruction', 'instruction_null', 'data', 'data_null')
+
+    # the batches sent to the pool are not part of the state
+    checkpointable = False
+
+    def __init__(self, nextstage, core, jobs, batch_size=1024):
+        JTAGStage.__init__(self, nextstage)
+        assert core.parallel, "The core does not support the parallel decode"
+        import multiprocessing
+        self.core = core
+        self.core_class = (type(core).__module__, type(core).__name__)
+        self.replay = ReplayCore(core)
+        self.batch_size = batch_size
+        self.batch = []
+        self.corestate = core.checkpoint()
+        # what is buffered must not be written again by the pool processes
+        sys.stdout.flush()
+        self.pool = multiprocessing.Pool(jobs)
+        # batches sent to the pool, oldest first, at most depth of them
+        self.pending = deque()
+        self.depth = 2 * jobs
+
+    def record(self, name, simtime, *args):
+        self.core.advance(name, simtime, args)
+        self.batch.append((name, simtime, args))
+        if len(self.batch) >= self.batch_size:
+            self.send()
+
+    def send(self):
+        events = [e if e[0] in self.core_events else None for e in self.batch]
+        result = self.pool.apply_async(decode, (self.core_class, self.corestate, events))
+        self.pending.append((self.batch, result))
+        self.batch = []
+        self.corestate = self.core.checkpoint()
+        while len(self.pending) > self.depth:
+            self.forward()
+
+    def forward(self):
+        '''Wait for the oldest batch and forward its events with their effects'''
+        (events, result) = self.pending.popleft()
+        for (name, simtime, args), effects in zip(events, result.get()):
+            self.replay.effects = effects
+            if name == 'repeat':
+                self.nextstage.repeat(simtime)
+            else:
+                getattr(self.nextstage, name)(simtime, *args)
+        self.replay.effects = ()
+
+    def state(self, simtime, state):
+        self.record('state', simtime, state)
+
+    def reset(self, simtime):
+        self.record('reset', simtime)
+
+    def instruction(self, simtime, iribits, irobits):
+        self.record('instruction', simtime, iribits, irobits)
+
+    def instruction_null(self, simtime):
+        self.record('instruction_null', simtime)
+
+    def data(self, simtime, dribits, drobits):
+        self.record('data', simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        self.record('data_null', simtime)
+
+    def repeat(self, run):
+        # the run goes as the time of the event
+        self.batch.append(('repeat', run, ()))
+
+    def flush(self):
+        try:
+            if self.batch:
+                self.send()
+            while self.pending:
+                self.forward()
+        finally:
+            self.pool.terminate()
+        JTAGStage.flush(self)
@@ -0,0 +1,101 @@
+'''
+   Running the end of the stage chain in a separate thread
+
+   The JTAGStageThread stage records the events it receives in batches and
+   passes them through a bounded queue to a thread replaying them into the
+   next stages.  Placed in front of the stage feeding the core and the writer,
+   it lets the annotation and the output run while the parser and the TAP
+   state machine go on with the capture.
+
+   The queue is bounded: when the core and the writer are late, the TAP
+   decoding waits.  When the thread fails, it drops what is still queued and
+   the error is raised again in the TAP decoding thread at its next batch or
+   at the flush.
+
+'''
+
+import threading
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from stages import JTAGStage
+
+
+class JTAGStageThread(JTAGStage):
+    '''Stage forwarding the events to the next stages from a separate thread'''
+
+    # the events queued for the thread are not part of the state
+    checkpointable = False
+
+    def __init__(self, nextstage, batch_size=4096, depth=16):
+        JTAGStage.__init__(self, nextstage)
+        self.batch_size = batch_size
+        self.batch = []
+        self.queue = queue.Queue(depth)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='jtag-stages')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                # keep draining so that the producer never blocks
+                continue
+            try:
+                for name, simtime, args in batch:
+                    getattr(self.nextstage, name)(simtime, *args)
+            except Exception as e:
+                self.error = e
+
+    def record(self, name, simtime, *args):
+        self.batch.append((name, simtime, args))
+        if len(self.batch) >= self.batch_size:
+            self.send()
+
+    def send(self):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(self.batch)
+        self.batch = []
+
+    def state(self, simtime, state):
+        self.record('state', simtime, state)
+
+    def reset(self, simtime):
+        self.record('reset', simtime)
+
+    def instruction(self, simtime, iribits, irobits):
+        self.record('instruction', simtime, iribits, irobits)
+
+    def instruction_null(self, simtime):
+        self.record('instruction_null', simtime)
+
+    def data(self, simtime, dribits, drobits):
+        self.record('data', simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        self.record('data_null', simtime)
+
+    def repeat(self, run):
+        # the run goes as the time of the event
+        self.record('repeat', run)
+
+    def close(self):
+        '''Stop the thread without sending the pending events'''
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def flush(self):
+        if self.batch:
+            self.send()
+        self.close()
+        if self.error is not None:
+            raise self.error
+        JTAGStage.flush(self)
@@ -0,0 +1,93 @@
+'''
+   Preview of a capture: decoding only part of it
+
+   Checking the signal names or the initial state on a huge capture should
+   not take the full decode.  The parser stops at its next time update once
+   its stop method is called, by anyone: a watcher, a core (JTAGCore.stop),
+   a time hook or the caller.  What was decoded until then is flushed and
+   written as at the end of the capture.
+
+   - TimeLimit is a time hook of the parser stopping it after a time
+   - the JTAGPreview stage stops the parser after a number of transactions
+     (DR scans), and can decode only a sample of the capture: the
+     transactions are split in windows of window DR scans starting at an IR
+     scan, so that the core always sees the IR of the scans it decodes, and
+     only every stride-th window goes further than this stage.  The TAP is
+     still followed in the windows skipped, the state changes go through.
+
+'''
+
+from stages import JTAGStage
+
+
+class TimeLimit(object):
+    '''Time hook stopping the parser once its time is after end'''
+
+    def __init__(self, end):
+        self.end = end
+
+    def __call__(self, parser):
+        if parser.now > self.end:
+            parser.stop()
+
+
+class JTAGPreview(JTAGStage):
+    '''Stage forwarding max_transactions DR scans at most (None for all) of one
+    window out of stride, then calling stop'''
+
+    def __init__(self, nextstage, stop, max_transactions=None, stride=1, window=1000):
+        JTAGStage.__init__(self, nextstage)
+        self.stop = stop
+        self.max_transactions = max_transactions
+        self.stride = stride
+        self.window = window
+        self.forwarded = 0
+        # DR scans in the current window, and its number
+        self.scans = 0
+        self.windows = 0
+        self.sampled = True
+        # set once the limit is reached, until the parser stops
+        self.done = False
+
+    def checkpoint(self):
+        return dict((a, getattr(self, a)) for a in ('forwarded', 'scans', 'windows', 'sampled', 'done'))
+
+    def restore(self, state):
+        for a, v in state.items():
+            setattr(self, a, v)
+
+    def instruction(self, simtime, iribits, irobits):
+        self.next_window()
+        if self.sampled and not self.done:
+            self.nextstage.instruction(simtime, iribits, irobits)
+
+    def instruction_null(self, simtime):
+        self.next_window()
+        if self.sampled and not self.done:
+            self.nextstage.instruction_null(simtime)
+
+    def next_window(self):
+        # a window only ends at an IR scan
+        if self.scans >= self.window:
+            self.scans = 0
+            self.windows += 1
+            self.sampled = self.windows % self.stride == 0
+
+    def data(self, simtime, dribits, drobits):
+        if self.count():
+            self.nextstage.data(simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        if self.count():
+            self.nextstage.data_null(simtime)
+
+    def count(self):
+        '''Count a DR scan, return whether it goes further'''
+        self.scans += 1
+        if not self.sampled or self.done:
+            return False
+        self.forwarded += 1
+        if self.max_transactions is not None and self.forwarded >= self.max_transactions:
+            self.done = True
+            self.stop()
+        return True
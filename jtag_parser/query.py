@@ -0,0 +1,259 @@
+'''
+   Queries over the JTAG transactions of a capture
+
+   A transaction is a DR scan together with the IR scan in effect when it
+   happened.  The JTAGQuery stage evaluates the predicates in increasing
+   order of cost, so that the core only sees what may match:
+
+   - the IR predicates (IR bits, register name) are evaluated once per IR
+     scan, using JTAGCore.register_name that does not touch the core state
+   - the time, length and bit pattern predicates are evaluated on every DR
+     scan, a scan that fails them never reaches the core
+   - the scans passing them are sent to the core (the IR scan first, then the
+     DR scan) and the core predicates are checked against the counters the
+     core reports while decoding them
+
+   The matching transactions are passed to a callback as soon as they are
+   decoded, with the text logged by the core.
+
+   A TimeIndex records, while a capture is queried, where the parser can
+   restart from at regular intervals of the file.  A later query with a start
+   time seeks directly to the last recorded point before it.
+
+'''
+
+import os
+import re
+import sys
+import json
+from bisect import bisect_right
+from collections import namedtuple
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from stages import JTAGStage
+
+
+JTAGTransaction = namedtuple('JTAGTransaction',
+    'time irtime iribits irobits register dribits drobits log')
+
+
+def display(transaction):
+    '''Default callback, print the transaction and the log of the core'''
+    t = transaction
+    if t.iribits is None:
+        ir = 'ir=NULL'
+    else:
+        ir = 'ir_i=' + t.iribits + '-ir_o=' + t.irobits
+        if t.register is not None:
+            ir += '(' + t.register + ')'
+    if t.dribits == '':
+        dr = 'data NULL'
+    else:
+        dr = 'data ' + str(len(t.dribits)) + 'bits in=' + hex(int(t.dribits, 2)) + ' out=' + hex(int(t.drobits, 2))
+    print(str(t.time) + ': ' + ir + ' ' + dr)
+    if t.log:
+        sys.stdout.write(t.log)
+
+
+class JTAGQuery(JTAGStage):
+    '''Stage forwarding to the core only the transactions that may match.
+
+    start, end: time window, inclusive
+    ir: exact IR bits as shifted on TDI
+    register: register name as returned by core.register_name
+    min_length, max_length: DR length window, inclusive
+    dr_in, dr_out: regular expressions searched in the DR bits
+    match: list of (counter, key) the core must report while decoding
+    '''
+
+    # the state of the core is only that of the transactions sent to it
+    checkpointable = False
+
+    def __init__(self, nextstage, core, start=None, end=None, ir=None, register=None,
+                 min_length=None, max_length=None, dr_in=None, dr_out=None, match=(),
+                 callback=display):
+        JTAGStage.__init__(self, nextstage)
+        self.core = core
+        self.start = start
+        self.end = end
+        self.irbits = ir
+        self.register = register
+        self.min_length = min_length
+        self.max_length = max_length
+        self.dr_in = dr_in and re.compile(dr_in)
+        self.dr_out = dr_out and re.compile(dr_out)
+        self.match = set(match)
+        self.callback = callback
+
+        # IR scan in effect: (time, iribits, irobits), iribits is None for a null scan
+        self.lastir = None
+        self.irmatch = ir is None and register is None
+        self.irregister = None
+        self.irsent = False
+        # counters reported by the core for the transaction being decoded
+        self.reported = set()
+
+    def count(self, counter, key):
+        self.reported.add((counter, key))
+
+    def warning(self, simtime, text):
+        self.reported.add(('warning', text))
+
+    def state(self, simtime, state):
+        pass
+
+    def reset(self, simtime):
+        pass
+
+    def set_ir(self, lastir):
+        '''Make lastir the IR scan in effect and evaluate the IR predicates'''
+        self.lastir = lastir
+        self.irsent = False
+        iribits = lastir[1]
+        self.irregister = None
+        if iribits is not None:
+            self.irregister = self.core.register_name(iribits)
+        if self.irbits is not None and iribits != self.irbits:
+            self.irmatch = False
+        elif self.register is not None and self.irregister != self.register:
+            self.irmatch = False
+        else:
+            self.irmatch = True
+
+    def instruction(self, simtime, iribits, irobits):
+        self.set_ir((simtime, iribits, irobits))
+
+    def instruction_null(self, simtime):
+        self.set_ir((simtime, None, None))
+
+    def data(self, simtime, dribits, drobits):
+        if not self.irmatch:
+            return
+        if self.start is not None and simtime < self.start:
+            return
+        if self.end is not None and simtime > self.end:
+            return
+        l = len(dribits)
+        if self.min_length is not None and l < self.min_length:
+            return
+        if self.max_length is not None and l > self.max_length:
+            return
+        if self.dr_in is not None and not self.dr_in.search(dribits):
+            return
+        if self.dr_out is not None and not self.dr_out.search(drobits):
+            return
+        self.decode(simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        self.data(simtime, '', '')
+
+    def decode(self, simtime, dribits, drobits):
+        '''Send the transaction to the core, and to the callback if the core
+        reported everything in self.match'''
+        self.reported = set()
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            if self.lastir is not None and not self.irsent:
+                self.irsent = True
+                (irtime, iribits, irobits) = self.lastir
+                if iribits is None:
+                    self.nextstage.instruction_null(irtime)
+                else:
+                    self.nextstage.instruction(irtime, iribits, irobits)
+            if dribits == '':
+                self.nextstage.data_null(simtime)
+            else:
+                self.nextstage.data(simtime, dribits, drobits)
+            log = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+        if not self.match <= self.reported:
+            return
+
+        if self.lastir is None:
+            (irtime, iribits, irobits) = (None, None, None)
+        else:
+            (irtime, iribits, irobits) = self.lastir
+        self.callback(JTAGTransaction(simtime, irtime, iribits, irobits, self.irregister,
+                                      dribits, drobits, log))
+
+
+class TimeIndex(object):
+    '''Points of a capture where the parsing can restart from.
+
+    Each entry holds the time, the offset of the #time line in the file, the
+    values of the watched signals, the TAP state and the IR scan in effect.
+    Entries are only taken when the TAP is not in the middle of a scan, so
+    that no shift data has to be saved.  Their times are also kept in times,
+    for the lookup by bisection.'''
+
+    # saved with the entries, the index of another version is built again
+    version = 2
+
+    # TAP states where no IR or DR shift is in progress
+    stable_states = ('test_logic_reset', 'run_test_idle', 'select_dr_scan', 'select_ir_scan')
+
+    def __init__(self, key, step=1 << 20):
+        self.key = key
+        self.step = step
+        self.entries = []
+        self.times = []
+        self.lastoffset = 0
+
+    @staticmethod
+    def make_key(path, signals):
+        '''Identify a capture file and the way its signals are decoded'''
+        st = os.stat(path)
+        return [os.path.abspath(path), st.st_size, int(st.st_mtime), list(signals)]
+
+    def record(self, parser, watcher, query):
+        '''Add an entry if the parser moved far enough since the last one'''
+        if parser.offset - self.lastoffset < self.step:
+            return
+        if watcher.curstate not in self.stable_states:
+            return
+        self.lastoffset = parser.offset
+        self.entries.append([parser.now, parser.offset, dict(parser.watched_changes),
+                             watcher.curstate, query.lastir])
+        self.times.append(parser.now)
+
+    def lookup(self, start):
+        '''Last entry before start, None if there is none'''
+        k = bisect_right(self.times, start)
+        if k == 0:
+            return None
+        return self.entries[k - 1]
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'key': self.key, 'version': self.version, 'step': self.step, 'entries': self.entries}, f)
+
+    @classmethod
+    def load(cls, path, key):
+        '''Read an index, None if it does not exist or is for another capture'''
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            d = json.load(f)
+        if d['key'] != key or d.get('version') != cls.version:
+            return None
+        index = cls(key, d['step'])
+
+        def plain(v):
+            # json gives back unicode strings and lists
+            if isinstance(v, list):
+                return tuple(plain(x) for x in v)
+            if v is None or isinstance(v, int):
+                return v
+            return str(v)
+
+        for (t, offset, watched, state, lastir) in d['entries']:
+            watched = dict((str(k), plain(v)) for k, v in watched.items())
+            index.entries.append([int(t), offset, watched, str(state), plain(lastir)])
+            index.times.append(int(t))
+        return index
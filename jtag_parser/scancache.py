@@ -0,0 +1,174 @@
+'''
+   Cache of the TAP events of a capture
+
+   Working on a core means decoding the same capture again and again, while
+   only the core changes: the parsing of the VCD and the TAP state machine
+   give the same events every time.  The ScanRecorder stage, placed first in
+   the chain, saves the events of the tracker (state changes, resets, IR and
+   DR scans, null scans included) in a scan cache, and a later decode of the
+   same capture replays them from the ScanCache into the chain, skipping the
+   parsing and the tracker.
+
+   The state changes are saved with the number of rising edges of TCK seen
+   by the watcher, which is set back when they are replayed, as well as at
+   the end of the capture.
+
+   The cache is identified by a key, the one of a TimeIndex: the capture file
+   and the way its signals are decoded.  It is only saved when the whole
+   capture was decoded, a preview or a query stopping early leaves no cache.
+
+     magic       'JTAGSCN2'
+     header      u32 length + JSON: key, timescale and time unit of the input
+     blocks      u32 length + zlib compressed marshal of a list of events,
+                 (name, simtime, arguments...)
+
+'''
+
+import os
+import json
+import zlib
+import struct
+import marshal
+
+from stages import JTAGStage
+
+MAGIC = b'JTAGSCN2'
+
+
+class ScanRecorder(JTAGStage):
+    '''Stage saving the events it forwards in a scan cache at path, written
+    in path.tmp until finish renames it'''
+
+    def __init__(self, nextstage, path, key, watcher, block_events=1 << 14):
+        JTAGStage.__init__(self, nextstage)
+        self.path = path
+        self.key = key
+        self.watcher = watcher
+        self.parser = watcher.parser
+        self.block_events = block_events
+        self.events = []
+        self.ofile = None
+
+    def record(self, event):
+        self.events.append(event)
+        if len(self.events) >= self.block_events:
+            self.write_block()
+
+    def write_block(self):
+        if self.ofile is None:
+            # the timescale of the input is known once there are events
+            self.ofile = open(self.path + '.tmp', 'wb')
+            header = json.dumps({'key': self.key,
+                                 'timescale': getattr(self.parser, 'timescale', None),
+                                 'time_unit': self.parser.time_unit}).encode('ascii')
+            self.ofile.write(MAGIC + struct.pack('<I', len(header)) + header)
+        if self.events:
+            block = zlib.compress(marshal.dumps(self.events))
+            self.ofile.write(struct.pack('<I', len(block)) + block)
+            self.events = []
+
+    def finish(self, complete):
+        '''Save the cache if the capture was decoded until its end, drop it otherwise'''
+        if complete:
+            self.write_block()
+        if self.ofile is None:
+            return
+        self.ofile.close()
+        if complete:
+            os.rename(self.path + '.tmp', self.path)
+        else:
+            os.remove(self.path + '.tmp')
+
+    def state(self, simtime, state):
+        self.record(('state', simtime, state, self.watcher.cycles))
+        self.nextstage.state(simtime, state)
+
+    def reset(self, simtime):
+        self.record(('reset', simtime))
+        self.nextstage.reset(simtime)
+
+    def instruction(self, simtime, iribits, irobits):
+        self.record(('instruction', simtime, iribits, irobits))
+        self.nextstage.instruction(simtime, iribits, irobits)
+
+    def instruction_null(self, simtime):
+        self.record(('instruction_null', simtime))
+        self.nextstage.instruction_null(simtime)
+
+    def data(self, simtime, dribits, drobits):
+        self.record(('data', simtime, dribits, drobits))
+        self.nextstage.data(simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        self.record(('data_null', simtime))
+        self.nextstage.data_null(simtime)
+
+    def flush(self):
+        self.record(('cycles', self.parser.now, self.watcher.cycles))
+        JTAGStage.flush(self)
+
+
+class ScanCache(object):
+    '''Reader of a scan cache'''
+
+    events = ('state', 'reset', 'instruction', 'instruction_null', 'data', 'data_null')
+
+    def __init__(self, fh):
+        self.fh = fh
+        (length,) = struct.unpack('<I', fh.read(4))
+        header = json.loads(fh.read(length).decode('ascii'))
+        self.key = header['key']
+        self.timescale = header['timescale'] and str(header['timescale'])
+        self.time_unit = header['time_unit']
+
+    @classmethod
+    def load(cls, path, key):
+        '''Open a scan cache, None if it does not exist or is for another capture'''
+        if not os.path.exists(path):
+            return None
+        fh = open(path, 'rb')
+        if fh.read(len(MAGIC)) != MAGIC:
+            # not a scan cache, or one of another version
+            fh.close()
+            return None
+        cache = cls(fh)
+        if cache.key != key:
+            cache.close()
+            return None
+        return cache
+
+    def blocks(self):
+        while True:
+            length = self.fh.read(4)
+            if not length:
+                return
+            yield marshal.loads(zlib.decompress(self.fh.read(struct.unpack('<I', length)[0])))
+
+    def replay(self, watcher):
+        '''Send the events to the stages of the watcher, the time hooks of its parser are
+        called after each of them, and the replay ends when the parser is stopped'''
+        stage = watcher.stage
+        parser = watcher.parser
+        methods = dict((name, getattr(stage, name)) for name in self.events)
+
+        def state(simtime, state, cycles):
+            watcher.cycles = cycles
+            stage.state(simtime, state)
+
+        def cycles(simtime, cycles):
+            watcher.cycles = cycles
+
+        methods['state'] = state
+        methods['cycles'] = cycles
+        hooks = parser.time_hooks
+        for block in self.blocks():
+            for event in block:
+                parser.now = event[1]
+                methods[event[0]](*event[1:])
+                for hook in hooks:
+                    hook(parser)
+                if parser.stopped:
+                    return
+
+    def close(self):
+        self.fh.close()
@@ -0,0 +1,63 @@
+'''
+   Stages processing the TAP events produced by the JTAGTracker
+
+   The tracker walks the TAP state machine and reports the state changes and
+   the completed IR/DR scans to a chain of stages.  A stage has the same
+   interface as a JTAGCore (instruction, instruction_null, data, data_null)
+   plus a few bookkeeping events, and forwards everything to the next stage
+   by default.  The last stage of the chain feeds the core and the writer.
+
+'''
+
+
+class JTAGStage(object):
+    '''Base class for stages, forwards every event to the next stage'''
+
+    # whether checkpoint returns the whole state of the stage, a decode can
+    # only be checkpointed when all its stages are
+    checkpointable = True
+
+    def __init__(self, nextstage=None):
+        self.nextstage = nextstage
+
+    def state(self, simtime, state):
+        '''Called when the TAP controller enters a new state'''
+        self.nextstage.state(simtime, state)
+
+    def reset(self, simtime):
+        '''Called when the TAP controller goes to test_logic_reset through select_ir_scan'''
+        self.nextstage.reset(simtime)
+
+    def instruction(self, simtime, iribits, irobits):
+        '''Called at the update_ir sampling time, see JTAGCore.instruction'''
+        self.nextstage.instruction(simtime, iribits, irobits)
+
+    def instruction_null(self, simtime):
+        '''Called at the update_ir sampling time when no bit was shifted'''
+        self.nextstage.instruction_null(simtime)
+
+    def data(self, simtime, dribits, drobits):
+        '''Called at the update_dr sampling time, see JTAGCore.data'''
+        self.nextstage.data(simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        '''Called at the update_dr sampling time when no bit was shifted'''
+        self.nextstage.data_null(simtime)
+
+    def repeat(self, run):
+        '''Called when a run of identical transactions has been collapsed,
+        run is a collapse.JTAGRun'''
+        self.nextstage.repeat(run)
+
+    def flush(self):
+        '''Called at the end of the capture, pending events must be sent'''
+        if self.nextstage is not None:
+            self.nextstage.flush()
+
+    def checkpoint(self):
+        '''Return the state of the stage as picklable data, the stage is stateless by default'''
+        return None
+
+    def restore(self, state):
+        '''Set the state of the stage from what checkpoint returned'''
+        pass
@@ -0,0 +1,109 @@
+'''
+   Aggregate statistics on a JTAG capture
+
+   The JTAGSummary stage counts the TAP events going through it (IR codes,
+   DR lengths, time spent in every TAP state) and collects the counters and
+   warnings reported by the cores.  Memory only grows with the number of
+   distinct keys (IR codes, DR lengths, register names, warning texts), not
+   with the length of the capture.
+
+'''
+
+from collections import defaultdict
+
+from stages import JTAGStage
+
+
+class JTAGSummary(JTAGStage):
+    '''Stage collecting statistics before forwarding the events'''
+
+    def __init__(self, nextstage, initstate):
+        JTAGStage.__init__(self, nextstage)
+        self.ir = defaultdict(int)
+        self.dr_length = defaultdict(int)
+        self.dwell = defaultdict(int)
+        self.counters = defaultdict(lambda: defaultdict(int))
+        self.warnings = {}
+
+        self.curstate = initstate
+        self.statetime = 0
+
+    def count(self, counter, key):
+        '''Count an occurrence of key in the named counter'''
+        self.counters[counter][key] += 1
+
+    def warning(self, simtime, text):
+        '''Record a warning, identical texts are counted together'''
+        if text in self.warnings:
+            w = self.warnings[text]
+            w[0] += 1
+            w[2] = simtime
+        else:
+            self.warnings[text] = [1, simtime, simtime]
+
+    def state(self, simtime, state):
+        self.dwell[self.curstate] += simtime - self.statetime
+        self.curstate = state
+        self.statetime = simtime
+        self.nextstage.state(simtime, state)
+
+    def reset(self, simtime):
+        self.count('tap', 'reset')
+        self.nextstage.reset(simtime)
+
+    def instruction(self, simtime, iribits, irobits):
+        self.ir[iribits] += 1
+        self.nextstage.instruction(simtime, iribits, irobits)
+
+    def instruction_null(self, simtime):
+        self.count('tap', 'instruction_null')
+        self.nextstage.instruction_null(simtime)
+
+    def data(self, simtime, dribits, drobits):
+        self.dr_length[len(dribits)] += 1
+        self.nextstage.data(simtime, dribits, drobits)
+
+    def data_null(self, simtime):
+        self.count('tap', 'data_null')
+        self.nextstage.data_null(simtime)
+
+    def checkpoint(self):
+        return (self.report(), self.curstate, self.statetime)
+
+    def restore(self, state):
+        (report, self.curstate, self.statetime) = state
+        self.ir.update(report['ir'])
+        self.dr_length.update(report['dr_length'])
+        self.dwell.update(report['dwell'])
+        for name, counter in report['counters'].items():
+            self.counters[name].update(counter)
+        for text, w in report['warnings'].items():
+            self.warnings[text] = [w['count'], w['first'], w['last']]
+
+    def report(self):
+        '''Return the statistics as a dictionary of plain types'''
+        return {
+            'ir': dict(self.ir),
+            'dr_length': dict(self.dr_length),
+            'dwell': dict(self.dwell),
+            'counters': dict((k, dict(v)) for k, v in self.counters.items()),
+            'warnings': dict((k, {'count': c, 'first': f, 'last': l})
+                             for k, (c, f, l) in self.warnings.items()),
+        }
+
+    def display(self):
+        '''Print the statistics in a human readable form'''
+        def table(title, d):
+            print(title)
+            for k in sorted(d):
+                print('  ' + str(k) + ': ' + str(d[k]))
+
+        table('IR scans per code', self.ir)
+        table('DR scans per length', self.dr_length)
+        table('Time spent per TAP state (until the last state change)', self.dwell)
+        for name in sorted(self.counters):
+            table('Counter ' + name, self.counters[name])
+        print('Warnings')
+        for text in sorted(self.warnings):
+            c, f, l = self.warnings[text]
+            print('  ' + text + ': ' + str(c) + ' times, first at ' + str(f) + ', last at ' + str(l))
@@ -0,0 +1,273 @@
+'''
+   Writers usable in place of the pyvcd VCDWriter
+
+   The watcher and the cores only use the register_var and change methods of
+   the writer, any object providing them can receive the decoded values.  The
+   internal attributes of the pyvcd VCDWriter are only used by PyvcdInternals.
+
+'''
+
+import os
+import sys
+from fractions import Fraction
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from vcd_parser.parser import time_units, timescale_unit
+
+# timescale of the output VCD when it cannot follow the one of the input
+DEFAULT_TIMESCALE = '1 ns'
+
+
+def vcd_timescale(unit):
+    '''Largest timescale of a VCD (1, 10 or 100 of a unit) dividing unit femtoseconds'''
+    for name in ('s', 'ms', 'us', 'ns', 'ps', 'fs'):
+        for number in (100, 10, 1):
+            if unit % (number * time_units[name]) == 0:
+                return '%d %s' % (number, name)
+
+
+class NullWriter(object):
+    '''Writer dropping every value, used when no output VCD is wanted'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def register_var(self, scope, name, var_type, size=None, init=None, ident=None):
+        return None
+
+    def change(self, var, timestamp, value):
+        pass
+
+    def close(self, timestamp=None):
+        pass
+
+
+class TimescaleWriter(object):
+    '''Writer passing the changes to writer with their times converted from the
+    timescale of the input to timescale, the one of writer.  With timescale
+    None the times of the input are kept, and the timescale of a pyvcd
+    VCDWriter is set to the one of the input (or the largest one of a VCD
+    dividing it) before its header is written, when its internals allow it; it
+    stays at DEFAULT_TIMESCALE otherwise.  The timescale of the input is only
+    known once its definitions are parsed, it is given to set_input'''
+
+    def __init__(self, writer, timescale):
+        self.writer = writer
+        self.unit = timescale_unit(timescale)
+        self.internals = PyvcdInternals.of(writer) if timescale is None else None
+        self.register_var = writer.register_var
+        self.change = writer.change
+
+    def set_input(self, unit):
+        '''unit: duration of a time of the input in femtoseconds, None if unknown'''
+        if self.internals is not None and unit is not None:
+            if self.internals.unsupported is None:
+                timescale = vcd_timescale(unit)
+                self.internals.set_timescale(timescale)
+            else:
+                timescale = DEFAULT_TIMESCALE
+                sys.stderr.write('warning: the output timescale is ' + timescale + ', ' +
+                                 self.internals.unsupported + '\n')
+            self.unit = timescale_unit(timescale)
+        if unit is None or self.unit is None or unit == self.unit:
+            self.change = self.writer.change
+            return
+        ratio = Fraction(unit, self.unit)
+        if ratio.denominator != 1:
+            sys.stderr.write('warning: the output timescale is coarser than the one of the input, '
+                             'close times are merged\n')
+        self.multiplier = ratio.numerator
+        self.divisor = ratio.denominator
+        self.change = self.converted_change
+
+    def converted_change(self, var, timestamp, value):
+        self.writer.change(var, timestamp * self.multiplier // self.divisor, value)
+
+
+class PyvcdInternals(object):
+    '''The internal attributes of a pyvcd VCDWriter used to set its timescale
+    and to checkpoint it.  They are the ones of pyvcd 0.1 (0.1.7 is tested):
+    the version is checked when the vcd module gives one, and the attributes
+    when the writer is wrapped.  unsupported tells why they cannot be used,
+    None when they can'''
+
+    attributes = ('_ofile', '_timestamp', '_last_dumped_ts', '_vars', '_header_keywords', '_check_timescale')
+
+    def __init__(self, writer):
+        self.writer = writer
+        version = getattr(sys.modules.get(type(writer).__module__.split('.')[0]), '__version__', None)
+        missing = [name for name in self.attributes if not hasattr(writer, name)]
+        if version is not None and not str(version).startswith('0.1.'):
+            self.unsupported = 'pyvcd ' + str(version) + ' is not supported'
+        elif missing:
+            self.unsupported = 'the VCDWriter has no ' + ', '.join(missing)
+        else:
+            self.unsupported = None
+
+    @classmethod
+    def of(cls, writer):
+        '''PyvcdInternals of writer, None when it is not a pyvcd VCDWriter'''
+        if type(writer).__name__ != 'VCDWriter':
+            return None
+        return cls(writer)
+
+    def check(self):
+        if self.unsupported is not None:
+            raise ValueError(self.unsupported)
+
+    def set_timescale(self, timescale):
+        '''Set the timescale of the header, written with the first change'''
+        self.check()
+        self.writer._header_keywords['$timescale'] = self.writer._check_timescale(timescale)
+
+    def save(self):
+        '''Flush the writer to disk and return what is needed to continue its output'''
+        self.check()
+        writer = self.writer
+        writer.flush()
+        os.fsync(writer._ofile.fileno())
+        return {'position': writer._ofile.tell(),
+                'timestamp': writer._timestamp,
+                'last_dumped_ts': writer._last_dumped_ts,
+                'values': [var.value for var in writer._vars]}
+
+    def restore(self, state):
+        self.check()
+        writer = self.writer
+        ofile = writer._ofile
+        writer._ofile = StringIO()
+        writer.flush()
+        writer._ofile = ofile
+        ofile.seek(state['position'])
+        ofile.truncate()
+        writer._timestamp = state['timestamp']
+        writer._last_dumped_ts = state['last_dumped_ts']
+        for var, value in zip(writer._vars, state['values']):
+            var.value = value
+
+
+def checkpoint(writer):
+    '''Flush the writer to disk and return what is needed to continue its output
+    later'''
+    if isinstance(writer, NullWriter):
+        return None
+    return PyvcdInternals(writer).save()
+
+
+def restore(writer, state):
+    '''Continue the output of a writer from a checkpoint. The variables must
+    have been registered in the same order as when the checkpoint was taken,
+    the header is already in the file and is not written again'''
+    if state is None:
+        return
+    PyvcdInternals(writer).restore(state)
+
+
+class MergeVar(object):
+    '''Variable of a MergeWriter'''
+
+    def __init__(self, scope, name, var_type, size, init):
+        self.scope = scope
+        self.name = name
+        self.type = var_type
+        self.size = size or 1
+        self.value = init
+        self.ident = None
+
+    def format_value(self, value):
+        if self.type == 'string':
+            return 's' + str(value) + ' ' + self.ident
+        if self.size == 1:
+            return str(value) + self.ident
+        if isinstance(value, str):
+            return 'b' + value + ' ' + self.ident
+        return 'b' + bin(value)[2:] + ' ' + self.ident
+
+
+class MergeWriter(object):
+    '''Writer adding its variables to a copy of the VCD being parsed.
+
+    The parser copies the input lines to the output file (VcdParser.echo), a
+    line being copied only once its tokens are processed.  The variables are
+    declared at the end of the input definitions, with identifiers not used
+    by the input, and their changes are written in the time block the parser
+    is processing, which is the time the watchers use.  The changes must
+    therefore be made in time order, at the current time of the parser.'''
+
+    def __init__(self, ofile, parser):
+        self.ofile = ofile
+        self.vars = []
+        self.dumped = False
+        parser.echo = ofile
+        parser.register_definitions_hook(self.definitions)
+        parser.register_time_hook(self.dumpvars)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def register_var(self, scope, name, var_type, size=None, init=None, ident=None):
+        var = MergeVar(scope, name, var_type, size, init)
+        self.vars.append(var)
+        return var
+
+    def definitions(self, parser):
+        '''Definitions hook, declare the variables before $enddefinitions'''
+        used = set(parser.idcode2references)
+        n = 0
+        for var in self.vars:
+            while True:
+                # printable identifiers, from '!' to '~'
+                ident = ''
+                i = n
+                while True:
+                    ident += chr(33 + i % 94)
+                    i //= 94
+                    if not i:
+                        break
+                n += 1
+                # avoid identifiers looking like a keyword or a time
+                if ident not in used and ident[0] not in '$#':
+                    break
+            var.ident = ident
+
+        scopes = []
+        for var in self.vars:
+            if var.scope not in scopes:
+                scopes.append(var.scope)
+        lines = []
+        for scope in scopes:
+            path = scope.split('.')
+            lines += ['$scope module ' + s + ' $end' for s in path]
+            for var in self.vars:
+                if var.scope == scope:
+                    lines.append(' '.join(('$var', var.type, str(var.size), var.ident, var.name, '$end')))
+            lines += ['$upscope $end'] * len(path)
+        self.ofile.write('\n'.join(lines) + '\n')
+
+    def dumpvars(self, parser):
+        '''Time hook, write the initial values after $enddefinitions'''
+        if self.dumped:
+            return
+        self.dumped = True
+        lines = [var.format_value(var.value) for var in self.vars if var.value is not None]
+        self.ofile.write('$dumpvars\n' + ''.join(l + '\n' for l in lines) + '$end\n')
+
+    def change(self, var, timestamp, value):
+        if not self.dumped:
+            self.dumpvars(None)
+        if value == var.value:
+            return
+        var.value = value
+        self.ofile.write(var.format_value(value) + '\n')
+
+    def close(self, timestamp=None):
+        pass
@@ -0,0 +1,77 @@
+'''
+   Benchmark of the pipeline stage
+
+   Prints the events per second passed through a JTAGStageThread to a stage
+   doing some work per scan, against the same stage called directly, for a
+   few batch sizes; then the time of the decode of a synthetic e200z0
+   capture with and without --pipeline.
+
+   python tests/benchmark_pipeline.py [ITERATIONS]
+
+'''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from captures import decode, write_capture
+from jtag_parser.stages import JTAGStage
+from jtag_parser.pipeline import JTAGStageThread
+
+
+class Sink(JTAGStage):
+    '''Last stage, converting the bits of the scans as a core does'''
+
+    def __init__(self):
+        JTAGStage.__init__(self)
+        self.total = 0
+
+    def state(self, simtime, state):
+        pass
+
+    def instruction(self, simtime, iribits, irobits):
+        self.total += int(iribits, 2)
+
+    def data(self, simtime, dribits, drobits):
+        self.total += int(dribits, 2) ^ int(drobits, 2)
+
+    def flush(self):
+        pass
+
+
+def feed(stage, scans):
+    started = time.time()
+    for k in range(scans):
+        stage.state(k, 'update_ir')
+        stage.instruction(k, '0000110001', '1000000001')
+        stage.state(k, 'update_dr')
+        stage.data(k, '01' * 16, '10' * 16)
+    stage.flush()
+    return 4 * scans / (time.time() - started)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    scans = 100 * iterations
+    print('{} scans direct: {:.0f} events/s'.format(scans, feed(Sink(), scans)))
+    for batch_size in (256, 4096):
+        rate = feed(JTAGStageThread(Sink(), batch_size), scans)
+        print('{} scans pipelined, batches of {}: {:.0f} events/s'.format(scans, batch_size, rate))
+
+    directory = tempfile.mkdtemp()
+    try:
+        capture = os.path.join(directory, 'capture.vcd')
+        write_capture(capture, iterations)
+        for options in ([], ['--pipeline']):
+            started = time.time()
+            decode([capture, os.path.join(directory, 'out.vcd'), '--core', 'e200z0'] + options)
+            print('decode of {} iterations{}: {:.2f}s'.format(iterations, ' ' + options[0] if options else '',
+                                                             time.time() - started))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''
+   Benchmark of the tracker bookkeeping of a VcdWatcher
+
+   A tracker is started at every update and finishes after a few updates,
+   as for protocols starting one per frame (a UART byte, an SPI transfer).
+   Prints the time per update, with and without the pool of trackers, for
+   trackers finishing in order and out of order.
+
+   python tests/benchmark_trackers.py [UPDATES]
+
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vcd_parser.watcher import VcdWatcher
+from vcd_parser.tracker import VcdTracker
+
+
+class ShortTracker(VcdTracker):
+
+    __slots__ = ('remaining',)
+
+    def start(self):
+        self.remaining = self.watcher.next_lifetime()
+
+    def update(self):
+        self.remaining -= 1
+        if not self.remaining:
+            self.finished = True
+
+
+class BenchWatcher(VcdWatcher):
+
+    def __init__(self, lifetimes, pooled):
+        VcdWatcher.__init__(self)
+        self.lifetimes = lifetimes
+        self.started = 0
+        self.set_tracker(ShortTracker, pooled)
+
+    def next_lifetime(self):
+        self.started += 1
+        return self.lifetimes[self.started % len(self.lifetimes)]
+
+    def start_tracker(self):
+        return True
+
+
+def run(updates, lifetimes, pooled):
+    watcher = BenchWatcher(lifetimes, pooled)
+    activity = {}
+    values = {}
+    started = time.time()
+    for k in range(updates):
+        watcher.notify(activity, values)
+    return (time.time() - started) / updates * 1e6, len(watcher.trackers)
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    for name, lifetimes in (('in order', [3]), ('out of order', [1, 9, 2, 5, 3])):
+        for pooled in (False, True):
+            (us, alive) = run(updates, lifetimes, pooled)
+            print('{} trackers {}, {}: {:.2f} us per update, {} in the deque at the end'.format(
+                updates, name, 'pooled' if pooled else 'not pooled', us, alive))
+
+
+if __name__ == '__main__':
+    main()
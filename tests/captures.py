@@ -0,0 +1,153 @@
+'''
+   Synthetic captures of OnCE commands, and decoding of captures, for the tests
+
+'''
+
+import os
+import sys
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEADER = '''$date today $end
+$timescale {} $end
+$scope module capture $end
+$var wire 1 0 tck $end
+$var wire 1 1 tms $end
+$var wire 1 2 tdi $end
+$var wire 1 3 tdo $end
+$upscope $end
+$enddefinitions $end
+#0
+$dumpvars
+00
+11
+02
+03
+$end
+'''
+
+
+class Capture(object):
+    '''Writer of a synthetic capture of OnCE commands, a TCK period lasting
+    period times'''
+
+    def __init__(self, ofile, period=2):
+        self.ofile = ofile
+        self.period = period
+        self.time = 0
+        self.values = {'1': '1', '2': '0', '3': '0'}
+
+    def clock(self, tms, tdi='0', tdo='0'):
+        lines = ['#%d' % (self.time + self.period // 2), '00']
+        for ident, value in (('1', str(tms)), ('2', tdi), ('3', tdo)):
+            if self.values[ident] != value:
+                self.values[ident] = value
+                lines.append(value + ident)
+        lines += ['#%d' % (self.time + self.period), '10', '']
+        self.time += self.period
+        self.ofile.write('\n'.join(lines))
+
+    def scan(self, path, bits_i, bits_o):
+        '''Go from run_test_idle through the tms path to the shift state, shift the bits,
+        and back to run_test_idle'''
+        for tms in path:
+            self.clock(tms)
+        for k, (i, o) in enumerate(zip(bits_i, bits_o)):
+            self.clock(1 if k == len(bits_i) - 1 else 0, i, o)
+        self.clock(1)
+        self.clock(0)
+
+    def command(self, rs, go, rw, bits_i, bits_o):
+        self.scan((1, 1, 0, 0), format(rs, '08b')[::-1] + str(go) + str(rw), '1000000001')
+        self.scan((1, 0, 0), bits_i, bits_o)
+
+
+class SampleCapture(Capture):
+    '''Writer of the same capture as a packed sample dump of the channels tck,
+    tms, tdi and tdo, with the levels of TCK low then high on each clock'''
+
+    def clock(self, tms, tdi='0', tdo='0'):
+        levels = int(tms) << 1 | int(tdi) << 2 | int(tdo) << 3
+        self.ofile.write(bytearray([levels, levels | 1]))
+        self.time += self.period
+
+
+def write_commands(capture, iterations):
+    capture.clock(0)
+    capture.clock(0)
+    for k in range(iterations):
+        # DBSR read, then a CPUSCR write with GO every 20 iterations
+        capture.command(0x30, 0, 1, '0' * 32, '01' * 16)
+        if k % 20 == 19:
+            capture.command(0x10, 1, 0, format(k, '0192b'), '0' * 192)
+
+
+def write_capture(path, iterations, timescale='1 ns', period=2):
+    with open(path, 'w') as ofile:
+        ofile.write(HEADER.format(timescale))
+        write_commands(Capture(ofile, period), iterations)
+
+
+def write_samples(path, iterations):
+    '''The capture of write_capture as a packed sample dump, a sample lasting a
+    time: the levels at time 0 are sampled first'''
+    with open(path, 'wb') as ofile:
+        ofile.write(bytearray([2]))
+        write_commands(SampleCapture(ofile), iterations)
+
+
+def changes(path):
+    '''{variable path: [(time, value)]} of a VCD, the values before the first time at 0'''
+    names = {}
+    scopes = []
+    result = {}
+    time = 0
+    with open(path) as f:
+        tokens = f.read().split()
+    k = 0
+    while k < len(tokens):
+        token = tokens[k]
+        if token == '$scope':
+            scopes.append(tokens[k + 2])
+            k += 4
+        elif token == '$upscope':
+            scopes.pop()
+            k += 2
+        elif token == '$var':
+            names.setdefault(tokens[k + 3], []).append('.'.join(scopes + [tokens[k + 4]]))
+            k += 6
+        elif token in ('$date', '$timescale', '$version'):
+            k = tokens.index('$end', k) + 1
+        elif token.startswith('$'):
+            k += 1
+        elif token.startswith('#'):
+            time = int(token[1:])
+            k += 1
+        else:
+            if token[0] in 'sbr':
+                (value, ident) = (token[1:], tokens[k + 1])
+                k += 2
+            else:
+                (value, ident) = (token[0], token[1:])
+                k += 1
+            for name in names[ident]:
+                result.setdefault(name, []).append((time, value))
+    return result
+
+
+def decode(args):
+    '''Run jtag_parse with the arguments args, return its exit status and what
+    it printed'''
+    import jtag_parse
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        status = jtag_parse.main(args)
+        return status, sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
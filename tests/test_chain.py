@@ -0,0 +1,156 @@
+'''
+   Split of the scans between daisy-chained devices
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import sys
+import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jtag_parser.stages import JTAGStage
+from jtag_parser.cores import JTAGCore
+from jtag_parser.formats import BitsFormat
+from jtag_parser.chain import JTAGChain, JTAGDevice, parse_chain
+
+
+class Writer(object):
+    '''Writer keeping the changes of every variable'''
+
+    def __init__(self):
+        self.changes = {}
+
+    def register_var(self, scope, name, var_type, size=None, init=None):
+        var = scope + '.' + name
+        self.changes[var] = []
+        return var
+
+    def change(self, var, timestamp, value):
+        self.changes[var].append((timestamp, value))
+
+
+class Watcher(object):
+
+    def __init__(self):
+        self.writer = Writer()
+        self.collector = None
+
+
+class Core(JTAGCore):
+    '''Core keeping the scans it is sent'''
+
+    def __init__(self, watcher):
+        JTAGCore.__init__(self, watcher)
+        self.events = []
+
+    def instruction(self, simtime, iribits, irobits):
+        self.events.append(('instruction', simtime, iribits, irobits))
+
+    def instruction_null(self, simtime):
+        self.events.append(('instruction_null', simtime))
+
+    def data(self, simtime, dribits, drobits):
+        self.events.append(('data', simtime, dribits, drobits))
+
+    def data_null(self, simtime):
+        self.events.append(('data_null', simtime))
+
+
+class Recorder(JTAGStage):
+    '''Last stage, keeping the scans it receives'''
+
+    def __init__(self):
+        JTAGStage.__init__(self)
+        self.events = []
+
+    def reset(self, simtime):
+        self.events.append(('reset', simtime))
+
+    def instruction(self, simtime, iribits, irobits):
+        self.events.append(('instruction', simtime, iribits, irobits))
+
+    def data(self, simtime, dribits, drobits):
+        self.events.append(('data', simtime, dribits, drobits))
+
+    def data_null(self, simtime):
+        self.events.append(('data_null', simtime))
+
+
+class ChainTest(unittest.TestCase):
+
+    def setUp(self):
+        self.watcher = Watcher()
+        # cpu drives TDO, its bits are the first ones shifted
+        (self.cpu, self.bs) = [JTAGDevice(self.watcher, name, irlength, Core, 'parsed', BitsFormat())
+                               for (name, irlength, core) in parse_chain('cpu:4,bs:5')]
+        self.recorder = Recorder()
+        self.chain = JTAGChain(self.recorder, self.watcher, [self.cpu, self.bs], 'test_logic_reset')
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def test_parse_chain(self):
+        self.assertEqual(parse_chain('cpu:4:e200z0,bs:5'), [('cpu', 4, 'e200z0'), ('bs', 5, None)])
+        for text in ('cpu', 'cpu:0', 'cpu:4:e200z0:x', 'cpu:4,cpu:5'):
+            self.assertRaises(ValueError, parse_chain, text)
+
+    def test_idcodes_after_reset(self):
+        self.chain.data(10, '0' * 32 + '1' * 32, '01' * 32)
+        self.assertEqual(self.cpu.core.events, [('data', 10, '0' * 32, '01' * 16)])
+        self.assertEqual(self.bs.core.events, [('data', 10, '1' * 32, '01' * 16)])
+        # the whole scan goes on to the next stage
+        self.assertEqual(self.recorder.events, [('data', 10, '0' * 32 + '1' * 32, '01' * 32)])
+        self.assertEqual(self.watcher.writer.changes['parsed.cpu.jtag'], [(10, 'in=' + '0' * 32 + '-out=' + '01' * 16)])
+
+    def test_bypass(self):
+        self.chain.instruction(10, '0011' + '11111', '1000' + '10000')
+        self.assertEqual(self.cpu.core.events, [('instruction', 10, '0011', '1000')])
+        self.assertEqual(self.bs.core.events, [('instruction', 10, '11111', '10000')])
+        # the DR of cpu is what the 1 bit of bs leaves, bs is not sent its bit
+        self.chain.data(20, '1' * 40 + '0', '0' * 41)
+        self.assertEqual(self.cpu.core.events[1:], [('data', 20, '1' * 40, '0' * 40)])
+        self.assertEqual(self.bs.core.events[1:], [])
+        self.chain.data_null(30)
+        self.assertEqual(self.cpu.core.events[2:], [('data_null', 30)])
+        self.assertEqual(self.bs.core.events[1:], [])
+        self.assertEqual(sys.stdout.getvalue(), '')
+
+    def test_unknown_instructions(self):
+        self.chain.instruction(10, '0' * 8, '0' * 8)
+        self.assertEqual(self.cpu.core.events, [('instruction_null', 10)])
+        self.assertEqual(self.bs.core.events, [('instruction_null', 10)])
+        self.chain.data(20, '0' * 33, '0' * 33)
+        self.assertEqual(self.cpu.core.events[1:], [])
+        self.assertEqual(self.bs.core.events[1:], [])
+        self.assertEqual(self.recorder.events[-1], ('data', 20, '0' * 33, '0' * 33))
+        self.assertEqual(sys.stdout.getvalue().splitlines(), [
+            '10: CHAIN IR scan of 8 bits for a chain of 9 bits',
+            '20: CHAIN DR scan of 33 bits with the instructions of the devices unknown'])
+
+    def test_not_split(self):
+        # two data registers of unknown lengths
+        self.chain.instruction(10, '0' * 9, '0' * 9)
+        self.chain.data(20, '0' * 40, '0' * 40)
+        self.assertEqual(self.cpu.core.events[1:], [])
+        self.assertEqual(self.bs.core.events[1:], [])
+        # the IDCODE registers do not fit in the scan
+        self.chain.reset(30)
+        self.chain.data(40, '0' * 40, '0' * 40)
+        self.assertEqual(self.cpu.core.events[1:], [])
+        self.assertEqual(sys.stdout.getvalue().splitlines(), [
+            '20: CHAIN DR scan of 40 bits not split between the devices',
+            '40: CHAIN DR scan of 40 bits not split between the devices'])
+        self.assertEqual([event[0] for event in self.recorder.events], ['instruction', 'data', 'reset', 'data'])
+
+
+if __name__ == '__main__':
+    unittest.main()
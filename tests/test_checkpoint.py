@@ -0,0 +1,49 @@
+'''
+   Decode resumed from a checkpoint
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from captures import decode, write_capture
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # over the 1 MB step between the checkpoints
+        self.capture = os.path.join(self.directory, 'capture.vcd')
+        write_capture(self.capture, 800)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resumed_output_identical(self):
+        expected = os.path.join(self.directory, 'expected.vcd')
+        decode([self.capture, expected, '--core', 'e200z0'])
+        output = os.path.join(self.directory, 'out.vcd')
+        checkpoint = os.path.join(self.directory, 'decode.ckpt')
+        options = [self.capture, output, '--core', 'e200z0', '--checkpoint', checkpoint]
+        self.assertEqual(decode(options + ['--checkpoint-interval', '0'])[0], 0)
+        self.assertTrue(os.path.exists(checkpoint))
+        self.assertEqual(read(output), read(expected))
+        # a decode killed after the checkpoint left output after it
+        with open(output, 'a') as f:
+            f.write('#1\ns garbage !\n')
+        self.assertEqual(decode(options + ['--resume'])[0], 0)
+        self.assertEqual(read(output), read(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+'''
+   Round trip of the TAP events through the collapser and the expander
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jtag_parser.stages import JTAGStage
+from jtag_parser.collapse import JTAGCollapser, JTAGExpander
+
+
+class Recorder(JTAGStage):
+    '''Last stage, keeping the events it receives'''
+
+    def __init__(self):
+        JTAGStage.__init__(self)
+        self.events = []
+
+    def state(self, simtime, state):
+        self.events.append(('state', simtime, (state,)))
+
+    def reset(self, simtime):
+        self.events.append(('reset', simtime, ()))
+
+    def instruction(self, simtime, iribits, irobits):
+        self.events.append(('instruction', simtime, (iribits, irobits)))
+
+    def instruction_null(self, simtime):
+        self.events.append(('instruction_null', simtime, ()))
+
+    def data(self, simtime, dribits, drobits):
+        self.events.append(('data', simtime, (dribits, drobits)))
+
+    def data_null(self, simtime):
+        self.events.append(('data_null', simtime, ()))
+
+    def repeat(self, run):
+        self.events.append(('repeat', run.start, (run.count,)))
+
+    def flush(self):
+        self.events.append(('flush', None, ()))
+
+
+class RunCounter(JTAGStage):
+    '''Stage counting the repetitions collapsed in the runs it forwards'''
+
+    def __init__(self, nextstage):
+        JTAGStage.__init__(self, nextstage)
+        self.repetitions = 0
+
+    def repeat(self, run):
+        self.repetitions += run.count
+        self.nextstage.repeat(run)
+
+
+class Events(object):
+    '''Builder of an event stream, the time going up by 10 at every event'''
+
+    def __init__(self):
+        self.events = []
+        self.time = 0
+
+    def add(self, name, *args):
+        self.time += 10
+        self.events.append((name, None if name == 'flush' else self.time, args))
+
+    def poll(self, dr='0' * 32, states=('run_test_idle',)):
+        '''An IR scan then a DR scan, the TAP going through states after it'''
+        self.add('state', 'update_ir')
+        self.add('instruction', '00000100', '00000001')
+        self.add('state', 'update_dr')
+        self.add('data', dr, '01' * 16)
+        for state in states:
+            self.add('state', state)
+
+
+def collapsed(events):
+    '''Events received by the stages after a collapser and an expander, and the
+    number of repetitions collapsed'''
+    recorder = Recorder()
+    counter = RunCounter(JTAGExpander(recorder))
+    collapser = JTAGCollapser(counter)
+    for name, simtime, args in events:
+        if name == 'flush':
+            collapser.flush()
+        else:
+            getattr(collapser, name)(simtime, *args)
+    return recorder.events, counter.repetitions
+
+
+class CollapseTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        e = Events()
+        e.add('reset')
+        for k in range(5):
+            e.poll()
+        # a run broken by a different TAP state walk
+        e.poll(states=('run_test_idle', 'select_dr_scan'))
+        for k in range(4):
+            e.poll()
+        # and by other DR bits
+        e.poll(dr='1' * 32)
+        for k in range(3):
+            e.poll()
+        e.add('instruction_null')
+        e.add('data_null')
+        e.add('data_null')
+        e.add('flush')
+        events, repetitions = collapsed(e.events)
+        self.assertEqual(events, e.events)
+        self.assertGreater(repetitions, 0)
+
+    def test_run_broken_by_flush(self):
+        e = Events()
+        for k in range(4):
+            e.poll()
+        e.add('flush')
+        for k in range(4):
+            e.poll()
+        e.add('flush')
+        events, repetitions = collapsed(e.events)
+        self.assertEqual(events, e.events)
+        # a transaction ends with the update_ir state of the next one: the first
+        # and the last one of each half differ from the 2 repeated after the first
+        self.assertEqual(repetitions, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
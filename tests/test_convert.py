@@ -0,0 +1,44 @@
+'''
+   Decode of a binary capture written by --convert
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from captures import decode, write_capture
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class ConvertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_decode_as_the_vcd(self):
+        capture = os.path.join(self.directory, 'capture.vcd')
+        write_capture(capture, 60)
+        binary = os.path.join(self.directory, 'capture.bin')
+        self.assertEqual(decode([capture, binary, '--convert']), (0, ''))
+        expected = os.path.join(self.directory, 'expected.vcd')
+        output = os.path.join(self.directory, 'out.vcd')
+        (status, printed) = decode([capture, expected, '--core', 'e200z0'])
+        self.assertEqual(status, 0)
+        self.assertTrue(printed)
+        self.assertEqual(decode([binary, output, '--core', 'e200z0']), (0, printed))
+        self.assertEqual(read(output), read(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+'''
+   Alignment of the transactions of two captures by --diff
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from captures import HEADER, Capture, decode
+
+
+def write_polls(path, extra=None, replaced=None):
+    '''40 reads of DBSR with different DR bits, a CPUSCR write after the read
+    extra, the read replaced by a CPUSCR write'''
+    with open(path, 'w') as ofile:
+        ofile.write(HEADER.format('1 ns'))
+        capture = Capture(ofile)
+        capture.clock(0)
+        capture.clock(0)
+        for k in range(40):
+            if k == replaced:
+                capture.command(0x10, 1, 0, '1' * 192, '0' * 192)
+            else:
+                capture.command(0x30, 0, 1, format(k, '032b'), '01' * 16)
+            if k == extra:
+                capture.command(0x10, 1, 0, '1' * 192, '0' * 192)
+
+
+class DiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.a = os.path.join(self.directory, 'a.vcd')
+        write_polls(self.a)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def diff(self, **changes):
+        b = os.path.join(self.directory, 'b.vcd')
+        write_polls(b, **changes)
+        (status, printed) = decode([self.a, '--diff', b])
+        return status, printed.splitlines()
+
+    def test_same_transactions(self):
+        (status, lines) = self.diff()
+        self.assertEqual(status, 0)
+        self.assertIn('0 differing regions', lines[-1])
+
+    def test_inserted_transaction(self):
+        (status, lines) = self.diff(extra=20)
+        self.assertEqual(status, 1)
+        # the times differ after the insertion, the transactions after it still match
+        self.assertIn('region 1: a nothing, b #21-#21 (1 transactions, time', '\n'.join(lines))
+        self.assertIn('1 differing regions, 0 transactions of a and 1 of b in them', lines[-1])
+
+    def test_replaced_transaction(self):
+        (status, lines) = self.diff(replaced=10)
+        self.assertEqual(status, 1)
+        self.assertIn('region 1: a #10-#10 (1 transactions, time', '\n'.join(lines))
+        self.assertIn('1 differing regions, 1 transactions of a and 1 of b in them', lines[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
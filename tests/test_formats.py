@@ -0,0 +1,64 @@
+'''
+   Texts and vectors of the scan formats
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jtag_parser import formats
+
+
+class VectorWriter(object):
+    '''Writer keeping the last value of every variable'''
+
+    def __init__(self):
+        self.values = {}
+
+    def register_var(self, scope, name, var_type, size=None, init=None):
+        self.values[name] = init
+        return name
+
+    def change(self, var, timestamp, value):
+        self.values[var] = value
+
+
+class FormatsTest(unittest.TestCase):
+
+    def test_bits(self):
+        f = formats.BitsFormat()
+        self.assertEqual(f.instruction(0, '0011', '1000'), 'ir_i=0011-ir_o=1000')
+        self.assertEqual(f.data(0, '1x0', 'z01'), 'in=1x0-out=z01')
+
+    def test_hex(self):
+        f = formats.HexFormat()
+        # the first bit shifted is the least significant one
+        self.assertEqual(f.data(0, '10000', '00001'), 'in=0x01-out=0x10-len=5')
+        self.assertEqual(f.instruction(0, '0010000011', '1000000001'), 'ir_i=0x304-ir_o=0x201-len=10')
+        # an x or z bit makes its digit an x
+        self.assertEqual(f.data(0, '0000' + 'x000', '1111' + '111z'), 'in=0xx0-out=0xxf-len=8')
+
+    def test_truncated(self):
+        f = formats.TruncatedFormat(4)
+        self.assertEqual(f.data(0, '1010', '0101'), 'in=1010-out=0101')
+        self.assertEqual(f.data(0, '101011', '010100'), 'in=1010..-out=0101..-len=6')
+
+    def test_vector(self):
+        writer = VectorWriter()
+        f = formats.VectorFormat(writer, 'parsed', 4)
+        self.assertEqual(f.data(0, '100000', '011111'), 'dr(6)')
+        # bit 0 is the first one shifted, the vectors keep the first 4 bits
+        self.assertEqual(writer.values, {'tdi': 1, 'tdo': 14, 'length': 6})
+        self.assertEqual(f.instruction(1, '10x0z0', '000000'), 'ir(6)')
+        self.assertEqual(writer.values, {'tdi': '0x01', 'tdo': 0, 'length': 6})
+        self.assertEqual(f.data_null(2), 'in=NULL-out=NULL')
+        self.assertEqual(writer.values['length'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+'''
+   Level of detail index of the transactions of a capture
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from captures import HEADER, Capture, decode, write_capture
+from jtag_parser.lod import LodIndex
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class LodTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.capture = os.path.join(self.directory, 'capture.vcd')
+        write_capture(self.capture, 30)
+        with open(self.capture, 'a') as f:
+            # the VcdParser does not process the changes of the last time
+            f.write('#100000\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def index(self, capture, options):
+        path = os.path.join(self.directory, 'capture.lod')
+        output = os.path.join(self.directory, 'out.vcd')
+        self.assertEqual(decode([capture, output, '--lod', path, '--lod-bucket', '6'] + options)[0], 0)
+        return path
+
+    def test_index(self):
+        index = LodIndex.load(self.index(self.capture, ['--core', 'e200z0']))
+        try:
+            transactions = list(index.between(0, index.last))
+            # 30 DBSR reads and a CPUSCR write
+            self.assertEqual(len(transactions), 31)
+            self.assertEqual([t.command for t in transactions].count('CPUSCR'), 1)
+            self.assertEqual(sorted(t.time for t in transactions), [t.time for t in transactions])
+            self.assertEqual(transactions[0].dribits, '0' * 32)
+            self.assertEqual(transactions[0].drobits, '01' * 16)
+            for level in range(len(index.levels)):
+                buckets = index.view(0, index.last, level=level)
+                self.assertEqual(sum(b.transactions for b in buckets), 31)
+                for b in buckets:
+                    self.assertEqual(b.transactions, len([t for t in transactions if b.start <= t.time <= b.end]))
+            # a single bucket covers the whole capture, the core warns about the CPUSCR write
+            self.assertEqual([t.command for t in transactions if t.warning], ['CPUSCR'])
+            (top,) = index.view(0, index.last, level=len(index.levels) - 1)
+            self.assertEqual((top.transactions, top.warnings, top.command), (31, 1, 'DBSR'))
+            (start, end) = (transactions[9].time, transactions[20].time)
+            self.assertEqual(list(index.between(start, end)), transactions[9:21])
+            self.assertEqual(list(index.between(start + 1, end - 1)), transactions[10:20])
+        finally:
+            index.close()
+
+    def test_same_index_from_the_pipeline(self):
+        expected = read(self.index(self.capture, ['--core', 'e200z0']))
+        self.assertEqual(read(self.index(self.capture, ['--core', 'e200z0', '--pipeline'])), expected)
+        self.assertEqual(read(self.index(self.capture, ['--core', 'e200z0', '--jobs', '2'])), expected)
+
+    def test_unknown_bits(self):
+        capture = os.path.join(self.directory, 'unknown.vcd')
+        with open(capture, 'w') as ofile:
+            ofile.write(HEADER.format('1 ns'))
+            c = Capture(ofile)
+            c.clock(0)
+            c.clock(0)
+            c.command(0x30, 0, 1, '0' * 32, '01' * 8 + 'x' * 8 + 'z01' + '0' * 5)
+            c.command(0x30, 0, 1, '0' * 32, '01' * 16)
+            ofile.write('#100000\n')
+        index = LodIndex.load(self.index(capture, ['--core', 'silent']))
+        try:
+            (first, second) = index.between(0, index.last)
+            # the x and z bits are read back as x
+            self.assertEqual(first.drobits, '01' * 8 + 'x' * 9 + '01' + '0' * 5)
+            self.assertEqual((first.dribits, first.command), ('0' * 32, 'IR 0000110001'))
+            self.assertEqual(second.drobits, '01' * 16)
+        finally:
+            index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
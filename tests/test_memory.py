@@ -0,0 +1,58 @@
+'''
+   Peak memory of the decode against the length of the capture
+
+   The decode must only keep the header and the scan being shifted: the peak
+   RSS of a synthetic e200z0 capture and of the same capture 100 times longer
+   must be the same.  Each capture is decoded in its own process, the peak
+   RSS of a process only grows.
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from captures import ROOT, write_capture
+
+# decode a capture to a VCD, print the peak RSS in kilobytes
+DECODE = '''
+import os, sys, resource
+sys.path.insert(0, sys.argv[1])
+import jtag_parse
+stdout = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+jtag_parse.main([sys.argv[2], sys.argv[3], '--core', 'e200z0'])
+sys.stdout = stdout
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+class PeakMemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def peak_rss(self, iterations):
+        path = os.path.join(self.directory, 'capture%d.vcd' % iterations)
+        write_capture(path, iterations)
+        output = subprocess.check_output([sys.executable, '-c', DECODE, ROOT, path,
+                                          os.path.join(self.directory, 'out.vcd')])
+        return int(output.split()[-1])
+
+    def test_flat_peak_rss(self):
+        small = self.peak_rss(100)
+        large = self.peak_rss(10000)
+        # 1 MB of slack for the allocator, the large capture is about 16 MB
+        self.assertLess(large - small, 1024, 'peak RSS {} KB for 1x, {} KB for 100x'.format(small, large))
+
+
+if __name__ == '__main__':
+    unittest.main()
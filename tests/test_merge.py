@@ -0,0 +1,40 @@
+'''
+   Output of --merge against the input and the decoded output
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from captures import changes, decode, write_capture
+
+
+class MergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_input_and_decoded_changes(self):
+        capture = os.path.join(self.directory, 'capture.vcd')
+        write_capture(capture, 40)
+        merged = os.path.join(self.directory, 'merged.vcd')
+        decoded = os.path.join(self.directory, 'decoded.vcd')
+        self.assertEqual(decode([capture, merged, '--merge', '--core', 'e200z0'])[0], 0)
+        self.assertEqual(decode([capture, decoded, '--core', 'e200z0'])[0], 0)
+        merged = changes(merged)
+        expected = changes(capture)
+        expected.update(changes(decoded))
+        self.assertEqual(sorted(merged), sorted(expected))
+        for name in expected:
+            self.assertEqual(merged[name], expected[name], name)
+
+
+if __name__ == '__main__':
+    unittest.main()
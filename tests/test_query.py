@@ -0,0 +1,67 @@
+'''
+   Queries started from the points of a time index
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from captures import decode, write_capture
+from jtag_parser.query import TimeIndex
+
+
+class Point(object):
+    '''Stand-in for the parser, the watcher and the query seen by TimeIndex.record'''
+
+    def __init__(self, now, offset):
+        self.now = now
+        self.offset = offset
+        self.watched_changes = {'0': '1'}
+        self.curstate = 'run_test_idle'
+        self.lastir = None
+
+
+class TimeIndexTest(unittest.TestCase):
+
+    def test_lookup(self):
+        index = TimeIndex(None, step=10)
+        for k in range(1, 6):
+            point = Point(100 * k, 10 * k)
+            index.record(point, point, point)
+        self.assertIsNone(index.lookup(99))
+        self.assertEqual(index.lookup(100)[:2], [100, 10])
+        self.assertEqual(index.lookup(399)[:2], [300, 30])
+        self.assertEqual(index.lookup(10 ** 9)[:2], [500, 50])
+
+
+class IndexedQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # over the 1 MB step of the index
+        self.capture = os.path.join(self.directory, 'capture.vcd')
+        write_capture(self.capture, 800)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_transactions_from_the_index(self):
+        query = [self.capture, '--query', '--core', 'e200z0', '--start', '100000']
+        status, expected = decode(query)
+        self.assertEqual(status, 0)
+        self.assertTrue(expected)
+        path = os.path.join(self.directory, 'capture.idx')
+        # the first query builds the index, the second one starts from its entry
+        self.assertEqual(decode(query + ['--index', path]), (0, expected))
+        index = TimeIndex.load(path, TimeIndex.make_key(self.capture,
+            ('capture', 'tck', 'tms', 'tdi', 'tdo', 'test_logic_reset')))
+        self.assertTrue(index.lookup(100000))
+        self.assertEqual(decode(query + ['--index', path]), (0, expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+'''
+   Decode of the sample dumps of a logic analyzer
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from captures import changes, decode, write_capture, write_samples
+
+
+class SamplesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # the VCD has a 1 ns timescale, the samples are taken at 1 GHz
+        capture = os.path.join(self.directory, 'capture.vcd')
+        write_capture(capture, 30)
+        with open(capture, 'a') as f:
+            # the VcdParser does not process the changes of the last time
+            f.write('#100000\n')
+        self.expected = os.path.join(self.directory, 'expected.vcd')
+        (status, self.printed) = decode([capture, self.expected, '--core', 'e200z0'])
+        self.assertTrue(self.printed)
+        self.packed = os.path.join(self.directory, 'capture.bin')
+        write_samples(self.packed, 30)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, dump, options):
+        output = os.path.join(self.directory, 'out.vcd')
+        self.assertEqual(decode([dump, output, '--core', 'e200z0', '--sample-rate', '1e9'] + options),
+                         (0, self.printed))
+        self.assertEqual(changes(output), changes(self.expected))
+
+    def test_packed(self):
+        self.check(self.packed, ['--channels', 'tck,tms,tdi,tdo'])
+
+    def test_csv(self):
+        dump = os.path.join(self.directory, 'capture.csv')
+        with open(self.packed, 'rb') as f:
+            samples = bytearray(f.read())
+        with open(dump, 'w') as f:
+            f.write('Time [s],tck,tms,tdi,tdo\n')
+            for k, levels in enumerate(samples):
+                f.write('{:e},{},{},{},{}\n'.format(k * 1e-9, *[(levels >> c) & 1 for c in range(4)]))
+        self.check(dump, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+'''
+   Replay of the TAP events saved in a scan cache
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from captures import decode, write_capture
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class ScanCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.capture = os.path.join(self.directory, 'capture.vcd')
+        write_capture(self.capture, 30)
+        self.cache = os.path.join(self.directory, 'capture.scans')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def decode(self, options):
+        '''Decoded output, printed log and report of the suppressed changes'''
+        output = os.path.join(self.directory, 'out.vcd')
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            (status, printed) = decode([self.capture, output] + options)
+            report = [l for l in sys.stderr.getvalue().splitlines() if l.startswith('suppressed')]
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(status, 0)
+        return read(output), printed, report
+
+    def test_replay(self):
+        for core in ('e200z0', 'simple'):
+            (expected, printed, report) = self.decode(['--core', core, '--drop-redundant'])
+            self.assertEqual(len(report), 1)
+            # recorded by the first decode, replayed by the other one
+            self.assertEqual(self.decode(['--core', core, '--drop-redundant', '--scan-cache', self.cache]),
+                             (expected, printed, report if core == 'e200z0' else []))
+            self.assertTrue(os.path.isfile(self.cache))
+
+    def test_other_signal_decoding(self):
+        self.decode(['--core', 'e200z0', '--scan-cache', self.cache])
+        recorded = os.stat(self.cache).st_ino
+        self.decode(['--core', 'e200z0', '--scan-cache', self.cache])
+        self.assertEqual(os.stat(self.cache).st_ino, recorded)
+        # the cache is for the capture without --drop-redundant, it is recorded again
+        (output, printed, report) = self.decode(['--core', 'e200z0', '--drop-redundant', '--scan-cache', self.cache])
+        self.assertEqual(len(report), 1)
+        self.assertNotEqual(os.stat(self.cache).st_ino, recorded)
+
+
+if __name__ == '__main__':
+    unittest.main()
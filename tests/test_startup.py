@@ -0,0 +1,59 @@
+'''
+   Cold start of jtag_parse.py
+
+   A short decode is mostly startup: importing jtag_parse must not import
+   pyvcd, the cores or the stages of the optional modes, and a decode only
+   imports what its options use.  Each check runs in a fresh interpreter.
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules only imported by the modes using them
+LAZY = ['vcd', 'vcd.writer', 'argparse', 'multiprocessing', 'socket', 'gzip', 'bz2',
+        'jtag_parser.e200z0', 'jtag_parser.collapse', 'jtag_parser.summary', 'jtag_parser.query',
+        'jtag_parser.pipeline', 'jtag_parser.checkpoint', 'jtag_parser.parallel', 'jtag_parser.memory',
+        'jtag_parser.diff', 'jtag_parser.preview', 'jtag_parser.scancache', 'jtag_parser.chain',
+        'jtag_parser.analytics', 'jtag_parser.lod', 'jtag_parser.daemon',
+        'vcd_parser.binary', 'vcd_parser.samples', 'vcd_parser.reader']
+
+# print the lazy modules imported by running the code in argv[2]
+CHECK = '''
+import os, sys, json
+sys.path.insert(0, sys.argv[1])
+stdout = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+exec(sys.argv[2])
+sys.stdout = stdout
+print(json.dumps([m for m in json.loads(sys.argv[3]) if sys.modules.get(m) is not None]))
+'''
+
+
+def imported(code):
+    output = subprocess.check_output([sys.executable, '-c', CHECK, ROOT, code, json.dumps(LAZY)], cwd=ROOT)
+    return json.loads(output.decode('ascii').splitlines()[-1])
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_import(self):
+        self.assertEqual(imported('import jtag_parse'), [])
+
+    def test_summary(self):
+        # the default core, no VCD written
+        self.assertEqual(set(imported('import jtag_parse\n'
+                                      'jtag_parse.main(["tests/jtag_capture.vcd", "--summary"])')),
+                         set(['argparse', 'jtag_parser.summary', 'vcd_parser.binary',
+                              'vcd_parser.samples', 'vcd_parser.reader']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+'''
+   Decode of a capture with redundant changes and glitches on TCK
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from captures import HEADER, Capture, decode, write_commands
+
+
+class NoisyCapture(Capture):
+    '''Capture with a 1 time pulse on TCK and the TMS level written again in
+    the low phase of every clock, of 10 times'''
+
+    clocks = 0
+
+    def clock(self, tms, tdi='0', tdo='0'):
+        lines = ['#%d' % (self.time + 5), '00']
+        for ident, value in (('1', str(tms)), ('2', tdi), ('3', tdo)):
+            if self.values[ident] != value:
+                self.values[ident] = value
+                lines.append(value + ident)
+        lines += ['#%d' % (self.time + 6), '10', '#%d' % (self.time + 7), '00',
+                  '#%d' % (self.time + 8), str(tms) + '1', '#%d' % (self.time + 10), '10', '']
+        self.time += 10
+        self.clocks += 1
+        self.ofile.write('\n'.join(lines))
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class SuppressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, capture_class):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as ofile:
+            ofile.write(HEADER.format('1 ns'))
+            capture = capture_class(ofile, 10)
+            write_commands(capture, 20)
+        return path, capture
+
+    def decode(self, capture, options):
+        '''Decoded output, printed log and report of the suppressed changes'''
+        output = os.path.join(self.directory, 'out.vcd')
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            (status, printed) = decode([capture, output, '--core', 'e200z0'] + options)
+            report = [l for l in sys.stderr.getvalue().splitlines() if l.startswith('suppressed')]
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(status, 0)
+        return read(output), printed, report
+
+    def test_same_decode_as_the_clean_capture(self):
+        (expected, printed, report) = self.decode(self.write('clean.vcd', Capture)[0], [])
+        self.assertEqual(report, [])
+        (noisy, capture) = self.write('noisy.vcd', NoisyCapture)
+        self.assertNotEqual(self.decode(noisy, [])[:2], (expected, printed))
+        (output, noisy_printed, report) = self.decode(noisy, ['--drop-redundant', '--min-pulse', '3'])
+        self.assertEqual((output, noisy_printed), (expected, printed))
+        # the TMS of every clock and the TCK low of the first one, already low
+        # in the dumpvars, are redundant; a glitch is a change to 1 and back to 0
+        self.assertEqual(report, ['suppressed {} redundant changes and {} changes of glitches'.format(
+            capture.clocks + 1, 2 * capture.clocks)])
+
+
+if __name__ == '__main__':
+    unittest.main()
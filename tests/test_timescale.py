@@ -0,0 +1,69 @@
+'''
+   Timescale of the output VCD
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from captures import changes, decode, write_capture
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def timescale(path):
+    return re.search(r'\$timescale\s+(.*?)\s+\$end', read(path)).group(1)
+
+
+class TimescaleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # the same capture in ns and in 100 ps
+        self.ns = os.path.join(self.directory, 'ns.vcd')
+        write_capture(self.ns, 10)
+        self.ps = os.path.join(self.directory, 'ps.vcd')
+        write_capture(self.ps, 10, '100 ps', 20)
+        self.expected = os.path.join(self.directory, 'expected.vcd')
+        decode([self.ns, self.expected, '--core', 'e200z0'])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_follows_the_input(self):
+        output = os.path.join(self.directory, 'out.vcd')
+        self.assertEqual(decode([self.ps, output, '--core', 'e200z0'])[0], 0)
+        self.assertEqual(timescale(output), '100 ps')
+        expected = dict((name, [(time * 10, value) for (time, value) in values])
+                        for name, values in changes(self.expected).items())
+        self.assertEqual(changes(output), expected)
+
+    def test_converted(self):
+        output = os.path.join(self.directory, 'out.vcd')
+        self.assertEqual(decode([self.ps, output, '--core', 'e200z0', '-t', '1 ns'])[0], 0)
+        self.assertEqual(timescale(output), '1 ns')
+        self.assertEqual(read(output), read(self.expected))
+
+    def test_converted_to_a_coarser_timescale(self):
+        output = os.path.join(self.directory, 'out.vcd')
+        self.assertEqual(decode([self.ns, output, '--core', 'e200z0', '-t', '10 ns'])[0], 0)
+        self.assertEqual(timescale(output), '10 ns')
+        # the times are rounded down, the changes of a time are all kept but the
+        # ones of time 0, where the $dumpvars only holds the last one
+        expected = {}
+        for name, values in changes(self.expected).items():
+            rounded = [(time // 10, value) for (time, value) in values]
+            expected[name] = [c for c in rounded if c[0] == 0][-1:] + [c for c in rounded if c[0] > 0]
+        self.assertEqual(changes(output), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
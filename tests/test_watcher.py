@@ -0,0 +1,99 @@
+'''
+   Bookkeeping of the trackers of a VcdWatcher
+
+   python -m unittest discover tests
+
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vcd_parser.parser import VcdParser
+from vcd_parser.watcher import VcdWatcher
+from vcd_parser.tracker import VcdTracker
+
+
+class CountingTracker(VcdTracker):
+    '''Tracker finishing after the number of updates given by the watcher'''
+
+    __slots__ = ('lifetime', 'updates')
+
+    def start(self):
+        self.lifetime = self.watcher.lifetimes.pop(0)
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+        self.watcher.updates.append((self.lifetime, self.updates))
+        if self.updates == self.lifetime:
+            self.finished = True
+            self.watcher.done.append(self.lifetime)
+
+
+class StartingWatcher(VcdWatcher):
+    '''Watcher starting a tracker at every update, while lifetimes remain'''
+
+    def __init__(self, lifetimes, pooled):
+        VcdWatcher.__init__(self)
+        self.lifetimes = list(lifetimes)
+        self.updates = []
+        self.done = []
+        self.set_tracker(CountingTracker, pooled)
+
+    def start_tracker(self):
+        return bool(self.lifetimes)
+
+
+class OwnInitWatcher(StartingWatcher):
+    '''Watcher whose __init__ does not call the one of VcdWatcher'''
+
+    def __init__(self, lifetimes):
+        self.lifetimes = list(lifetimes)
+        self.updates = []
+        self.done = []
+        self.set_tracker(CountingTracker)
+
+
+class TrackerTest(unittest.TestCase):
+
+    def run_trackers(self, lifetimes, pooled):
+        watcher = StartingWatcher(lifetimes, pooled)
+        steps = 0
+        while watcher.lifetimes or watcher.trackers:
+            watcher.notify({}, {})
+            steps += 1
+            self.assertLess(steps, 10000)
+        return watcher
+
+    def test_every_tracker_updated_until_finished(self):
+        # trackers finishing out of order, behind longer ones
+        lifetimes = [(k * 7) % 13 + 1 for k in range(500)]
+        for pooled in (False, True):
+            watcher = self.run_trackers(lifetimes, pooled)
+            self.assertEqual(sorted(watcher.done), sorted(lifetimes))
+            self.assertEqual(len(watcher.updates), sum(lifetimes))
+            self.assertEqual(watcher.finished_trackers, 0)
+
+    def test_pooled_trackers_reused(self):
+        watcher = self.run_trackers([3] * 100, True)
+        # at most 3 trackers alive at once, and the finished one of the update
+        self.assertLessEqual(len(watcher.free_trackers), 4)
+
+    def test_watcher_without_base_init(self):
+        watchers = [OwnInitWatcher([2, 1]), OwnInitWatcher([1])]
+        for watcher in watchers:
+            VcdParser().register_watcher(watcher)
+            watcher.add_watching('tdi', 'top')
+        while watchers[0].lifetimes or watchers[0].trackers:
+            watchers[0].notify({}, {})
+        self.assertEqual(watchers[0].done, [2, 1])
+        # nothing shared between the instances
+        self.assertEqual(watchers[1].watching, ['top.tdi'])
+        self.assertEqual(len(watchers[1].trackers), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
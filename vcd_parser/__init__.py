@@ -18,7 +18,7 @@
 
 '''
 
-__all__ = ['parser', 'watcher', 'tracker', 'v2d']
+__all__ = ['parser', 'watcher', 'tracker', 'reader', 'binary', 'samples', 'v2d']
 
 def v2d(value):
 
@@ -0,0 +1,298 @@
+'''
+  Compact binary captures of scalar signals
+
+  A VCD is a poor format to decode the same few one bit signals again and
+  again.  The BinaryConverter watcher records the changes of a set of scalar
+  signals while a VCD is parsed, and writes them in a binary capture that is
+  much smaller and faster to read back:
+
+    magic       'VCDBIN1\n'
+    header      u32 length + JSON: timescale, date, signals [xmr, type, size],
+                steps per block, compression
+    blocks      u32 length + u8 compressed flag + payload (zlib if compressed)
+    index       JSON list of [first time, last time, block offset, steps]
+    trailer     u64 offset of the index
+
+  A step is a time where at least one signal had a change.  The payload of a
+  block holds the number of steps, the time of the first step, the deltas
+  between the times of the next steps (LEB128 varints) and three bit-planes
+  per signal, bit k being for step k: the signal had a change, its level
+  after the step, its level is unknown (x, or z when the level bit is set).
+
+  A BinaryCapture reads such a file.  It can replay the steps into a
+  VcdParser, so that registered watchers see the same notifications as with
+  the VCD, or extract directly the values sampled at the rising edges of a
+  clock, using whole-plane integer operations to find the edges.
+
+'''
+
+import json
+import zlib
+import struct
+import binascii
+
+MAGIC = b'VCDBIN1\n'
+
+# level and unknown bits of the scalar values, and back
+value_bits = {'0': (0, 0), '1': (1, 0), 'x': (0, 1), 'X': (0, 1), 'z': (1, 1), 'Z': (1, 1)}
+bits_value = {(0, 0): '0', (1, 0): '1', (0, 1): 'x', (1, 1): 'z'}
+
+
+def plane2int(plane):
+  '''Bit k of the integer is bit k of the little endian plane'''
+  if not plane:
+    return 0
+  return int(binascii.hexlify(bytes(bytearray(reversed(plane)))), 16)
+
+
+def int2plane(value, length):
+  '''Inverse of plane2int, length is the number of bytes'''
+  h = '%x' % value
+  h = '0' * (2 * length - len(h)) + h
+  return bytearray(reversed(bytearray(binascii.unhexlify(h[-2 * length:]))))
+
+
+class BinaryConverter(object):
+  '''Watcher writing the changes of scalar signals in a binary capture'''
+
+  def __init__(self, ofile, xmrs, compress=True, block_steps=1 << 16):
+    self.ofile = ofile
+    self.xmrs = list(xmrs)
+    self.compress = compress
+    self.block_steps = block_steps
+    self.parser = None
+    self.index = []
+    self.levels = None
+
+
+  def add_parser(self, parser):
+    self.parser = parser
+
+
+  def update_ids(self):
+    '''Callback after the VCD header is parsed, write the header of the capture'''
+    self.ids = [self.parser.get_id(xmr) for xmr in self.xmrs]
+    signals = []
+    for xmr, id in zip(self.xmrs, self.ids):
+      (var_type, size, reference) = self.parser.idcode2references[id][0]
+      if size != '1':
+        raise ValueError('Only scalar signals can be converted: ' + xmr)
+      signals.append([xmr, var_type, 1])
+    header = json.dumps({'timescale': getattr(self.parser, 'timescale', None),
+                         'date': getattr(self.parser, 'date', None),
+                         'signals': signals,
+                         'block_steps': self.block_steps,
+                         'compression': 'zlib' if self.compress else None}).encode('ascii')
+    self.ofile.write(MAGIC + struct.pack('<I', len(header)) + header)
+    self.levels = [(0, 1)] * len(self.ids)
+    self.new_block()
+
+
+  def get_sensitive_ids(self):
+    return self.ids
+
+
+  def get_watching_ids(self):
+    return self.ids
+
+
+  def new_block(self):
+    n = (self.block_steps + 7) // 8
+    self.steps = 0
+    self.times = []
+    self.planes = [(bytearray(n), bytearray(n), bytearray(n)) for id in self.ids]
+
+
+  def notify(self, activity, values):
+    '''A signal changed at the current time of the parser, record the step'''
+    k = self.steps
+    byte = k >> 3
+    bit = 1 << (k & 7)
+    for i, id in enumerate(self.ids):
+      (changed, level, unknown) = self.planes[i]
+      if id in activity:
+        changed[byte] |= bit
+        self.levels[i] = value_bits[activity[id]]
+      (l, u) = self.levels[i]
+      if l:
+        level[byte] |= bit
+      if u:
+        unknown[byte] |= bit
+    self.times.append(self.parser.now)
+    self.steps += 1
+    if self.steps == self.block_steps:
+      self.write_block()
+
+
+  def write_block(self):
+    if not self.steps:
+      return
+    n = (self.steps + 7) // 8
+    deltas = bytearray()
+    previous = self.times[0]
+    for t in self.times[1:]:
+      d = t - previous
+      previous = t
+      while d >= 0x80:
+        deltas.append((d & 0x7F) | 0x80)
+        d >>= 7
+      deltas.append(d)
+    payload = bytearray(struct.pack('<IQI', self.steps, self.times[0], len(deltas)))
+    payload += deltas
+    for planes in self.planes:
+      for plane in planes:
+        payload += plane[:n]
+    payload = bytes(payload)
+    if self.compress:
+      payload = zlib.compress(payload)
+    offset = self.ofile.tell()
+    self.ofile.write(struct.pack('<IB', len(payload), 1 if self.compress else 0) + payload)
+    self.index.append([self.times[0], self.times[-1], offset, self.steps])
+    self.new_block()
+
+
+  def close(self):
+    '''Write the last block, the index and the trailer'''
+    self.write_block()
+    offset = self.ofile.tell()
+    self.ofile.write(json.dumps(self.index).encode('ascii'))
+    self.ofile.write(struct.pack('<Q', offset))
+
+
+class BinaryBlock(object):
+  '''Steps of a block: times, and per signal the (changed, level, unknown) planes'''
+
+  def __init__(self, payload, nsignals):
+    (self.steps, first, ndeltas) = struct.unpack_from('<IQI', payload)
+    pos = struct.calcsize('<IQI')
+    deltas = bytearray(payload[pos:pos + ndeltas])
+    pos += ndeltas
+    times = [first]
+    t = first
+    d = 0
+    shift = 0
+    for b in deltas:
+      d |= (b & 0x7F) << shift
+      if b & 0x80:
+        shift += 7
+      else:
+        t += d
+        times.append(t)
+        d = 0
+        shift = 0
+    self.times = times
+    n = (self.steps + 7) // 8
+    self.planes = []
+    for i in range(nsignals):
+      planes = []
+      for j in range(3):
+        planes.append(bytearray(payload[pos:pos + n]))
+        pos += n
+      self.planes.append(tuple(planes))
+
+
+class BinaryCapture(object):
+  '''Reader of a binary capture'''
+
+  def __init__(self, fh):
+    self.fh = fh
+    if fh.read(len(MAGIC)) != MAGIC:
+      raise ValueError('Not a binary capture')
+    (length,) = struct.unpack('<I', fh.read(4))
+    header = json.loads(fh.read(length).decode('ascii'))
+    self.timescale = header['timescale'] and str(header['timescale'])
+    self.date = header['date'] and str(header['date'])
+    self.signals = [str(xmr) for (xmr, var_type, size) in header['signals']]
+    self.var_types = [str(var_type) for (xmr, var_type, size) in header['signals']]
+    fh.seek(-8, 2)
+    end = fh.tell()
+    (offset,) = struct.unpack('<Q', fh.read(8))
+    fh.seek(offset)
+    self.index = json.loads(fh.read(end - offset).decode('ascii'))
+
+
+  @staticmethod
+  def is_binary(fh):
+    '''Check the magic of a seekable file, leaving its position unchanged'''
+    position = fh.tell()
+    magic = fh.read(len(MAGIC))
+    fh.seek(position)
+    return magic == MAGIC
+
+
+  def blocks(self, start=None):
+    '''Generate the blocks, skipping those ending before start'''
+    for (first, last, offset, steps) in self.index:
+      if start is not None and last < start:
+        continue
+      self.fh.seek(offset)
+      (length, compressed) = struct.unpack('<IB', self.fh.read(5))
+      payload = self.fh.read(length)
+      if compressed:
+        payload = zlib.decompress(payload)
+      yield BinaryBlock(payload, len(self.signals))
+
+
+  def define(self, parser):
+    '''Declare the signals in the parser as a VCD header would, and end the definitions.
+    The signal i gets the VCD identifier str(i)'''
+    parser.timescale = self.timescale
+    if self.date is not None:
+      parser.date = self.date
+    for i, (xmr, var_type) in enumerate(zip(self.signals, self.var_types)):
+      parser.declare(xmr, var_type, '1', str(i))
+    parser.end_definitions()
+
+
+  def feed(self, parser):
+    '''Replay the capture into the parser, the watchers are notified as with the VCD'''
+    self.define(parser)
+    ids = [str(i) for i in range(len(self.signals))]
+    for block in self.blocks():
+      for k, t in enumerate(block.times):
+        parser.update_time(t)
+        if parser.stopped:
+          break
+        byte = k >> 3
+        bit = 1 << (k & 7)
+        changes = {}
+        for id, (changed, level, unknown) in zip(ids, block.planes):
+          if changed[byte] & bit:
+            changes[id] = bits_value[(1 if level[byte] & bit else 0, 1 if unknown[byte] & bit else 0)]
+        parser.changes = changes
+      if parser.stopped:
+        break
+    parser.end_of_changes()
+
+
+  def edges(self, clock, signals):
+    '''Generate (time, values) at each rising edge of the clock signal (a change to 1),
+    values being the levels of the signals just before the edge, as VCD characters.
+    clock and signals are indexes in self.signals'''
+    # levels before the first step are unknown
+    carry = [(0, 1)] * len(self.signals)
+    for block in self.blocks():
+      n = (block.steps + 7) // 8
+      (changed, level, unknown) = [plane2int(p) for p in block.planes[clock]]
+      rising = changed & level & ~unknown
+      rising = int2plane(rising, n)
+      # levels of the signals at the previous step
+      previous = []
+      for s in signals:
+        (c, l, u) = block.planes[s]
+        (cl, cu) = carry[s]
+        previous.append((int2plane((plane2int(l) << 1) | cl, n + 1),
+                         int2plane((plane2int(u) << 1) | cu, n + 1)))
+      for byte, b in enumerate(rising):
+        if not b:
+          continue
+        for j in range(8):
+          if b & (1 << j):
+            values = []
+            for (l, u) in previous:
+              values.append(bits_value[((l[byte] >> j) & 1, (u[byte] >> j) & 1)])
+            yield block.times[(byte << 3) | j], values
+      k = block.steps - 1
+      for s in range(len(self.signals)):
+        (c, l, u) = block.planes[s]
+        carry[s] = ((l[k >> 3] >> (k & 7)) & 1, (u[k >> 3] >> (k & 7)) & 1)
@@ -30,14 +30,62 @@
 
 '''
 
-from itertools import dropwhile, takewhile, izip
-from collections import defaultdict
+from itertools import dropwhile, takewhile, izip, chain
+from collections import defaultdict, deque
 import sys
+import re
+import time
 
 from watcher import VcdWatcher
 
+# femtoseconds in a time unit
+time_units = {'s': 10**15, 'ms': 10**12, 'us': 10**9, 'ns': 10**6, 'ps': 10**3, 'fs': 1}
+
+
+def timescale_unit(timescale):
+  '''Duration of a timescale such as "10 ns" in femtoseconds, None if it cannot be read'''
+  match = re.match(r'\s*(\d+)\s*([munpf]?s)\s*$', timescale or '')
+  if match is None:
+    return None
+  return int(match.group(1)) * time_units[match.group(2)]
+
+
+class Scope(object):
+  '''Node of the hierarchy declared by the definitions, shared by the variables it declares.
+  path is its XMR, wanted tells whether its variables get references'''
+
+  __slots__ = ('parent', 'type', 'name', 'path', 'wanted', 'scopes', 'vars')
+
+  def __init__(self, parent=None, type=None, name=None, inscope=None):
+    self.parent = parent
+    self.type = type
+    self.name = name
+    self.scopes = {}
+    # variable name -> identifier code, of the wanted variables
+    self.vars = {}
+    if parent is None:
+      self.path = ''
+      self.wanted = not inscope
+    else:
+      self.path = parent.path + '.' + name if parent.path else name
+      # the scopes below a wanted one are wanted
+      self.wanted = parent.wanted or self.path == inscope
+
+
+  def child(self, type, name, inscope):
+    '''The scope name in this one, created if not declared yet'''
+    scope = self.scopes.get(name)
+    if scope is None:
+      scope = self.scopes[name] = Scope(self, type, name, inscope)
+    return scope
+
+
 class VcdParser(object):
   ''' A parser object for VCD files.  Reads definitions and walks through the value changes'''
+
+  # the XMRs cached by get_xmr are dropped when there are this many, so that the memory used
+  # does not grow with the number of signals shown
+  xmr_cache_size = 4096
      
   def __init__(self):
 
@@ -61,34 +109,68 @@ class VcdParser(object):
 
     self.keyword_dispatch = defaultdict(self.parse_error, keyword_functions)
  
-    self.scope = []
+    # root of the scopes, and the scope the declarations go in
+    self.root = Scope()
+    self.scope = self.root
+    # only the variables in this scope, or below, get references when set (see set_inscope)
+    self.inscope = None
+    self.skipped_vars = 0
+    # seconds spent in the definitions, set at their end
+    self.header_started = None
+    self.header_time = None
+    # times are integers, in the timescale of the VCD: time_unit femtoseconds
+    # (None when the timescale is missing), known at the end of the definitions
     self.now = 0
     self.then = 0
+    self.time_unit = None
     self.idcode2references = defaultdict(list)
     self.xmr_cache = dict()
     self.end_of_definitions = False
     self.changes = {}
     self.watchers = []
+    self.time_hooks = []
+    self.definitions_hooks = []
     self.debug = False
 
     self.watched_changes = {}
 
+    # byte offset of the line being tokenised, only maintained if track_offset is set
+    self.track_offset = False
+    self.offset = 0
+    # (offset, time, watched_changes) to continue from once the definitions are parsed
+    self.resume_point = None
+    # file where every line is copied once its tokens are processed
+    self.echo = None
+
+    # event reduction, to set before parsing: drop the changes of the signals looked at by the
+    # watchers that do not change their value, and the pulses of the signals given in min_pulse
+    # (XMR -> width) shorter than their width.  The changes dropped are counted in suppressed
+    self.drop_redundant = False
+    self.min_pulse = {}
+    self.suppressed = {'redundant': 0, 'glitch': 0}
+    # set at the end of the definitions
+    self.redundant_ids = ()
+    self.values = {}
+    self.pulse_widths = {}
+    # with pulse widths, the notifications wait in delayed until no pulse can end later
+    self.delayed = None
+
+    # set by stop, the parsing ends at the next time update
+    self.stopped = False
+
 
   def get_id(self, xmr):
     '''Given a Cross Module Reference (XMR) find the associated VCD ID string'''
     search_path = xmr.split('.')
 
-    for id in self.idcode2references:
-      (var_type, size, reference) = self.idcode2references[id][0]
-      match = True  
-      for depth, node in enumerate(search_path):
-        var_type, name = reference[depth]
-        if node == name:
-          continue
-        else:
-          match = False
-          break
-      if match:
+    scope = self.root
+    for name in search_path[:-1]:
+      scope = scope.scopes.get(name)
+      if scope is None:
+        break
+    else:
+      id = scope.vars.get(search_path[-1])
+      if id is not None:
         return id
 
     raise ValueError('No match for ', xmr)
@@ -105,8 +187,10 @@ class VcdParser(object):
     if id in self.xmr_cache:
       return self.xmr_cache[id]
 
-    (type, size, refs) = self.idcode2references[id][0]
-    xmr = ".".join([ v for (k, v) in refs])
+    (type, size, (scope, name)) = self.idcode2references[id][0]
+    xmr = scope.path + '.' + name if scope.path else name
+    if len(self.xmr_cache) >= self.xmr_cache_size:
+      self.xmr_cache.clear()
     self.xmr_cache[id] = xmr
     return xmr
 
@@ -132,6 +216,55 @@ class VcdParser(object):
     self.watchers.remove(watcher)
 
 
+  def register_time_hook(self, hook):
+    '''Add a function called with the parser after each time update, once all watchers are updated'''
+    self.time_hooks.append(hook)
+
+
+  def register_definitions_hook(self, hook):
+    '''Add a function called with the parser at the end of the definitions, before the watchers'''
+    self.definitions_hooks.append(hook)
+
+
+  def set_inscope(self, inscope):
+    '''Only give references to the variables in the scope inscope (an XMR) and below it, to set
+    before parsing.  The others are skipped, counted in skipped_vars: with a huge hierarchy only
+    a few signals are looked for, building the references of all the others is wasted'''
+    self.inscope = inscope
+    self.root.wanted = not inscope
+
+
+  def declare(self, xmr, var_type, size, identifier_code):
+    '''Declare a variable as a $var in the scopes of its XMR would'''
+    path = xmr.split('.')
+    scope = self.root
+    for name in path[:-1]:
+      scope = scope.child('module', name, self.inscope)
+    self.add_var(scope, var_type, size, identifier_code, path[-1])
+
+
+  def add_var(self, scope, var_type, size, identifier_code, name):
+    if not scope.wanted:
+      self.skipped_vars += 1
+      return
+    # the reference is the shared scope node and the name of the variable
+    self.idcode2references[identifier_code].append((var_type, size, (scope, name)))
+    scope.vars.setdefault(name, identifier_code)
+
+
+  def stop(self):
+    '''Stop the parsing at the next time update, the changes of the time reached are not processed.
+       Watchers, cores, hooks and other threads can call it'''
+    self.stopped = True
+
+
+  def set_resume_point(self, offset, now, watched_changes):
+    '''Continue the parsing from a #time line at the given offset, instead of the
+       beginning of the value changes. now and watched_changes must be the values
+       the parser had when it reached that offset'''
+    self.resume_point = (offset, now, watched_changes)
+
+
   def update_time(self, next_time):
     '''Reached an update point in time in the VCD - use the collected changes
      and update any watchers that are sensitive to a signal that has changed'''
@@ -142,49 +275,173 @@ class VcdParser(object):
       for change in self.changes:
         print self.get_xmr(change), self.changes[change]
 
-    # Check sensitivity lists to see if a watcher needs to be notified of changes
+    if self.redundant_ids:
+      self.drop_redundant_changes()
+
+    # Check sensitivity lists to see if a watcher needs to be notified of changes,
+    # nothing is allocated for the times without a change of a sensitive signal
+    changes = self.changes
     for watcher in self.watchers:
-      update_needed = False
-      activity = {}
+      activity = None
       for id in watcher.get_sensitive_ids():
-        if id in self.changes:
-          update_needed = True
-          activity[id] = self.changes[id]
+        if id in changes:
+          if activity is None:
+            activity = {}
+          activity[id] = changes[id]
 
-      if update_needed:
+      if activity is not None:
         collected_changes = {}
         for id in watcher.get_watching_ids():
           collected_changes[id] = self.watched_changes[id]
 
-        watcher.notify(activity, collected_changes)
+        if self.delayed is None:
+          watcher.notify(activity, collected_changes)
+        else:
+          self.delay(watcher, activity, collected_changes)
 
     self.update_watched_changes()
-    self.changes = {}
+    changes.clear()
     self.then = current_time
     self.now = next_time
 
+    if self.delayed:
+      self.release(next_time)
+
+    for hook in self.time_hooks:
+      hook(self)
+
+
+  def drop_redundant_changes(self):
+    '''Drop the changes to the value a signal already has'''
+    for id in self.redundant_ids:
+      if id in self.changes:
+        value = self.changes[id]
+        if self.values.get(id) == value:
+          del self.changes[id]
+          self.suppressed['redundant'] += 1
+        else:
+          self.values[id] = value
+
+
+  def delay(self, watcher, activity, collected_changes):
+    '''Queue a notification, dropping the pulses shorter than their width: a change
+       that follows a change of the same signal still delayed for the same watcher'''
+    t = self.now
+    for id in list(activity):
+      width = self.pulse_widths.get(id)
+      if width is None:
+        continue
+      for (then, w, previous, collected) in reversed(self.delayed):
+        if w is watcher and id in previous:
+          if t - then < width:
+            del previous[id]
+            del activity[id]
+            self.suppressed['glitch'] += 2
+          break
+    if activity:
+      self.delayed.append((t, watcher, activity, collected_changes))
+
+
+  def release(self, until=None):
+    '''Notify the delayed changes no pulse can end anymore: at least the longest pulse
+       width before the time until, or all of them'''
+    current = self.now
+    while self.delayed:
+      (t, watcher, activity, collected_changes) = self.delayed[0]
+      if until is not None and until - t < self.longest_pulse:
+        break
+      self.delayed.popleft()
+      # a pulse of the only signal changed at that time may have been dropped
+      if activity:
+        self.now = t
+        watcher.notify(activity, collected_changes)
+    self.now = current
+
+
+  def end_of_changes(self):
+    '''Called at the end of the value changes'''
+    if self.delayed:
+      self.release()
+
 
   def update_watched_changes(self):
     '''Watched changes is a persistent store of changes to the list of signals considered by all watchers. Here it is updated 
        after any watcher updates from update_time, to store the 'new' values'''
-    for id in self.watched_changes:
-      if id in self.changes:
-        self.watched_changes[id] = self.changes[id]
+    changes = self.changes
+    if changes:
+      for id in self.watched_changes:
+        if id in changes:
+          self.watched_changes[id] = changes[id]
 
   def parse(self, file_handle):
     '''Wrapper around the main extract routine - catch errors (mainly unknown XMRs or signals)'''
     self.extract(file_handle)
 
 
+  def tokens(self, fh):
+    '''Token generator, copies the lines to self.echo if set, or keeps self.offset
+       on the start of the current line when track_offset is set'''
+    if self.echo is not None:
+      return self.echoed_tokens(fh)
+    if not self.track_offset:
+      lines = iter(fh)
+      return chain(self.definitions_tokens(lines), (word for line in lines for word in line.split()))
+    return self.tracked_tokens(fh)
+
+
+  def definitions_tokens(self, lines):
+    '''The tokens of the lines up to the end of the definitions, split in bulk'''
+    header = []
+    for line in lines:
+      header.append(line)
+      if '$enddefinitions' in line:
+        break
+    return iter(''.join(header).split())
+
+
+  def echoed_tokens(self, fh):
+    # a line is copied when the next one is read, so that what the watchers write
+    # while its tokens are processed goes before it
+    previous = ''
+    for line in fh:
+      self.echo.write(previous)
+      previous = line
+      for word in line.split():
+        yield word
+    self.echo.write(previous)
+
+
+  def tracked_tokens(self, fh):
+    while True:
+      self.offset = fh.tell()
+      line = fh.readline()
+      if not line:
+        return
+      for word in line.split():
+        yield word
+
+
+  def resume(self, fh):
+    '''Jump to the resume point, called at the end of the definitions'''
+    (offset, now, watched_changes) = self.resume_point
+    fh.seek(offset)
+    self.offset = offset
+    self.then = self.now = now
+    self.watched_changes.update(watched_changes)
+
+
   def extract(self, fh):
     '''Tokenize and parse the VCD file'''
     # open the VCD file and create a token generator
-    tokeniser = (word for line in fh for word in line.split() if word)
+    self.header_started = time.time()
+    tokeniser = self.tokens(fh)
 
     for count, token in enumerate(tokeniser):
       # parse VCD until the end of definitions
       if not self.end_of_definitions:
         self.keyword_dispatch[token](tokeniser, token)
+        if self.end_of_definitions and self.resume_point is not None:
+          self.resume(fh)
       else:
         # Working through changes
         c, rest = token[0], token[1:]
@@ -192,7 +449,9 @@ class VcdParser(object):
           # skip $dump* tokens and $end tokens in sim section
           continue
         elif c == '#':
-          self.update_time(rest)
+          self.update_time(int(rest))
+          if self.stopped:
+            break
         elif c in '01xXzZ':
           self.scaler_value_change(value=c, id=rest)
         elif c in 'bBrR':
@@ -200,6 +459,8 @@ class VcdParser(object):
         else:
           raise "Don't understand: %s After %i words" % (token, count)
 
+    self.end_of_changes()
+
 
   def parse_error(self, tokeniser, keyword):
     raise "Don't understand keyword: " + keyword
@@ -215,29 +476,56 @@ class VcdParser(object):
 
 
   def vcd_enddefinitions(self, tokeniser, keyword):
-    self.end_of_definitions = True
     self.drop_declaration(tokeniser, keyword)
+    self.end_definitions()
+
+
+  def end_definitions(self):
+    '''All the signals are known, let the hooks and the watchers look them up'''
+    self.end_of_definitions = True
+    self.time_unit = timescale_unit(getattr(self, 'timescale', None))
+
+    for hook in self.definitions_hooks:
+      hook(self)
     
     for watcher in self.watchers:
       watcher.update_ids()
       for id in watcher.get_watching_ids():
         self.watched_changes[id] = 'x'
+
+    if self.drop_redundant:
+      ids = set()
+      for watcher in self.watchers:
+        ids.update(watcher.get_sensitive_ids())
+        ids.update(watcher.get_watching_ids())
+      self.redundant_ids = tuple(ids)
+    if self.min_pulse:
+      self.pulse_widths = dict((self.get_id(xmr), width) for xmr, width in self.min_pulse.items())
+      self.longest_pulse = max(self.pulse_widths.values())
+      self.delayed = deque()
+
+    if self.header_started is not None:
+      self.header_time = time.time() - self.header_started
     
 
   def vcd_scope(self, tokeniser, keyword):
-    self.scope.append( tuple(takewhile(lambda x: x != "$end", tokeniser)))
+    (scope_type, name) = (tokeniser.next(), tokeniser.next())
+    self.scope = self.scope.child(scope_type, name, self.inscope)
+    tokeniser.next()
     
     
   def vcd_upscope(self, tokeniser, keyword):
-    self.scope.pop()
+    self.scope = self.scope.parent
     tokeniser.next()
     
     
   def vcd_var(self, tokeniser, keyword):
-    data = tuple(takewhile(lambda x: x != "$end", tokeniser))
-    (var_type, size, identifier_code, reference) = data[:4] # ignore range on identifier ( TODO  Fix this )
-    reference = self.scope + [('var', reference)]
-    self.idcode2references[identifier_code].append( (var_type, size, reference))
+    (var_type, size, identifier_code, reference) = (tokeniser.next(), tokeniser.next(), tokeniser.next(),
+                                                    tokeniser.next())
+    # ignore range on identifier ( TODO  Fix this )
+    while tokeniser.next() != "$end":
+      pass
+    self.add_var(self.scope, var_type, size, identifier_code, reference)
     
     
   def vcd_dumpall(self, tokeniser, keyword): 
@@ -0,0 +1,87 @@
+'''
+   Input helpers for the VCD parser
+
+   open_capture transparently decompresses gzip and bzip2 captures.
+
+   ThreadedReader reads the lines of a file in a separate thread, so that the
+   parser does not wait on the storage.  The lines are passed in batches
+   through a bounded queue: the reader blocks when the parser is late, and
+   stops when it is closed.  Any error in the reader thread is raised again
+   in the thread iterating over the lines.
+
+'''
+
+import threading
+try:
+  import Queue as queue
+except ImportError:
+  import queue
+
+
+def open_capture(fh):
+  '''Wrap the file object fh to decompress it if its name is the one of a compressed file'''
+  name = getattr(fh, 'name', '')
+  # imported here, most captures are not compressed
+  if name.endswith('.gz'):
+    import gzip
+    return gzip.GzipFile(fileobj=fh)
+  if name.endswith('.bz2'):
+    import bz2
+    return bz2.BZ2File(name)
+  return fh
+
+
+class ThreadedReader(object):
+  '''Iterable over the lines of a file object, read by a separate thread'''
+
+  def __init__(self, fh, batch_size=1 << 18, depth=16):
+    self.fh = fh
+    self.batch_size = batch_size
+    self.queue = queue.Queue(depth)
+    self.stopped = threading.Event()
+    self.error = None
+    self.thread = threading.Thread(target=self.run, name='vcd-reader')
+    self.thread.daemon = True
+    self.thread.start()
+
+
+  def put(self, item):
+    '''Put in the queue, give up if the reader is closed'''
+    while not self.stopped.is_set():
+      try:
+        self.queue.put(item, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+
+  def run(self):
+    try:
+      while True:
+        # readlines returns complete lines for about batch_size bytes
+        lines = self.fh.readlines(self.batch_size)
+        if not lines:
+          break
+        if not self.put(lines):
+          return
+    except Exception as e:
+      self.error = e
+    self.put(None)
+
+
+  def __iter__(self):
+    while True:
+      lines = self.queue.get()
+      if lines is None:
+        if self.error is not None:
+          raise self.error
+        return
+      for line in lines:
+        yield line
+
+
+  def close(self):
+    '''Stop the reader thread, must be called if the lines are not all consumed'''
+    self.stopped.set()
+    self.thread.join()
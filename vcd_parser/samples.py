@@ -0,0 +1,149 @@
+'''
+  Fixed rate sample dumps of a logic analyzer
+
+  A logic analyzer samples its channels at a fixed rate.  Converting its dumps
+  to a VCD only to parse them again is slower than the decode, so they are
+  read directly, in one of two formats:
+
+    CSV         a first line naming the channels, then one line per sample
+                with a 0 or 1 per channel.  A column named Time... is ignored
+    packed      no header, (channels + 7) / 8 bytes per sample, bit i of the
+                sample (bit i % 8 of its byte i / 8) being the channel i.  The
+                names of the channels are given by the caller
+
+  The time of a sample is its number, in a timescale of one sample period.
+
+  A SampleCapture has the interface of a BinaryCapture used to decode it: its
+  signals are the XMRs of the channels in a scope, define declares them in a
+  VcdParser and edges extracts the values sampled at the rising edges of a
+  clock.  The edges are found a chunk of samples at a time with string
+  operations running in C: the clock levels of the chunk are gathered in a
+  string of '0' and '1' (an extended slice of the memory-mapped packed dump
+  translated, or a join of the CSV column) where the rising edges are the
+  matches of '01'.  Only the samples just before the edges are then looked at.
+
+'''
+
+import csv
+import mmap
+from itertools import islice
+
+from parser import time_units
+
+
+def sample_timescale(rate):
+  '''Timescale of the period of a sample rate in Hz, in the largest unit giving an integer'''
+  period = int(round(time_units['s'] / float(rate)))
+  if period < 1:
+    raise ValueError('Sample rate too high: %s Hz' % rate)
+  for unit in ('s', 'ms', 'us', 'ns', 'ps', 'fs'):
+    if period % time_units[unit] == 0:
+      return '%d %s' % (period // time_units[unit], unit)
+
+
+def open_samples(fh, rate, scope, channels=None):
+  '''SampleCapture of the dump in the file object fh, a CSV one if its name ends with .csv,
+  otherwise a packed one with the channels named by the list channels'''
+  if getattr(fh, 'name', '').lower().endswith('.csv'):
+    return CsvSamples(fh, rate, scope)
+  return PackedSamples(fh, rate, scope, channels)
+
+
+class SampleCapture(object):
+  '''Channels of a sample dump, seen as the scalar signals scope.name'''
+
+  def __init__(self, rate, scope, channels):
+    self.timescale = sample_timescale(rate)
+    self.date = None
+    self.channels = list(channels)
+    self.signals = [scope + '.' + name for name in self.channels]
+
+
+  def define(self, parser):
+    '''Declare the channels in the parser as a VCD header would, and end the definitions.
+    The channel i gets the VCD identifier str(i)'''
+    parser.timescale = self.timescale
+    for i, xmr in enumerate(self.signals):
+      parser.declare(xmr, 'wire', '1', str(i))
+    parser.end_definitions()
+
+
+  def edges(self, clock, signals):
+    '''Generate (time, values) at each rising edge of the clock channel, values being the
+    levels of the channels signals at the sample before the edge, as VCD characters.
+    clock and signals are indexes in self.signals'''
+    for (first, levels, sample) in self.chunks(clock):
+      # first is the number of the first sample of levels
+      k = levels.find('01')
+      while k >= 0:
+        yield first + k + 1, sample(first + k, signals)
+        k = levels.find('01', k + 1)
+
+
+class PackedSamples(SampleCapture):
+  '''Memory-mapped packed sample dump'''
+
+  def __init__(self, fh, rate, scope, channels, chunk_samples=1 << 20):
+    SampleCapture.__init__(self, rate, scope, channels)
+    self.width = (len(self.channels) + 7) // 8
+    self.chunk_samples = chunk_samples
+    self.data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(self.data) % self.width:
+      raise ValueError('The dump is not made of %d byte samples' % self.width)
+    self.samples = len(self.data) // self.width
+
+
+  def bit(self, channel):
+    '''Byte of a sample and mask of the channel'''
+    return (channel >> 3, 1 << (channel & 7))
+
+
+  def chunks(self, clock):
+    (byte, mask) = self.bit(clock)
+    table = ''.join('1' if b & mask else '0' for b in range(256))
+    # a chunk starts with the last sample of the previous one, for its edge
+    for first in range(0, max(self.samples - 1, 0), self.chunk_samples):
+      last = min(first + self.chunk_samples + 1, self.samples)
+      levels = self.data[first * self.width + byte:last * self.width:self.width].translate(table)
+      yield first, levels, self.sample
+
+
+  def sample(self, k, signals):
+    values = []
+    for s in signals:
+      (byte, mask) = self.bit(s)
+      values.append('1' if ord(self.data[k * self.width + byte]) & mask else '0')
+    return values
+
+
+  def close(self):
+    self.data.close()
+
+
+class CsvSamples(SampleCapture):
+  '''CSV sample dump'''
+
+  def __init__(self, fh, rate, scope, chunk_samples=1 << 16):
+    self.rows = csv.reader(fh, skipinitialspace=True)
+    header = [name.strip() for name in next(self.rows)]
+    # columns of the channels
+    self.columns = [c for c, name in enumerate(header) if not name.lower().startswith('time')]
+    SampleCapture.__init__(self, rate, scope, [header[c] for c in self.columns])
+    self.chunk_samples = chunk_samples
+
+
+  def chunks(self, clock):
+    column = self.columns[clock]
+    first = 0
+    # the last row of the previous chunk, for its edge
+    previous = []
+    while True:
+      rows = previous + list(islice(self.rows, self.chunk_samples))
+      if len(rows) < 2:
+        return
+      levels = ''.join([row[column] for row in rows])
+      if len(levels) != len(rows):
+        raise ValueError('The values of the channels must be 0 or 1, around sample %d' % first)
+      yield first, levels, lambda k, signals: [rows[k - first][self.columns[s]] for s in signals]
+      first += len(rows) - 1
+      previous = rows[-1:]
@@ -33,16 +33,22 @@ finished their transaction recording.c
 
 
 class VcdTracker(object):
-    '''A transaction tracker base class. Most of this will be very custom depending on the protocols'''
+    '''A transaction tracker base class. Most of this will be very custom depending on the protocols.
+    Subclasses should define __slots__ too, trackers can be created for every transaction'''
 
-    activity = None
-    values = None
-    trigger_count = 0
+    __slots__ = ('parser', 'watcher', 'finished', 'activity', 'values', 'trigger_count')
 
     def __init__(self, parser, watcher):
+        self.reset(parser, watcher)
+
+    def reset(self, parser, watcher):
+        '''Set the initial state, called again when a pooled tracker is reused'''
         self.parser = parser
         self.watcher = watcher
         self.finished = False
+        self.activity = None
+        self.values = None
+        self.trigger_count = 0
         self.start()
 
     def start(self):
@@ -29,15 +29,23 @@ When the watcher is updated, it checks to see if it should start a new tracker a
 then updates all the currently active trackers, until they indicate that they have 
 finished their transaction recording.c
 
+The active trackers are kept in a deque, oldest first.  A finished tracker is only
+marked as such: the finished trackers at the head are popped, and the deque is
+rebuilt without the others once they are half of it, so that the bookkeeping is
+O(1) per tracker.  A tracker still in the deque is there only behind an active
+one: the deque is empty when no tracker is active.
+
+The lists and the deque are made by __init__, or when the watcher is given its
+first signal or its parser for a subclass whose __init__ does not call it.
+
 '''
 
+from collections import deque
+
 
 class VcdWatcher(object):
 	'''Base class for watcher objects'''
 
-	sensitive = []
-	watching = []
-	trackers = []
 	default_hierarchy = None
 
 	_sensitive_ids = []
@@ -49,6 +57,23 @@ class VcdWatcher(object):
 	values = None
 	activity = None
 
+	# finished trackers kept for reuse by create_new_tracker, None when not pooled
+	free_trackers = None
+
+	# finished trackers still in self.trackers
+	finished_trackers = 0
+
+	def __init__(self):
+		self.sensitive = []
+		self.watching = []
+		self.trackers = deque()
+
+	def init_lists(self):
+		'''Make the lists the __init__ of a subclass did not'''
+		for name, make in (('sensitive', list), ('watching', list), ('trackers', deque)):
+			if name not in self.__dict__:
+				setattr(self, name, make())
+
 	def notify(self, activity, values):
 		'''Manage internal data updates prior to calling the expected to be overridden update method'''
 		self.values = values
@@ -66,11 +91,35 @@ class VcdWatcher(object):
 			self.trackers.append(self.create_new_tracker())
 
 		for tracker in self.trackers:
+			if tracker.finished:
+				continue
 			tracker.notify(self.activity, self.values)
-
-		for tracker in self.trackers:
 			if tracker.finished:
-				self.trackers.remove(tracker)
+				self.finished_trackers += 1
+
+		if self.finished_trackers:
+			self.remove_trackers()
+
+
+	def remove_trackers(self):
+		'''Drop the finished trackers at the head of the deque, and all of them once
+		they are half of it, keeping the order of the others.  They are put in the
+		free list when the trackers are pooled'''
+		trackers = self.trackers
+		while trackers and trackers[0].finished:
+			self.release_tracker(trackers.popleft())
+			self.finished_trackers -= 1
+		if 2 * self.finished_trackers > len(trackers):
+			for tracker in trackers:
+				if tracker.finished:
+					self.release_tracker(tracker)
+			self.trackers = deque(tracker for tracker in trackers if not tracker.finished)
+			self.finished_trackers = 0
+
+
+	def release_tracker(self, tracker):
+		if self.free_trackers is not None:
+			self.free_trackers.append(tracker)
 
 
 	def start_tracker(self):
@@ -79,7 +128,12 @@ class VcdWatcher(object):
 
 
 	def create_new_tracker(self):
-		'''Build an instance of the pre-defined transaction tracker objects'''
+		'''Build an instance of the pre-defined transaction tracker objects,
+		or reuse a finished one when the trackers are pooled'''
+		if self.free_trackers:
+			tracker = self.free_trackers.pop()
+			tracker.reset(self.parser, self)
+			return tracker
 		return self.tracker(self.parser, self)
 
 
@@ -98,6 +152,7 @@ class VcdWatcher(object):
 		'''Add a signal to the sensitivity and watch lists'''
 		if not hierarchy:
 			hierarchy = self.default_hierarchy
+		self.init_lists()
     
 		self.sensitive.append(hierarchy + '.' + signal)
 		self.watching.append(hierarchy + '.' + signal)
@@ -107,10 +162,12 @@ class VcdWatcher(object):
 		'''Register a signal to be watched'''
 		if not hierarchy:
 			hierarchy = self.default_hierarchy
+		self.init_lists()
 		self.watching.append(hierarchy + '.' + signal)
 
 
 	def add_parser(self, parser):
+		self.init_lists()
 		self.parser = parser
 
 
@@ -159,8 +216,11 @@ class VcdWatcher(object):
 			return eval(value)
 
 
-	def set_tracker(self, tracker):
-		'''Set the class type of a tracker object, used for the tracker creation'''
+	def set_tracker(self, tracker, pooled=False):
+		'''Set the class type of a tracker object, used for the tracker creation.
+		Pooled trackers are reused once finished, their reset method must then
+		set their whole state'''
 		self.tracker = tracker
+		self.free_trackers = [] if pooled else None
 
 